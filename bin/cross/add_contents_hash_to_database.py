@@ -1,7 +1,8 @@
 #!/usr/bin/env python2.7
 
 # ----------------------------------------------------------------------------
-#  One-off script to help add contents_hash fields to all logs
+#  One-off script to help add contents_hash fields to all logs, or to move
+#  them from one contents_hash format to another.
 # ----------------------------------------------------------------------------
 
 import os
@@ -9,12 +10,18 @@ import sys
 import database
 import datetime
 import pdb
-import base64
-import hashlib
+import argparse
+
+import pymongo
+import contents_hash
+import tracing
 
 # ----------------------------------------------------------------------------
 #   Constants.
 # ----------------------------------------------------------------------------
+BSON_STRING = 2
+BSON_INT32 = 16
+BSON_INT64 = 18
 one_week = datetime.timedelta(days=7)
 two_weeks = datetime.timedelta(days=14)
 one_minute = datetime.timedelta(minutes=1)
@@ -42,31 +49,84 @@ fh.setFormatter(formatter)
 logger.addHandler(fh)
 # -----------------------------------------------------------------------------
 
+def get_args():
+    parser = argparse.ArgumentParser("Add contents_hash fields to logs, or convert them to another format.")
+    parser.add_argument("--format",
+                        dest="contents_hash_format",
+                        choices=contents_hash.CONTENTS_HASH_FORMATS,
+                        default=contents_hash.MD5,
+                        help="contents_hash format to convert logs to. Logs without a contents_hash or with one in another format are updated. Default is md5.")
+    parser.add_argument("--policy",
+                        dest="contents_hash_policy",
+                        choices=contents_hash.CONTENTS_HASH_POLICIES,
+                        default=contents_hash.CONTENTS,
+                        help="What goes into each contents_hash. Default is just the contents.")
+    parser.add_argument("--collection",
+                        dest="collection_names",
+                        metavar="NAME",
+                        action="append",
+                        default=None,
+                        help="Only update this collection. May be given more than once. Default is every collection.")
+    args = parser.parse_args()
+    return args
+
+def get_query(contents_hash_format):
+    """ Logs that have contents but whose contents_hash is missing or in
+    another format."""
+    if contents_hash_format == contents_hash.MD5:
+        other_types = [BSON_INT32, BSON_INT64]
+    else:
+        other_types = [BSON_STRING]
+    return {"contents": {"$exists": True},
+            "$or": [{"contents_hash": {"$exists": False}}] + \
+                   [{"contents_hash": {"$type": other_type}} for other_type in other_types]}
+
+def get_contents_hash_index_size(write_database, collection_name):
+    index_sizes = write_database.command("collstats", collection_name).get("indexSizes", {})
+    return index_sizes.get("contents_hash_1", 0)
+
 def main():
-    """ Add contents hashes to logs database.
+    """ Add contents hashes to logs database, or convert them to another
+    format.
     """
-    logger = logging.getLogger("%s.main" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "main")
     logger.debug("entry.")
+    args = get_args()
+    contents_hasher = contents_hash.ContentsHasher(contents_hash.get_contents_hash_format(args.contents_hash_format, logger),
+                                                   args.contents_hash_policy)
+    logger.debug("contents_hasher: %s" % (contents_hasher, ))
 
     top_db = database.Database(database_name = "logs")
     write_database = top_db.write_database
-    collection_names = sorted(write_database.collection_names())
+    if args.collection_names:
+        collection_names = sorted(args.collection_names)
+    else:
+        collection_names = sorted(write_database.collection_names())
     if "system.indexes" in collection_names:
         collection_names.remove("system.indexes")
-    datetime_query_string = "datetime"
+    query = get_query(contents_hasher.contents_hash_format)
     cnt = 0
+    duplicates = 0
     for collection_name in collection_names:
         logger.debug("collection_name: %s" % (collection_name, ))
         collection = write_database[collection_name]
-        cursor = collection.find({"contents": {"$exists": True}, "contents_hash": {"$exists": False}})
+        index_size_before = get_contents_hash_index_size(write_database, collection_name)
+        cursor = collection.find(query, ["contents", "datetime"])
         logger.debug("number of rows to update: %s" % (cursor.count(), ))
         for row in cursor:
-            contents = row["contents"]
-            contents_hash = base64.b64encode(hashlib.md5(contents).digest())
-            collection.update(row, {"$set": {"contents_hash": contents_hash}})
+            contents_hash_value = contents_hasher(row["contents"], row.get("datetime"))
+            try:
+                collection.update({"_id": row["_id"]}, {"$set": {"contents_hash": contents_hash_value}}, safe=True)
+            except pymongo.errors.DuplicateKeyError:
+                # Under the new format this log is the same as one
+                # that's already been converted.
+                duplicates += 1
             cnt += 1
             if cnt % 10000 == 0:
-                logger.debug("cnt: %s" % (cnt, ))
+                logger.debug("cnt: %s, duplicates: %s" % (cnt, duplicates))
+        index_size_after = get_contents_hash_index_size(write_database, collection_name)
+        logger.info("%s: contents_hash index size %s bytes before, %s bytes after" % (collection_name, index_size_before, index_size_after))
+    logger.info("updated %s rows, %s duplicates" % (cnt, duplicates))
 
 if __name__ == "__main__":
     main()
@@ -3,22 +3,52 @@
 # ----------------------------------------------------------------------------
 #   Age the MongoDB collections. Removing a document is a database-level
 #   blocking operation, and is very expensive. Hence do not execute a single
-#   query to delete all matching documents. We delete in blocks of documents.
+#   query to delete all matching documents. We delete in chunks of documents.
 #
 #   See:
 #     http://groups.google.com/group/mongodb-user/browse_thread/thread/5d5dd12e37382b5b?pli=1
+#
+#   Day-partitioned collections, see partitions, are aged by dropping the
+#   partitions of days that are wholly out of range, which costs next to
+#   nothing and doesn't block readers. Only unpartitioned collections are
+#   deleted from a chunk at a time.
+#
+#   A chunk is a range of the indexed datetime, oldest first, removed with
+#   one query rather than first reading the _id of every document in it.
+#   Its span adapts to how the database is coping: halved when a remove
+#   takes longer than --target_latency or a secondary is more than
+#   --max_lag behind the primary, when we also wait for it to catch up,
+#   and doubled when a remove is quick.
+#
+#   Collections are aged in parallel by --workers threads. Each is given
+#   maximum_time_per_collection, and everything stops after --max_seconds,
+#   before the cron job's timeout kills us. Progress, how far each
+#   collection is deleted through and the chunk span it settled on, is
+#   saved to --progress_file, so the next run resumes where this one
+#   stopped and starts with the collections it didn't finish.
+#
+#   We report documents deleted per second and the latency of reading the
+#   newest log datum from a secondary, as the web application does, before
+#   and while aging.
 # ----------------------------------------------------------------------------
 
 import os
 import sys
 import database
 import datetime
-import pdb
 import time
-import multiprocessing
+import json
 import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import multiprocessing.pool
 import psutil
 import pymongo
+import tracing
+import partitions
+from metrics import LatencyHistogram
 
 # ----------------------------------------------------------------------------
 #   Constants.
@@ -30,10 +60,29 @@ one_week = datetime.timedelta(days=7)
 ten_days = datetime.timedelta(days=10)
 two_weeks = datetime.timedelta(days=14)
 one_minute = datetime.timedelta(minutes=1)
-remove_block_size = 150
 maximum_time_per_collection = 10 * 60 # 10 minutes
 LOG_FILENAME = r"/var/log/rill/age_database.log"
 INTERVAL_SIZE = four_days
+DATABASE_NAMES = ["logs", "pings", "mv_trees"]
+
+# Kill main() if it's still running after this long.
+TIMEOUT_SECONDS = 60 * 60 # 60 minutes
+DEFAULT_MAX_SECONDS = 55 * 60 # 55 minutes
+DEFAULT_WORKERS = 4
+DEFAULT_TARGET_LATENCY = 1.0
+DEFAULT_MAX_LAG = 10.0
+DEFAULT_PROGRESS_FILEPATH = os.path.join(tempfile.gettempdir(), "rill_age_database.json")
+
+DEFAULT_CHUNK_SPAN = datetime.timedelta(minutes=10)
+MINIMUM_CHUNK_SPAN = datetime.timedelta(seconds=1)
+MAXIMUM_CHUNK_SPAN = one_day
+
+PROGRESS_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+PROGRESS_SAVE_INTERVAL = 10
+LAG_REFRESH_SECONDS = 5
+LAG_WAIT_SECONDS = 5
+READ_PROBE_INTERVAL = 1
+READ_BASELINE_SECONDS = 10
 # ----------------------------------------------------------------------------
 
 # -----------------------------------------------------------------------------
@@ -57,7 +106,369 @@ fh.setFormatter(formatter)
 logger.addHandler(fh)
 # -----------------------------------------------------------------------------
 
-def main():
+def get_args():
+    parser = argparse.ArgumentParser("Delete old database logs.")
+    parser.add_argument("--workers",
+                        dest="workers",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_WORKERS,
+                        help="Number of collections to age at once.")
+    parser.add_argument("--target_latency",
+                        dest="target_latency",
+                        metavar="SECONDS",
+                        type=float,
+                        default=DEFAULT_TARGET_LATENCY,
+                        help="Shrink chunks when removing one takes longer than this, grow them when it takes under half.")
+    parser.add_argument("--max_lag",
+                        dest="max_lag",
+                        metavar="SECONDS",
+                        type=float,
+                        default=DEFAULT_MAX_LAG,
+                        help="Shrink chunks and wait when a secondary is further than this behind the primary.")
+    parser.add_argument("--max_seconds",
+                        dest="max_seconds",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_MAX_SECONDS,
+                        help="Stop, saving progress, after this long.")
+    parser.add_argument("--progress_file",
+                        dest="progress_filepath",
+                        metavar="PATH",
+                        default=DEFAULT_PROGRESS_FILEPATH,
+                        help="Where to save and resume progress from.")
+    return parser.parse_args()
+
+def get_datetime_field(database_name):
+    if database_name == "mv_trees":
+        return "query_datetime"
+    return "datetime"
+
+def get_next_chunk_span(chunk_span, latency, lag, target_latency, max_lag):
+    """ Span of the next chunk, given how long removing the last one took
+    and how far behind the primary the furthest secondary is, None if we
+    don't know."""
+    if latency > target_latency or (lag is not None and lag > max_lag):
+        chunk_span = chunk_span / 2
+    elif latency < target_latency / 2.0:
+        chunk_span = chunk_span * 2
+    return max(MINIMUM_CHUNK_SPAN, min(MAXIMUM_CHUNK_SPAN, chunk_span))
+
+class Progress(object):
+    """ Per collection, keyed by "database.collection", how far it's been
+    deleted through, the chunk span it settled on, and the epoch seconds it
+    was last finished. Shared by the workers, and saved to filepath at most
+    every PROGRESS_SAVE_INTERVAL seconds until save() is called."""
+
+    def __init__(self, filepath, collections=None):
+        self.filepath = filepath
+        if collections is None:
+            collections = {}
+        self.collections = collections
+        self.lock = threading.Lock()
+        self.last_save_time = time.time()
+
+    @classmethod
+    def load(cls, filepath, logger=logger):
+        if not os.path.isfile(filepath):
+            return cls(filepath)
+        try:
+            with open(filepath) as f:
+                collections = json.load(f)
+        except ValueError:
+            logger.exception("%s: unreadable, starting afresh." % (filepath, ))
+            collections = {}
+        return cls(filepath, collections)
+
+    def get_deleted_through(self, key):
+        with self.lock:
+            value = self.collections.get(key, {}).get("deleted_through")
+        if value is None:
+            return None
+        return datetime.datetime.strptime(value, PROGRESS_DATETIME_FORMAT)
+
+    def get_chunk_span(self, key):
+        with self.lock:
+            value = self.collections.get(key, {}).get("chunk_seconds")
+        if value is None:
+            return DEFAULT_CHUNK_SPAN
+        return datetime.timedelta(seconds=value)
+
+    def get_finished_time(self, key):
+        with self.lock:
+            return self.collections.get(key, {}).get("finished_time", 0)
+
+    def update(self, key, deleted_through=None, chunk_span=None, is_finished=False):
+        with self.lock:
+            state = self.collections.setdefault(key, {})
+            if deleted_through is not None:
+                state["deleted_through"] = deleted_through.strftime(PROGRESS_DATETIME_FORMAT)
+            if chunk_span is not None:
+                state["chunk_seconds"] = chunk_span.days * 86400 + chunk_span.seconds + chunk_span.microseconds / 1e6
+            if is_finished:
+                state["finished_time"] = time.time()
+        if time.time() - self.last_save_time >= PROGRESS_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """ Write to filepath, replacing it atomically."""
+        with self.lock:
+            temporary_filepath = self.filepath + ".tmp"
+            with open(temporary_filepath, "w") as f:
+                json.dump(self.collections, f, indent=4, sort_keys=True)
+            if os.name == "nt" and os.path.isfile(self.filepath):
+                os.remove(self.filepath)
+            os.rename(temporary_filepath, self.filepath)
+            self.last_save_time = time.time()
+
+class ReplicationLag(object):
+    """ Seconds the furthest secondary is behind the primary, from
+    replSetGetStatus at most every LAG_REFRESH_SECONDS, or None if we can't
+    tell, e.g. we're not connected to a replica set."""
+
+    def __init__(self, connection, logger=logger):
+        self.connection = connection
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.lag = None
+        self.last_refresh_time = None
+
+    def get_lag(self):
+        with self.lock:
+            time_now = time.time()
+            if self.last_refresh_time is None or (time_now - self.last_refresh_time) >= LAG_REFRESH_SECONDS:
+                self.lag = self.get_current_lag()
+                self.last_refresh_time = time_now
+            return self.lag
+
+    def get_current_lag(self):
+        try:
+            status = self.connection.admin.command("replSetGetStatus")
+        except pymongo.errors.PyMongoError:
+            self.logger.debug("can't get replica set status.")
+            return None
+        primary_optimes = [member["optimeDate"] for member in status.get("members", []) if member.get("stateStr") == "PRIMARY"]
+        secondary_optimes = [member["optimeDate"] for member in status.get("members", []) if member.get("stateStr") == "SECONDARY"]
+        if len(primary_optimes) == 0 or len(secondary_optimes) == 0:
+            return None
+        lag = primary_optimes[0] - min(secondary_optimes)
+        return max(0, lag.days * 86400 + lag.seconds + lag.microseconds / 1e6)
+
+    def wait(self, max_lag, deadline):
+        """ Wait until the lag is at most max_lag, or it's deadline. Returns
+        the last lag."""
+        lag = self.get_lag()
+        while lag is not None and lag > max_lag and time.time() < deadline:
+            self.logger.debug("replication lag %.1fs, waiting." % (lag, ))
+            time.sleep(LAG_WAIT_SECONDS)
+            lag = self.get_lag()
+        return lag
+
+class ReadLatencyProbe(object):
+    """ Reads the newest log datum of a random collection from a secondary,
+    as the web application does, every READ_PROBE_INTERVAL seconds, into a
+    LatencyHistogram: baseline when measured before aging, during while a
+    background thread runs."""
+
+    def __init__(self, read_database, collection_names, datetime_field, logger=logger):
+        self.read_database = read_database
+        self.collection_names = collection_names
+        self.datetime_field = datetime_field
+        self.logger = logger
+        self.baseline = LatencyHistogram()
+        self.during = LatencyHistogram()
+        self.is_stopped = threading.Event()
+        self.thread = None
+
+    def probe(self, histogram):
+        collection = self.read_database[random.choice(self.collection_names)]
+        start_time = time.time()
+        try:
+            list(collection.find({}, {self.datetime_field: 1}).sort(self.datetime_field, pymongo.DESCENDING).limit(1))
+        except pymongo.errors.PyMongoError:
+            self.logger.debug("read probe failed.")
+            return
+        histogram.add(time.time() - start_time)
+
+    def measure_baseline(self, seconds):
+        if len(self.collection_names) == 0:
+            return
+        end_time = time.time() + seconds
+        while time.time() < end_time:
+            self.probe(self.baseline)
+            time.sleep(READ_PROBE_INTERVAL)
+
+    def run(self):
+        while not self.is_stopped.is_set():
+            self.probe(self.during)
+            self.is_stopped.wait(READ_PROBE_INTERVAL)
+
+    def start(self):
+        if len(self.collection_names) == 0:
+            return
+        self.thread = threading.Thread(target=self.run, name="ReadLatencyProbe")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.is_stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def get_oldest_datetime(collection, datetime_field, spec):
+    rows = list(collection.find(spec, {datetime_field: 1}).sort(datetime_field, pymongo.ASCENDING).limit(1))
+    if len(rows) == 0:
+        return None
+    return rows[0][datetime_field]
+
+class CollectionAger(object):
+    """ Removes a collection's documents with a datetime before oldest_date
+    or after newest_date, a chunk at a time. See the top of this module."""
+
+    def __init__(self, write_database, collection_name, datetime_field, progress, replication_lag, args, deadline):
+        self.collection = write_database[collection_name]
+        self.datetime_field = datetime_field
+        self.key = "%s.%s" % (write_database.name, collection_name)
+        self.progress = progress
+        self.replication_lag = replication_lag
+        self.args = args
+        self.deadline = deadline
+        self.logger = tracing.get_logger(APP_NAME, "CollectionAger", self.key)
+        self.chunk_span = progress.get_chunk_span(self.key)
+        self.delete_latency = LatencyHistogram()
+        self.number_deleted = 0
+
+    def remove_chunk(self, spec):
+        start_time = time.time()
+        remove_rc = self.collection.remove(spec, safe = True, w = "majority")
+        latency = time.time() - start_time
+        self.delete_latency.add(latency)
+        number_removed = remove_rc.get("n", 0)
+        self.number_deleted += number_removed
+        lag = self.replication_lag.get_lag()
+        self.chunk_span = get_next_chunk_span(self.chunk_span, latency, lag, self.args.target_latency, self.args.max_lag)
+        self.logger.debug("removed %s in %.2fs, lag %s, next chunk span %s" % (number_removed, latency, lag, self.chunk_span))
+        if lag is not None and lag > self.args.max_lag:
+            self.replication_lag.wait(self.args.max_lag, self.deadline)
+        return number_removed
+
+    def is_out_of_time(self, start_time):
+        time_now = time.time()
+        return (time_now - start_time) > maximum_time_per_collection or time_now >= self.deadline
+
+    def age_older_than(self, oldest_date, start_time):
+        """ Returns True if every document older than oldest_date is removed.
+        Each chunk removes everything older than its end, so a document
+        inserted behind where we've deleted through is removed too."""
+        field = self.datetime_field
+        deleted_through = self.progress.get_deleted_through(self.key)
+        if deleted_through is not None and deleted_through < oldest_date:
+            chunk_end = min(deleted_through + self.chunk_span, oldest_date)
+        else:
+            chunk_end = None
+        while not self.is_out_of_time(start_time):
+            if chunk_end is None:
+                oldest_datetime = get_oldest_datetime(self.collection, field, {field: {"$lt": oldest_date}})
+                if oldest_datetime is None:
+                    self.progress.update(self.key, oldest_date, self.chunk_span)
+                    return True
+                chunk_end = min(oldest_datetime + self.chunk_span, oldest_date)
+            number_removed = self.remove_chunk({field: {"$lt": chunk_end}})
+            self.progress.update(self.key, chunk_end, self.chunk_span)
+            if chunk_end >= oldest_date:
+                return True
+            if number_removed == 0:
+                # Skip ahead to the oldest document left.
+                chunk_end = None
+            else:
+                chunk_end = min(chunk_end + self.chunk_span, oldest_date)
+        return False
+
+    def age_newer_than(self, newest_date, start_time):
+        """ Returns True if every document newer than newest_date, i.e. with
+        a bad datetime, is removed."""
+        field = self.datetime_field
+        while not self.is_out_of_time(start_time):
+            oldest_datetime = get_oldest_datetime(self.collection, field, {field: {"$gt": newest_date}})
+            if oldest_datetime is None:
+                return True
+            self.remove_chunk({field: {"$gt": newest_date, "$lt": oldest_datetime + self.chunk_span}})
+        return False
+
+    def age(self, oldest_date, newest_date):
+        """ Returns a three-element tuple (elem1, elem2, elem3).
+        -   elem1: number of documents deleted.
+        -   elem2: seconds taken.
+        -   elem3: True if the collection is finished."""
+        start_time = time.time()
+        is_finished = self.age_older_than(oldest_date, start_time) and \
+                      self.age_newer_than(newest_date, start_time)
+        self.progress.update(self.key, chunk_span=self.chunk_span, is_finished=is_finished)
+        seconds = time.time() - start_time
+        self.logger.info("deleted %s documents in %.1fs, %.0f documents/s, %s. remove latency (s): %s" % \
+                         (self.number_deleted,
+                          seconds,
+                          self.number_deleted / max(seconds, 0.001),
+                          "finished" if is_finished else "out of time",
+                          self.delete_latency))
+        return (self.number_deleted, seconds, is_finished)
+
+def age_database(database_name, progress, args, deadline):
+    """ Returns the number of documents deleted."""
+    logger = tracing.get_logger(APP_NAME, "age_database", database_name)
+    top_db = database.Database(database_name = database_name, logger = logger)
+    write_database = top_db.write_database
+    collection_names = [collection_name for collection_name in write_database.collection_names()
+                        if not collection_name.startswith("system.")]
+    datetime_field = get_datetime_field(database_name)
+
+    oldest_date = datetime.datetime.utcnow() - INTERVAL_SIZE
+    newest_date = datetime.datetime.utcnow() + one_day
+    for collection_name in partitions.get_expired_collection_names(collection_names, oldest_date, newest_date):
+        logger.info("dropping expired partition: %s" % (collection_name, ))
+        write_database.drop_collection(collection_name)
+    collection_names = [collection_name for collection_name in collection_names
+                        if partitions.split_partition_name(collection_name)[1] is None]
+    if len(collection_names) == 0:
+        return 0
+
+    # Collections we didn't finish last time, or finished longest ago, first.
+    random.shuffle(collection_names)
+    collection_names.sort(key=lambda collection_name: progress.get_finished_time("%s.%s" % (database_name, collection_name)))
+
+    read_latency_probe = ReadLatencyProbe(top_db.read_database, collection_names, datetime_field)
+    read_latency_probe.measure_baseline(READ_BASELINE_SECONDS)
+    read_latency_probe.start()
+    replication_lag = ReplicationLag(top_db.connection, logger)
+
+    def age_collection(collection_name):
+        try:
+            ager = CollectionAger(write_database, collection_name, datetime_field, progress, replication_lag, args, deadline)
+            return ager.age(oldest_date, newest_date)
+        except:
+            logger.exception("unhandled exception aging %s" % (collection_name, ))
+            return (0, 0, False)
+
+    start_time = time.time()
+    pool = multiprocessing.pool.ThreadPool(args.workers)
+    try:
+        results = pool.map(age_collection, collection_names)
+    finally:
+        pool.close()
+        pool.join()
+        read_latency_probe.stop()
+        progress.save()
+    seconds = time.time() - start_time
+
+    number_deleted = sum(result[0] for result in results)
+    number_finished = sum(1 for result in results if result[2])
+    logger.info("deleted %s documents from %s collections, %s finished, in %.1fs, %.0f documents/s." % \
+                (number_deleted, len(collection_names), number_finished, seconds, number_deleted / max(seconds, 0.001)))
+    logger.info("read latency (s) before aging: %s. while aging: %s" % \
+                (read_latency_probe.baseline, read_latency_probe.during))
+    return number_deleted
+
+def main(args):
     """ Delete old database logs.
 
     Removing documents blocks readers so only delete documents in chunks.
@@ -65,70 +476,35 @@ def main():
     to newest because this operation may take a very long time and we
     don't want the user experience of reading to be too odd.
     """
-    logger = logging.getLogger("%s.main" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "main")
     logger.debug("entry.")
 
-    database_names = ["logs", "pings", "mv_trees"]
-    for database_name in database_names:
+    start_time = time.time()
+    deadline = start_time + args.max_seconds
+    progress = Progress.load(args.progress_filepath)
+    number_deleted = 0
+    for database_name in DATABASE_NAMES:
         logger.debug("database_name: %s" % (database_name, ))
-        top_db = database.Database(database_name = database_name, logger = logger)
-        write_database = top_db.write_database
-        collection_names = write_database.collection_names()
-        random.shuffle(collection_names)
-        if "system.indexes" in collection_names:
-            collection_names.remove("system.indexes")
-        if database_name == "mv_trees":
-            datetime_query_string = "query_datetime"
-        else:
-            datetime_query_string = "datetime"
-        for collection_name in collection_names:
-            logger.debug("collection_name: %s" % (collection_name, ))
-            logger = logging.getLogger("%s.main.%s" % (APP_NAME, collection_name, ))
-            start_time = time.time()
-            oldest_date = datetime.datetime.utcnow() - INTERVAL_SIZE
-            newest_date = datetime.datetime.utcnow() + one_day
-
-            collection = write_database[collection_name]
-            cursor = collection.find({"$or": [{datetime_query_string: {'$lt': oldest_date}},
-                                              {datetime_query_string: {'$gt': newest_date}}]},
-                                     {'_id': 1}).sort(datetime_query_string, 1) #.limit(remove_block_size)
-            logger.debug("total number of documents: %s. documents to delete remaining: %s" % (collection.count(), cursor.count()))
-            count = cursor.count(with_limit_and_skip = True)
-            collection_cnt = 0
-            while (time.time() - start_time) <= maximum_time_per_collection:
-                logger.debug("collection_cnt: %s" % collection_cnt)
-                is_collection_finished = False
-                ids = []
-                try:
-                    cnt = 0
-                    while cnt < remove_block_size:
-                        ids.append(cursor.next()['_id'])
-                        cnt += 1
-                except StopIteration:
-                    logger.debug("no more rows left.")
-                    is_collection_finished = True
-                remove_rc = collection.remove({'_id': {'$in': ids}},
-                                              safe = True,
-                                              w = "majority")
-                logger.debug("remove_rc: %s" % (remove_rc, ))
-                if is_collection_finished:
-                    logger.debug("collection is finished.")
-                    break
-                collection_cnt += 1
+        if time.time() >= deadline:
+            logger.info("out of time before database %s." % (database_name, ))
+            break
+        number_deleted += age_database(database_name, progress, args, deadline)
+    seconds = time.time() - start_time
+    logger.info("deleted %s documents in %.1fs, %.0f documents/s." % \
+                (number_deleted, seconds, number_deleted / max(seconds, 0.001)))
 
 if __name__ == "__main__":
     try:
-        p = multiprocessing.Process(target = main)
+        args = get_args()
+        p = multiprocessing.Process(target = main, args = (args, ))
         time_start = time.time()
         p.daemon = True
         p.start()
         psutil.Process(p.pid).nice = 19
-        timeout = 60 * 60 # 60 minutes
-        while p.is_alive() and ((time.time() - time_start) <= timeout):
+        while p.is_alive() and ((time.time() - time_start) <= TIMEOUT_SECONDS):
             time.sleep(1)
         if p.is_alive():
             logger.error("command is still running, taking too long.")
         p.terminate()
     except:
         logger.exception("Unhandled exception.")
-
@@ -9,12 +9,21 @@
 import os
 import sys
 import zmq
-import pprint
 import datetime
 import re
 import json
 import platform
 import argparse
+import time
+import collections
+import multiprocessing
+
+from line_assembler import LineAssembler
+from metrics import BatchStatistics
+import wire_format
+import contents_hash
+import tracing
+import flow_control
 
 from whoosh.analysis import FancyAnalyzer
 from whoosh.analysis import StemmingAnalyzer
@@ -40,6 +49,10 @@ signal.signal(signal.SIGTERM, hard_handler)
 import logging
 global APP_NAME
 APP_NAME = "base_parser"
+trace = tracing.get_tracer(APP_NAME)
+
+DEFAULT_IDLE_FLUSH_SECONDS = 5.0
+DEFAULT_PARSE_CHUNK_LINES = 1000
 
 def get_args():
     parser = argparse.ArgumentParser("Parse incoming ZeroMQ stream of logs, output in another ZeroMQ stream.")
@@ -63,9 +76,94 @@ def get_args():
                         action='store_true',
                         default=False,
                         help="Enable verbose debug mode.")
+    parser.add_argument("--batch_max_messages",
+                        dest="batch_max_messages",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1,
+                        help="After each wakeup drain up to this many pending ssh_tap messages and parse them as one batch. Default is 1, i.e. no batching.")
+    parser.add_argument("--batch_max_bytes",
+                        dest="batch_max_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1024 * 1024,
+                        help="Stop draining a batch once it holds at least this many bytes.")
+    parser.add_argument("--stats_interval",
+                        dest="stats_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=60,
+                        help="Log batch size and latency statistics this often.")
+    parser.add_argument("--idle_flush_seconds",
+                        dest="idle_flush_seconds",
+                        metavar="SECONDS",
+                        type=float,
+                        default=DEFAULT_IDLE_FLUSH_SECONDS,
+                        help="Publish a log datum that's still waiting for the line that finishes it once no lines have arrived for this long. Any later lines of it will be parsed on their own. 0 disables. Default is %s." % (DEFAULT_IDLE_FLUSH_SECONDS, ))
+    parser.add_argument("--processes",
+                        dest="processes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1,
+                        help="Number of processes to parse in. More than 1 cuts the stream into chunks at log datum boundaries and parses them in a pool of processes, publishing the results in order. Default is 1, i.e. parse in this process.")
+    parser.add_argument("--parse_chunk_lines",
+                        dest="parse_chunk_lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_PARSE_CHUNK_LINES,
+                        help="With more than 1 process, the most lines to send to a process at a time, unless a log datum is longer. Default is %s." % (DEFAULT_PARSE_CHUNK_LINES, ))
+    parser.add_argument("--wire_format",
+                        dest="wire_format",
+                        choices=wire_format.WIRE_FORMATS,
+                        default=wire_format.JSON,
+                        help="How to encode the log data we PUBLISH. Subscribers detect the format of each message. Default is json.")
+    parser.add_argument("--contents_hash_format",
+                        dest="contents_hash_format",
+                        choices=contents_hash.CONTENTS_HASH_FORMATS,
+                        default=contents_hash.MD5,
+                        help="Format of each log's contents_hash. Default is md5.")
+    parser.add_argument("--contents_hash_policy",
+                        dest="contents_hash_policy",
+                        choices=contents_hash.CONTENTS_HASH_POLICIES,
+                        default=contents_hash.CONTENTS,
+                        help="What goes into each log's contents_hash. Default is just the contents.")
+    add_flow_control_arguments(parser)
     args = parser.parse_args()
     return args
 
+def add_flow_control_arguments(parser):
+    """ Arguments for holding log data the writer hasn't granted credits
+    for, shared with parser_farm."""
+    parser.add_argument("--spill_directory",
+                        dest="spill_directory",
+                        metavar="DIRECTORY",
+                        default=flow_control.DEFAULT_SPILL_DIRECTORY,
+                        help="Where to spill log data the writer has no room for once --max_queued_records are held in memory. Default is %s." % (flow_control.DEFAULT_SPILL_DIRECTORY, ))
+    parser.add_argument("--max_queued_records",
+                        dest="max_queued_records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=flow_control.DEFAULT_MAX_QUEUED_RECORDS,
+                        help="Most log data to hold in memory for the writer before spilling. Default is %s." % (flow_control.DEFAULT_MAX_QUEUED_RECORDS, ))
+    parser.add_argument("--max_spill_bytes",
+                        dest="max_spill_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=flow_control.DEFAULT_MAX_SPILL_BYTES,
+                        help="Most bytes to spill for each stream. Log data past this is dropped, and counted. Default is %s." % (flow_control.DEFAULT_MAX_SPILL_BYTES, ))
+
+def get_credited_publisher(context, publish_socket, parser_zeromq_binding, box_name, args, flow_counters, logger):
+    """ Wrap a stream's PUB socket so that it only publishes what the writer
+    grants credits for."""
+    credit_socket = flow_control.get_credit_pull_socket(context, parser_zeromq_binding)
+    return flow_control.CreditedPublisher(publish_socket,
+                                          credit_socket,
+                                          flow_counters,
+                                          flow_control.get_spill_filepath(args.spill_directory, box_name),
+                                          args.max_queued_records,
+                                          args.max_spill_bytes,
+                                          logger)
+
 re_line_breaks = re.compile("(\r\n|\n)", re.DOTALL)
 line_breaks = set(["\r\n", "\n"])
 def split_contents_and_return_excess(contents):
@@ -102,7 +200,6 @@ def split_contents_and_return_excess(contents):
 
     """
 
-    logger = logging.getLogger("%s.split_contents_and_return_excess" % (APP_NAME, ))
     elems = re_line_breaks.split(contents)
     last_index = len(elems) - 1
     non_line_break_elems = [(i, elem) for (i, elem) in enumerate(elems)
@@ -112,30 +209,367 @@ def split_contents_and_return_excess(contents):
     trailing_excess = elems[-1]
 
     return_value = (full_lines, trailing_excess)
-    logger.debug("returning : %s" % (return_value, ))
+    if trace.enabled:
+        trace("returning : %s", return_value)
     return return_value
 
 def get_log_data_and_excess_lines(full_lines, log_datum_class):
     """ Given a list of strings corresponding to full lines from log output
     return a two-element tuple (elem1, elem2).
-    - elem1: a list of zero or more dictionaries that correspond to the
+    - elem1: a list of zero or more LogRecord objects that correspond to the
     contents of the logs.
     - elem2: a list of lines that constitute a partial log datum.
 
     We will silently drop input that doesn't meet the spec of a log block."""
 
-    logger = logging.getLogger("%s.get_log_data_and_excess_lines" % (APP_NAME, ))
     log_datum_object = log_datum_class(full_lines)
     excess_lines = log_datum_object.excess_lines
-    log_data = log_datum_object.dict_representations
+    log_data = log_datum_object.log_records
     return (log_data, excess_lines)
 
+def receive_batch(socket, max_messages, max_bytes, timeout=None):
+    """ Block until a message arrives on socket, then drain any others that
+    are already pending without blocking. Stop once we have max_messages
+    messages or at least max_bytes bytes. Returns a two-element tuple
+    (elem1, elem2).
+    -   elem1: list of strings, the messages.
+    -   elem2: time.time() at which the first message arrived.
+
+    If timeout, in milliseconds, is given and no message arrives in that
+    time return ([], None)."""
+
+    if timeout is not None:
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        if len(tracing.poll(poller, timeout)) == 0:
+            return ([], None)
+    batch = [socket.recv()]
+    batch_start_time = time.time()
+    batch_bytes = len(batch[0])
+    while len(batch) < max_messages and batch_bytes < max_bytes:
+        try:
+            incoming_string = socket.recv(zmq.NOBLOCK)
+        except zmq.ZMQError, e:
+            if e.errno == zmq.EAGAIN:
+                break
+            raise
+        batch.append(incoming_string)
+        batch_bytes += len(incoming_string)
+    return (batch, batch_start_time)
+
+def get_poll_interval(idle_flush_seconds):
+    """ Milliseconds to wait for a message before checking whether it's time
+    to flush idle log data."""
+    if idle_flush_seconds <= 0:
+        return 1000
+    return int(min(1.0, idle_flush_seconds / 2) * 1000)
+
 required_fields = ["contents"]
 def validate_command(command):
     if not all(field in command for field in required_fields):
         return False
     return True
 
+def get_subscription_socket(context, ssh_tap_zeromq_binding):
+    """ SUBSCRIBE to the raw ssh_tap from a server."""
+    subscription_socket = context.socket(zmq.SUB)
+    subscription_socket.setsockopt(zmq.SUBSCRIBE, "")
+    flow_control.set_hwm(subscription_socket, 10000) # only allow 10000 messages into in-memory queue
+    subscription_socket.connect(ssh_tap_zeromq_binding)
+    return subscription_socket
+
+def get_publish_socket(context, results_zeromq_binding):
+    """ PUBLISH parsed log data."""
+    publish_socket = context.socket(zmq.PUB)
+    flow_control.set_hwm(publish_socket, 10000) # only allow 10000 messages into in-memory queue
+    publish_socket.bind(results_zeromq_binding)
+    return publish_socket
+
+class ParserStream(object):
+    """ All the state for parsing one box's log: the trailing excess of the
+    ssh_tap output, the log datum object that's fed every full line and
+    holds the lines that don't yet make up a full log datum, and where and
+    how to publish the results.
+
+    If given a LatencyHistogram as record_latency each published record's
+    latency, from receiving its first line to publishing it, is added to
+    it.
+
+    Batches must be handled in the order they were received."""
+
+    def __init__(self, box_name, log_datum_class, publish_socket, logger, log_type=None, wire_format=wire_format.JSON, record_latency=None):
+        self.box_name = box_name
+        self.log_datum_class = log_datum_class
+        self.publish_socket = publish_socket
+        self.logger = logger
+        self.trace = tracing.get_tracer(logger.name)
+        self.log_type = log_type
+        self.wire_format = wire_format
+        self.record_latency = record_latency
+        self.line_assembler = LineAssembler()
+        self.log_datum = log_datum_class()
+
+        # When the first of the log datum's pending lines was received, and
+        # when we last received any line.
+        self.pending_since = None
+        self.last_line_time = None
+
+    def handle_batch(self, batch, received_time=None):
+        """ Parse a list of ssh_tap messages and publish any log data. Returns
+        the number of log data published.
+
+        received_time is when the batch was received, by default now."""
+        logger = self.logger
+        trace = self.trace
+        if received_time is None:
+            received_time = time.time()
+        # --------------------------------------------------------------------
+        # The ssh_tap output is split into full lines and some trailing
+        # excess. Since a log datum may consist of more than one full line
+        # every full line is fed to the log datum object, which returns the
+        # LogRecord objects the line finishes and holds on to the rest.
+        #
+        # All the log data from a batch goes out as one multipart
+        # message, one encoded log datum per part.
+        # --------------------------------------------------------------------
+        log_data = []
+        received_times = []
+        multi_line = self.log_datum_class.MULTI_LINE
+        single_lines = []
+        for incoming_string in batch:
+            if trace.enabled:
+                trace("Update: '%s'", incoming_string)
+            try:
+                incoming_object = json.loads(incoming_string)
+            except:
+                logger.exception("Can't decode command:\n%s" % (incoming_string, ))
+                continue
+            if not validate_command(incoming_object):
+                logger.error("Not a valid command: \n%s" % (incoming_object))
+                continue
+            assert("contents" in incoming_object)
+            if not multi_line:
+                # Each line is a log datum, so parse the batch's lines all at
+                # once.
+                single_lines.extend(self.line_assembler.feed(incoming_object["contents"]))
+                continue
+            for line in self.line_assembler.feed(incoming_object["contents"]):
+                new_log_data = self.log_datum.feed(line)
+                if len(new_log_data) > 0:
+                    if self.pending_since is None:
+                        first_line_time = received_time
+                    else:
+                        first_line_time = self.pending_since
+                    log_data.extend(new_log_data)
+                    received_times.extend([first_line_time] * len(new_log_data))
+                    self.pending_since = None
+                if self.log_datum.pending_line_count == 0:
+                    self.pending_since = None
+                elif self.pending_since is None:
+                    self.pending_since = received_time
+                self.last_line_time = received_time
+        if len(single_lines) > 0:
+            log_data = self.log_datum.feed_lines(single_lines)
+            received_times = [received_time] * len(log_data)
+            self.last_line_time = received_time
+        if trace.enabled:
+            trace("trailing_excess:\n%s", self.line_assembler.excess)
+        # --------------------------------------------------------------------
+
+        return self.publish(log_data, received_times)
+
+    def flush_if_idle(self, idle_flush_seconds, time_now=None):
+        """ If the log datum has pending lines and no lines have arrived for
+        idle_flush_seconds publish them, rather than wait for the line that
+        finishes them. Returns the number of log data published."""
+        if self.pending_since is None:
+            return 0
+        if time_now is None:
+            time_now = time.time()
+        if (time_now - self.last_line_time) < idle_flush_seconds:
+            return 0
+        self.trace("idle for %.1fs, flushing %s pending lines",
+                   time_now - self.last_line_time, self.log_datum.pending_line_count)
+        log_data = self.log_datum.flush()
+        received_times = [self.pending_since] * len(log_data)
+        self.pending_since = None
+        return self.publish(log_data, received_times)
+
+    def publish_ready(self, block=False):
+        """ Publish log data that's finished being parsed elsewhere. Log data
+        is parsed as soon as it's handled here, so there's nothing to do."""
+        return 0
+
+    def publish(self, log_data, received_times):
+        """ Publish a list of LogRecord objects as one multipart message, and
+        add their latencies given a list of when each one's first line was
+        received. Returns the number of log data published."""
+        trace = self.trace
+        parts = []
+        for log_record in log_data:
+            log_record.box_name = self.box_name
+            log_record.log_type = self.log_type
+            if trace.enabled:
+                trace("publishing:\n%r", log_record)
+            parts.append(wire_format.encode(log_record, self.wire_format))
+        if len(parts) > 0:
+            self.publish_socket.send_multipart(parts)
+            if self.record_latency is not None:
+                time_now = time.time()
+                for received_time in received_times:
+                    self.record_latency.add(time_now - received_time)
+        return len(parts)
+
+# ----------------------------------------------------------------------------
+#   Parsing one stream in a pool of processes.
+# ----------------------------------------------------------------------------
+def init_parse_worker(log_datum_class, contents_hasher):
+    global parse_worker_log_datum_class
+    parse_worker_log_datum_class = log_datum_class
+    log_datum_class.CONTENTS_HASHER = contents_hasher
+    # Only the parser process traces, so don't let a SIGUSR1 meant for it
+    # interrupt the workers.
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+def parse_chunk(lines):
+    """ In a pool worker, parse a list of full lines that starts and ends at
+    log datum boundaries and return a list of the LogRecord objects."""
+    log_datum = parse_worker_log_datum_class()
+    log_records = log_datum.feed_lines(lines)
+    log_records.extend(log_datum.flush())
+    return log_records
+
+def get_parse_pool(processes, log_datum_class):
+    return multiprocessing.Pool(processes,
+                                init_parse_worker,
+                                (log_datum_class, log_datum_class.CONTENTS_HASHER))
+
+class ParallelParserStream(ParserStream):
+    """ A ParserStream that parses in a multiprocessing.Pool.
+
+    Full lines are held until the log data they make up are known to be
+    finished, i.e. until the line that starts the next log datum arrives,
+    and then cut into chunks of about chunk_lines lines at log datum
+    boundaries. The chunks are parsed in the pool and their log data
+    published in the order the chunks were cut, so subscribers see the same
+    log data in the same order as from a ParserStream.
+
+    Finding the boundaries of multi-line log data takes a regular
+    expression match per line in this process.
+
+    The latency of a record is from receiving the first line of its
+    chunk."""
+
+    def __init__(self, box_name, log_datum_class, publish_socket, logger, pool, processes, chunk_lines=DEFAULT_PARSE_CHUNK_LINES, log_type=None, wire_format=wire_format.JSON, record_latency=None):
+        super(ParallelParserStream, self).__init__(box_name, log_datum_class, publish_socket, logger, log_type, wire_format, record_latency)
+        self.pool = pool
+        self.chunk_lines = chunk_lines
+        # Block rather than let more than this many chunks be in flight.
+        self.max_chunks_in_flight = processes * 4
+
+        # Full lines that haven't been sent to the pool, when each was
+        # received, and the indexes of the ones that start a log datum.
+        self.lines = []
+        self.line_received_times = []
+        self.boundaries = []
+
+        # (multiprocessing.AsyncResult, received_time) for each chunk, in
+        # order.
+        self.chunks_in_flight = collections.deque()
+
+    def handle_batch(self, batch, received_time=None):
+        """ Add a list of ssh_tap messages to the stream, send any finished
+        log data to the pool and publish any that's already parsed. Returns
+        the number of log data published."""
+        logger = self.logger
+        trace = self.trace
+        if received_time is None:
+            received_time = time.time()
+        multi_line = self.log_datum_class.MULTI_LINE
+        for incoming_string in batch:
+            if trace.enabled:
+                trace("Update: '%s'", incoming_string)
+            try:
+                incoming_object = json.loads(incoming_string)
+            except:
+                logger.exception("Can't decode command:\n%s" % (incoming_string, ))
+                continue
+            if not validate_command(incoming_object):
+                logger.error("Not a valid command: \n%s" % (incoming_object))
+                continue
+            assert("contents" in incoming_object)
+            for line in self.line_assembler.feed(incoming_object["contents"]):
+                if multi_line and self.log_datum.starts_log_datum(line):
+                    self.boundaries.append(len(self.lines))
+                self.lines.append(line)
+                self.line_received_times.append(received_time)
+            self.last_line_time = received_time
+        if trace.enabled:
+            trace("trailing_excess:\n%s", self.line_assembler.excess)
+
+        if not multi_line:
+            end = len(self.lines)
+        elif len(self.boundaries) > 0:
+            end = self.boundaries[-1]
+        else:
+            end = 0
+        self.send_lines(end)
+        return self.publish_ready()
+
+    def flush_if_idle(self, idle_flush_seconds, time_now=None):
+        """ If there are held lines and no lines have arrived for
+        idle_flush_seconds send them to the pool, rather than wait for the
+        line that finishes them. Returns the number of log data
+        published."""
+        if len(self.lines) > 0:
+            if time_now is None:
+                time_now = time.time()
+            if (time_now - self.last_line_time) >= idle_flush_seconds:
+                self.trace("idle for %.1fs, flushing %s held lines",
+                           time_now - self.last_line_time, len(self.lines))
+                self.send_lines(len(self.lines))
+        return self.publish_ready()
+
+    def send_lines(self, end):
+        """ Cut the held lines before end into chunks at boundaries and send
+        them to the pool."""
+        if end == 0:
+            return
+        if self.log_datum_class.MULTI_LINE:
+            cuts = [boundary for boundary in self.boundaries if 0 < boundary < end]
+        else:
+            cuts = range(self.chunk_lines, end, self.chunk_lines)
+        cuts.append(end)
+        start = 0
+        for cut in cuts:
+            if cut - start < self.chunk_lines and cut != end:
+                continue
+            if len(self.chunks_in_flight) >= self.max_chunks_in_flight:
+                self.publish_ready(block=True)
+            async_result = self.pool.apply_async(parse_chunk, (self.lines[start:cut], ))
+            self.chunks_in_flight.append((async_result, self.line_received_times[start]))
+            start = cut
+        self.lines = self.lines[end:]
+        self.line_received_times = self.line_received_times[end:]
+        self.boundaries = [boundary - end for boundary in self.boundaries if boundary >= end]
+
+    def publish_ready(self, block=False):
+        """ Publish the log data of chunks that have been parsed, in order.
+        If block, wait for at least the oldest chunk. Returns the number of
+        log data published."""
+        number_of_records = 0
+        while len(self.chunks_in_flight) > 0:
+            (async_result, received_time) = self.chunks_in_flight[0]
+            if not (block or async_result.ready()):
+                break
+            log_data = async_result.get()
+            self.chunks_in_flight.popleft()
+            number_of_records += self.publish(log_data, [received_time] * len(log_data))
+            block = False
+        return number_of_records
+# ----------------------------------------------------------------------------
+
 def main(app_name, log_datum_class, fields_to_index):
     APP_NAME = app_name
     import logging
@@ -148,70 +582,68 @@ def main(app_name, log_datum_class, fields_to_index):
     logger.addHandler(ch)
 
     args = get_args()
+    tracing.install_signal_handler()
     if args.verbose:
         logger.setLevel(logging.DEBUG)
         ch.setLevel(logging.DEBUG)
+        tracing.enable(app_name)
         logger.debug("Verbose logging enabled.")
     logger.debug("entry. log_datum_class: %s" % (log_datum_class, ))
 
     context = zmq.Context(1)
-
-    # ------------------------------------------------------------------------
-    #   Subscribing to the raw ssh_tap from a server.
-    # ------------------------------------------------------------------------
     logger.debug("Subscribing to ssh_tap at: %s" % (args.ssh_tap_zeromq_binding, ))
-    subscription_socket = context.socket(zmq.SUB)
-    subscription_socket.setsockopt(zmq.SUBSCRIBE, "")
-    subscription_socket.setsockopt(zmq.HWM, 10000) # only allow 10000 messages into in-memory queue
-    #subscription_socket.setsockopt(zmq.SWAP, 10 * 1024 * 1024) # offload 10MB of messages onto disk
-    subscription_socket.connect(args.ssh_tap_zeromq_binding)
-    # ------------------------------------------------------------------------
-
-    # ------------------------------------------------------------------------
-    #   Publishing JSON for parsed log data.
-    # ------------------------------------------------------------------------
+    subscription_socket = get_subscription_socket(context, args.ssh_tap_zeromq_binding)
     logger.debug("Publishing parsed results at: %s" % (args.results_zeromq_binding, ))
-    publish_socket = context.socket(zmq.PUB)
-    publish_socket.setsockopt(zmq.HWM, 10000) # only allow 10000 messages into in-memory queue
-    #publish_socket.setsockopt(zmq.SWAP, 10 * 1024 * 1024) # offload 10MB of messages onto disk
-    publish_socket.bind(args.results_zeromq_binding)
-    # ------------------------------------------------------------------------
-
-    box_name = args.box_name
-    trailing_excess = ""
-    full_lines = []
+    publish_socket = get_publish_socket(context, args.results_zeromq_binding)
+
+    log_datum_class.CONTENTS_HASHER = contents_hash.ContentsHasher(contents_hash.get_contents_hash_format(args.contents_hash_format, logger),
+                                                                  args.contents_hash_policy)
+    batch_statistics = BatchStatistics(logger, args.stats_interval)
+    publisher = get_credited_publisher(context,
+                                       publish_socket,
+                                       args.results_zeromq_binding,
+                                       args.box_name,
+                                       args,
+                                       batch_statistics.flow_counters,
+                                       logger)
+    if args.processes > 1:
+        logger.info("parsing in %s processes." % (args.processes, ))
+        parser_stream = ParallelParserStream(args.box_name,
+                                             log_datum_class,
+                                             publisher,
+                                             logger,
+                                             get_parse_pool(args.processes, log_datum_class),
+                                             args.processes,
+                                             chunk_lines=args.parse_chunk_lines,
+                                             log_type=app_name,
+                                             wire_format=wire_format.get_wire_format(args.wire_format, logger),
+                                             record_latency=batch_statistics.record_latency)
+    else:
+        parser_stream = ParserStream(args.box_name,
+                                     log_datum_class,
+                                     publisher,
+                                     logger,
+                                     log_type=app_name,
+                                     wire_format=wire_format.get_wire_format(args.wire_format, logger),
+                                     record_latency=batch_statistics.record_latency)
+    poll_interval = get_poll_interval(args.idle_flush_seconds)
+    if args.processes > 1:
+        # Wake up often enough to publish chunks as the pool finishes them.
+        poll_interval = min(poll_interval, 50)
     try:
         while 1:
-            incoming_string = subscription_socket.recv()
-            logger.debug("Update: '%s'" % (incoming_string, ))
-            try:
-                incoming_object = json.loads(incoming_string)
-            except:
-                logger.exception("Can't decode command:\n%s" % (incoming_string, ))
-                continue
-            if not validate_command(incoming_object):
-                logger.error("Not a valid command: \n%s" % (incoming_object))
-                continue
-            assert("contents" in incoming_object)
-            trailing_excess = ''.join([trailing_excess, incoming_object["contents"]])
-            (new_full_lines, trailing_excess) = split_contents_and_return_excess(trailing_excess)
-            full_lines.extend(new_full_lines)
-            logger.debug("full_lines:\n%s" % (pprint.pformat(full_lines), ))
-            logger.debug("trailing_excess:\n%s" % (trailing_excess, ))
-
-            # ----------------------------------------------------------------
-            # We now have lots of full lines and some trailing excess. Since a
-            # log datum may consist of more than one full line we perform a
-            # similar operation to above. We pass all the full lines to a
-            # function which will generate a list of dictionaries and
-            # excess lines, as ([dicts], excess).
-            # ----------------------------------------------------------------
-            (log_data, full_lines) = get_log_data_and_excess_lines(full_lines, log_datum_class)
-            for log_datum in log_data:
-                log_datum["box_name"] = box_name
-                logger.debug("publishing:\n%r" % (log_datum, ))
-                publish_socket.send(json.dumps(log_datum))
-            # ----------------------------------------------------------------
+            (batch, batch_start_time) = receive_batch(subscription_socket, args.batch_max_messages, args.batch_max_bytes, poll_interval)
+            if len(batch) > 0:
+                number_of_records = parser_stream.handle_batch(batch, batch_start_time)
+                batch_statistics.add_batch(len(batch),
+                                           sum(len(incoming_string) for incoming_string in batch),
+                                           number_of_records,
+                                           time.time() - batch_start_time)
+            if args.idle_flush_seconds > 0:
+                parser_stream.flush_if_idle(args.idle_flush_seconds)
+            parser_stream.publish_ready()
+            publisher.pump()
+            batch_statistics.report_if_due()
     except KeyboardInterrupt:
         logger.debug("CTRL-C")
     finally:
@@ -0,0 +1,436 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   One scheduler for every reconcile_log, so that their passes take turns
+#   rather than each one SSH'ing in and inserting whenever its own interval
+#   comes round, all at once for boxes that came back from the same outage.
+#
+#   -   When a reconcile_log's pass is due it asks for a turn, sending its
+#       host, its stream, i.e. its collection, and whether it has a gap:
+#       bytes that masspinger says may have been written during an outage,
+#       or that a pass has yet to fetch.
+#   -   Turns are granted to streams with gaps first, then in the order
+#       they were asked for, at most --max_transfers_per_box at a time for
+#       a box and at most the allowed number of transfers overall.
+#   -   While it fetches, a reconcile_log reports how long each insert took.
+#       Every --adjust_interval seconds, if the p90 of those is over
+#       --target_latency the allowed number of transfers is halved,
+#       possibly to none, otherwise it grows by one up to --max_transfers.
+#   -   A reconcile_log says when its pass is done. A turn it hasn't said
+#       anything about for --lease seconds, e.g. because it died, is taken
+#       back.
+#
+#   Messages are JSON, over a ROUTER socket we bind and a DEALER socket
+#   each reconcile_log connects, through CatchUpClient. A request that
+#   hasn't been granted is sent again every REQUEST_RESEND_SECONDS, and
+#   answered with its place in the queue, so that requests survive the
+#   scheduler restarting. A reconcile_log that hears nothing back for
+#   SCHEDULER_SILENT_SECONDS runs its pass anyway, as it did before there
+#   was a scheduler.
+#
+#   Enable with 'catch_up_scheduler: on', as well as 'reconcile_log: on',
+#   in the global config.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import errno
+import json
+import argparse
+
+import zmq
+
+from metrics import LatencyHistogram
+import tracing
+
+# ----------------------------------------------------------------------------
+#   Signal handling
+# ----------------------------------------------------------------------------
+import signal
+def soft_handler(signum, frame):
+    logging.debug('Soft stop')
+    sys.exit(1)
+def hard_handler(signum, frame):
+    logging.debug('Hard stop')
+    os._exit(2)
+signal.signal(signal.SIGINT, soft_handler)
+signal.signal(signal.SIGTERM, hard_handler)
+# ----------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Constants.
+# ----------------------------------------------------------------------------
+APP_NAME = "catch_up_scheduler"
+DEFAULT_MAX_TRANSFERS = 8
+DEFAULT_MAX_TRANSFERS_PER_BOX = 1
+DEFAULT_TARGET_LATENCY = 2.0
+DEFAULT_ADJUST_INTERVAL = 30
+DEFAULT_LEASE_SECONDS = 30 * 60
+DEFAULT_STATS_INTERVAL = 60
+REQUEST_RESEND_SECONDS = 60
+SCHEDULER_SILENT_SECONDS = 5 * 60
+# ----------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Logging.
+# ----------------------------------------------------------------------------
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+# ----------------------------------------------------------------------------
+
+def get_args():
+    parser = argparse.ArgumentParser("Decide when each reconcile_log may run a pass.")
+    parser.add_argument("--bind",
+                        dest="zeromq_binding",
+                        metavar="ZEROMQ_BINDING",
+                        required=True,
+                        help="ZeroMQ binding we take requests from reconcile_log on, e.g. tcp://*:10003.")
+    parser.add_argument("--max_transfers",
+                        dest="max_transfers",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_MAX_TRANSFERS,
+                        help="Most passes to run at once overall. Default is %s." % (DEFAULT_MAX_TRANSFERS, ))
+    parser.add_argument("--max_transfers_per_box",
+                        dest="max_transfers_per_box",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_MAX_TRANSFERS_PER_BOX,
+                        help="Most passes to run at once against one box. Default is %s." % (DEFAULT_MAX_TRANSFERS_PER_BOX, ))
+    parser.add_argument("--target_latency",
+                        dest="target_latency",
+                        metavar="SECONDS",
+                        type=float,
+                        default=DEFAULT_TARGET_LATENCY,
+                        help="Allow fewer passes at once while the p90 of reconcile_log's inserts takes longer than this. Default is %s." % (DEFAULT_TARGET_LATENCY, ))
+    parser.add_argument("--adjust_interval",
+                        dest="adjust_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_ADJUST_INTERVAL,
+                        help="Change how many passes are allowed at once at most this often. Default is %s." % (DEFAULT_ADJUST_INTERVAL, ))
+    parser.add_argument("--lease",
+                        dest="lease_seconds",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_LEASE_SECONDS,
+                        help="Take back a pass we haven't heard about for this long. Default is %s." % (DEFAULT_LEASE_SECONDS, ))
+    parser.add_argument("--stats_interval",
+                        dest="stats_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_STATS_INTERVAL,
+                        help="Log the queue this often. Default is %s." % (DEFAULT_STATS_INTERVAL, ))
+    parser.add_argument("--verbose",
+                        dest="verbose",
+                        action='store_true',
+                        default=False,
+                        help="Enable verbose debug mode.")
+    return parser.parse_args()
+
+class CatchUpScheduler(object):
+    """ Which streams have asked for a pass and which are running one.
+    Each is a dict of stream name to a dict of:
+    -   identity: the requester's ZeroMQ identity.
+    -   number: the requester's number for the request.
+    -   host: the box the stream is from.
+    -   gap: True if the stream may be missing log data.
+    -   gap_bytes: how many bytes it knows it may be missing.
+    -   time: epoch seconds of the request, or of the grant once running.
+    -   heard_time: epoch seconds we last heard from the requester."""
+
+    def __init__(self, max_transfers, max_transfers_per_box, target_latency, lease_seconds, logger=logger):
+        self.max_transfers = max_transfers
+        self.max_transfers_per_box = max_transfers_per_box
+        self.target_latency = target_latency
+        self.lease_seconds = lease_seconds
+        self.logger = logger
+        self.allowed_transfers = max_transfers
+        self.queued = {}
+        self.running = {}
+        self.latencies = LatencyHistogram()
+        self.number_granted = 0
+        self.number_expired = 0
+
+    def is_requester(self, job, identity, number=None):
+        return job is not None and job["identity"] == identity and (number is None or job["number"] == number)
+
+    def request(self, identity, stream_name, number, host, gap, gap_bytes, time_now):
+        """ Queue a stream, or refresh it if it's queued already. Returns
+        its place in the queue, 1 being next, or 0 if it's already been
+        granted."""
+        job = self.running.get(stream_name)
+        if job is not None:
+            if self.is_requester(job, identity, number):
+                # Asked again before it saw the grant.
+                job["heard_time"] = time_now
+                return 0
+            if job["identity"] != identity:
+                self.logger.info("%s: asked again from a new reconcile_log, ending the old one's pass." % (stream_name, ))
+            del self.running[stream_name]
+        job = self.queued.get(stream_name)
+        if job is None:
+            job = {"time": time_now}
+            self.queued[stream_name] = job
+        job.update({"identity": identity, "number": number, "host": host, "gap": gap, "gap_bytes": gap_bytes,
+                    "heard_time": time_now})
+        return self.get_queue().index(stream_name) + 1
+
+    def done(self, identity, stream_name, number):
+        """ The pass is over, or no longer wanted if it's still queued."""
+        for jobs in [self.running, self.queued]:
+            if self.is_requester(jobs.get(stream_name), identity, number):
+                del jobs[stream_name]
+
+    def report_latency(self, identity, stream_name, seconds, time_now):
+        job = self.running.get(stream_name)
+        if self.is_requester(job, identity):
+            job["heard_time"] = time_now
+        self.latencies.add(seconds)
+
+    def get_queue(self):
+        """ Queued stream names, streams with gaps first, then oldest
+        first."""
+        return sorted(self.queued, key=lambda stream_name: (not self.queued[stream_name]["gap"],
+                                                           self.queued[stream_name]["time"],
+                                                           stream_name))
+
+    def get_grants(self, time_now):
+        """ Start as many queued streams as we're allowed to. Returns a
+        list of (identity, stream_name, number) to tell they can go."""
+        grants = []
+        running_per_host = {}
+        for job in self.running.itervalues():
+            running_per_host[job["host"]] = running_per_host.get(job["host"], 0) + 1
+        for stream_name in self.get_queue():
+            if len(self.running) >= self.allowed_transfers:
+                break
+            job = self.queued[stream_name]
+            if running_per_host.get(job["host"], 0) >= self.max_transfers_per_box:
+                continue
+            del self.queued[stream_name]
+            job["time"] = time_now
+            self.running[stream_name] = job
+            running_per_host[job["host"]] = running_per_host.get(job["host"], 0) + 1
+            self.number_granted += 1
+            grants.append((job["identity"], stream_name, job["number"]))
+        return grants
+
+    def expire(self, time_now):
+        """ Take back passes, and forget requests, we haven't heard about
+        for the lease."""
+        for jobs in [self.running, self.queued]:
+            for (stream_name, job) in jobs.items():
+                if (time_now - job["heard_time"]) <= self.lease_seconds:
+                    continue
+                if jobs is self.running:
+                    self.logger.warning("%s: nothing heard for %ss, taking its pass back." % (stream_name, self.lease_seconds))
+                    self.number_expired += 1
+                del jobs[stream_name]
+
+    def adjust(self):
+        """ Halve the allowed number of transfers if inserts have been slow
+        since the last adjustment, otherwise allow one more."""
+        p90 = self.latencies.percentile(90)
+        allowed_transfers = self.allowed_transfers
+        if p90 is not None and p90 > self.target_latency:
+            allowed_transfers = allowed_transfers // 2
+        else:
+            allowed_transfers = min(self.max_transfers, allowed_transfers + 1)
+        if allowed_transfers != self.allowed_transfers:
+            self.logger.info("insert latency %s, allowing %s transfers at once rather than %s." % \
+                             (self.latencies, allowed_transfers, self.allowed_transfers))
+            self.allowed_transfers = allowed_transfers
+        self.latencies.reset()
+
+    def __str__(self):
+        number_of_gaps = len([job for job in self.queued.itervalues() if job["gap"]])
+        return "queued %s (%s with gaps), running %s of %s allowed, granted %s, expired %s" % \
+               (len(self.queued), number_of_gaps, len(self.running), self.allowed_transfers,
+                self.number_granted, self.number_expired)
+
+def send_grant(router_socket, identity, stream_name, number):
+    router_socket.send_multipart([identity, json.dumps({"type": "grant", "stream": stream_name, "number": number})])
+
+def handle_message(scheduler, router_socket, identity, message, time_now, logger):
+    try:
+        tree = json.loads(message)
+        (message_type, stream_name) = (tree["type"], tree["stream"])
+    except (ValueError, TypeError, KeyError):
+        logger.error("can't decode message:\n%r" % (message, ))
+        return
+    number = tree.get("number")
+    if message_type == "request":
+        position = scheduler.request(identity, stream_name, number, tree.get("host"), tree.get("gap", False), tree.get("gap_bytes", 0), time_now)
+        if position == 0:
+            send_grant(router_socket, identity, stream_name, number)
+        else:
+            router_socket.send_multipart([identity, json.dumps({"type": "queued", "stream": stream_name, "number": number, "position": position})])
+    elif message_type == "latency":
+        scheduler.report_latency(identity, stream_name, tree.get("seconds", 0), time_now)
+    elif message_type == "done":
+        scheduler.done(identity, stream_name, number)
+    else:
+        logger.error("%s: unknown message type %s." % (stream_name, message_type))
+
+class CatchUpClient(object):
+    """ A reconcile_log's side: ask for a pass, wait for it to be granted,
+    report insert latencies while it runs and say when it's done. Poll
+    'socket' for POLLIN and call receive() when it has messages. Each
+    request has a new number, so that a grant for an earlier one is
+    ignored."""
+
+    def __init__(self, context, zeromq_binding, host, stream_name, logger=logger):
+        self.host = host
+        self.stream_name = stream_name
+        self.logger = logger
+        self.socket = context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(zeromq_binding)
+        self.number = 0
+        self.is_waiting = False
+        self.is_granted = False
+        self.request_tree = None
+        self.request_time = None
+        self.last_request_time = None
+        self.last_heard_time = None
+
+    def send(self, tree):
+        tree.update({"stream": self.stream_name, "number": self.number})
+        try:
+            self.socket.send(json.dumps(tree), zmq.NOBLOCK)
+        except zmq.ZMQError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def request(self, gap, gap_bytes, time_now):
+        self.number += 1
+        self.request_tree = {"type": "request", "host": self.host, "gap": gap, "gap_bytes": gap_bytes}
+        self.send(dict(self.request_tree))
+        (self.is_waiting, self.is_granted) = (True, False)
+        (self.request_time, self.last_request_time, self.last_heard_time) = (time_now, time_now, None)
+
+    def resend_if_due(self, time_now):
+        if self.is_waiting and (time_now - self.last_request_time) >= REQUEST_RESEND_SECONDS:
+            self.send(dict(self.request_tree))
+            self.last_request_time = time_now
+
+    def receive(self, time_now):
+        while 1:
+            try:
+                message = self.socket.recv(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    break
+                raise
+            try:
+                tree = json.loads(message)
+            except ValueError:
+                self.logger.error("can't decode message:\n%r" % (message, ))
+                continue
+            if tree.get("number") != self.number:
+                continue
+            self.last_heard_time = time_now
+            if tree.get("type") == "grant" and self.is_waiting:
+                self.logger.debug("granted a pass after %.1fs." % (time_now - self.request_time, ))
+                (self.is_waiting, self.is_granted) = (False, True)
+            elif tree.get("type") == "queued":
+                self.logger.debug("queued, position %s." % (tree.get("position"), ))
+
+    def may_run(self, time_now):
+        """ True if we've been granted a pass, or have waited for one for
+        SCHEDULER_SILENT_SECONDS without hearing from the scheduler."""
+        if self.is_granted:
+            return True
+        if self.is_waiting and self.last_heard_time is None and \
+           (time_now - self.request_time) >= SCHEDULER_SILENT_SECONDS:
+            self.logger.warning("nothing heard from the scheduler for %ss, running the pass anyway." % (SCHEDULER_SILENT_SECONDS, ))
+            (self.is_waiting, self.is_granted) = (False, True)
+            return True
+        return False
+
+    def report_latency(self, seconds):
+        if self.is_granted:
+            self.send({"type": "latency", "seconds": seconds})
+
+    def done(self):
+        """ Say the pass is over, or if it's not been granted yet that we
+        no longer want it."""
+        if self.is_waiting or self.is_granted:
+            self.send({"type": "done"})
+        (self.is_waiting, self.is_granted) = (False, False)
+
+    def close(self):
+        self.socket.close(linger=0)
+
+def main():
+    args = get_args()
+    logger = tracing.get_logger(APP_NAME, "main")
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+        tracing.enable(APP_NAME)
+        logger.debug("Verbose logging enabled.")
+    logger.debug("entry.")
+    tracing.install_signal_handler()
+
+    scheduler = CatchUpScheduler(args.max_transfers, args.max_transfers_per_box, args.target_latency, args.lease_seconds, logger)
+    context = zmq.Context(1)
+    router_socket = context.socket(zmq.ROUTER)
+    router_socket.setsockopt(zmq.LINGER, 0)
+    router_socket.bind(args.zeromq_binding)
+    poller = zmq.Poller()
+    poller.register(router_socket, zmq.POLLIN)
+    poll_interval = 1000
+    last_adjust_time = time.time()
+    last_stats_time = time.time()
+    try:
+        while 1:
+            socks = tracing.poll(poller, poll_interval)
+            time_now = time.time()
+            if socks.get(router_socket, None) == zmq.POLLIN:
+                while 1:
+                    try:
+                        parts = router_socket.recv_multipart(zmq.NOBLOCK)
+                    except zmq.ZMQError, e:
+                        if e.errno == zmq.EAGAIN:
+                            break
+                        raise
+                    if len(parts) != 2:
+                        logger.error("expected [identity, message], got %s parts." % (len(parts), ))
+                        continue
+                    handle_message(scheduler, router_socket, parts[0], parts[1], time_now, logger)
+            scheduler.expire(time_now)
+            if (time_now - last_adjust_time) >= args.adjust_interval:
+                scheduler.adjust()
+                last_adjust_time = time_now
+            for (identity, stream_name, number) in scheduler.get_grants(time_now):
+                logger.debug("%s: granted a pass." % (stream_name, ))
+                send_grant(router_socket, identity, stream_name, number)
+            if (time_now - last_stats_time) >= args.stats_interval:
+                logger.info(str(scheduler))
+                last_stats_time = time_now
+
+    except KeyboardInterrupt:
+        logger.debug("CTRL-C")
+    finally:
+        logger.debug("exiting")
+        poller.unregister(router_socket)
+        router_socket.close(linger=0)
+        context.term()
+
+if __name__ == "__main__":
+    main()
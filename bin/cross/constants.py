@@ -42,9 +42,27 @@ robust_ssh_tap_filepath = os.path.join(cross_bin_directory, "robust_ssh_tap.py")
 assert(os.path.isfile(robust_ssh_tap_filepath)), "%s not good robust_ssh_tap_filepath" % (robust_ssh_tap_filepath, )
 robust_ssh_tap_template = Template(""" ${executable} --masspinger "${masspinger_zeromq_bind}" --ssh_tap "${ssh_tap_zeromq_bind}" --parser "${parser_zeromq_bind}" --parser_name "${parser_name}" --results "${results_zeromq_bind}" --host "${host}" --command "${command}" --username "${username}" --password "${password}" """)
 
+# rill_start gives each box and log a block of PORTS_PER_STREAM ports from
+# each of ssh_tap_port_start, parser_port_start and results_port_start:
+#
+#   ssh_tap block:  +0  robust_ssh_tap's ssh_tap.
+#                   +1  robust_ssh_tap's tail inode monitor's ssh_tap.
+#                   +2  reconcile_log's ssh_tap.
+#   parser block:   +0  the parser's PUB socket.
+#                   +1  its credit PULL socket, flow_control.CREDIT_PORT_OFFSET on.
+#                   +2  reconcile_log's parser's PUB socket.
+#                   +3  its credit PULL socket.
+#   results block:  +0  robust_ssh_tap's results.
+PORTS_PER_STREAM = 5
+RECONCILE_LOG_PORT_OFFSET = 2
+
 reconcile_log_filepath = os.path.join(cross_bin_directory, "reconcile_log.py")
 assert(os.path.isfile(reconcile_log_filepath)), "%s not good reconcile_log_filepath" % (reconcile_log_filepath, )
-reconcile_log_template = Template(""" nice -n 19 ${executable} --masspinger "${masspinger_zeromq_bind}" --ssh_tap "${ssh_tap_zeromq_bind}" --parser "${parser_zeromq_bind}" --parser_name "${parser_name}" --host "${host}" --command "${command}" --username "${username}" --password "${password}" --collection_name "${collection_name}" """)
+reconcile_log_template = Template(""" nice -n 19 ${executable} --masspinger "${masspinger_zeromq_bind}" --ssh_tap "${ssh_tap_zeromq_bind}" --parser "${parser_zeromq_bind}" --parser_name "${parser_name}" --host "${host}" --log_file "${log_file}" --username "${username}" --password "${password}" --collection_name "${collection_name}" """)
+
+catch_up_scheduler_filepath = os.path.join(cross_bin_directory, "catch_up_scheduler.py")
+assert(os.path.isfile(catch_up_scheduler_filepath)), "%s not good catch_up_scheduler_filepath" % (catch_up_scheduler_filepath, )
+catch_up_scheduler_template = Template(""" ${executable} --bind "${scheduler_zeromq_bind}" --max_transfers ${max_transfers} --max_transfers_per_box ${max_transfers_per_box} --target_latency ${target_latency} """)
 
 masspinger_tap_filepath = os.path.join(cross_bin_directory, "masspinger_tap.py")
 assert(os.path.isfile(masspinger_tap_filepath)), "%s not good masspinger_tap_filepath" % (masspinger_tap_filepath, )
@@ -68,9 +86,28 @@ else:
     # Production
     parser_template = Template(""" ${executable} --ssh_tap "${ssh_tap_zeromq_bind}" --results "${parser_zeromq_bind}" --box_name ${box_name} """)
 
+# parser_farm hosts the parsers below, keyed by parser name, in one pool of
+# worker processes rather than one process per box and log.
+parser_farm_filepath = os.path.join(cross_bin_directory, "parser_farm.py")
+assert(os.path.isfile(parser_farm_filepath)), "%s not good parser_farm_filepath" % (parser_farm_filepath, )
+parser_farm_template = Template(""" ${executable} ${streams} """)
+parser_farm_stream_template = Template(""" --stream "${parser_name}" "${box_name}" "${ssh_tap_zeromq_bind}" "${parser_zeromq_bind}" """)
+parser_farm_classes = {"ngmg_ep_parser": "NgmgEpParserLogDatum",
+                       "ngmg_messages_parser": "NgmgMessagesParserLogDatum",
+                       "ngmg_ms_messages_parser": "NgmgMsMessagesParserLogDatum",
+                       "ngmg_shm_hpilist_parser": "NgmgShmHpilistParserLogDatum",
+                       "ngmg_shm_messages_parser": "NgmgShmMessagesParserLogDatum",
+                       "ngmg_stdout_parser": "NgmgStdoutParserLogDatum"}
+
 tail_query_inode_template = Template(""" while [[ 1 ]]; do date +"%Y-%m-%dT%H:%M:%S"; ls -i ${log_filepath} 2>&1 | awk '{print \$$1}'; sleep 1; done """)
 
 parser_tap_to_database_filepath = os.path.join(cross_bin_directory, "parser_tap_to_database.py")
 assert(os.path.isfile(parser_tap_to_database_filepath)), "%s not good parser_tap_to_database_filepath" % (parser_tap_to_database_filepath, )
 parser_tap_to_database_template = Template(""" ${executable} --results "${results_zeromq_bind}" --collection "${collection}" """)
 
+# database_writer stores every parser's log data, in place of the
+# parser_tap_to_database robust_ssh_tap would launch for each one.
+database_writer_filepath = os.path.join(cross_bin_directory, "database_writer.py")
+assert(os.path.isfile(database_writer_filepath)), "%s not good database_writer_filepath" % (database_writer_filepath, )
+database_writer_template = Template(""" ${executable} --service_registry "${service_registry_uri}" --metrics "${metrics_zeromq_bind}" """)
+
@@ -0,0 +1,117 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   The contents_hash we store with every log and keep a unique index on,
+#   so that we don't store the same log twice.
+#
+#   Formats:
+#   -   "md5": base64 of the MD5 digest, a 24 character string. What we've
+#       always used.
+#   -   "xxh64": the 64-bit xxHash as a signed integer, which BSON stores as
+#       an int64. Much cheaper to compute, and the index is much smaller.
+#       Needs the xxhash module.
+#
+#   Policies, i.e. what we hash:
+#   -   "contents": just the contents, as we always have.
+#   -   "contents_and_datetime": the contents and the datetime. With a
+#       64-bit hash, and especially for short lines that repeat, this makes
+#       it much less likely that two different logs collide and we drop one
+#       of them.
+#
+#   During a migration a collection holds both formats. The unique index
+#   doesn't mind, but a log that's hashed in both formats will be stored
+#   twice.
+# ----------------------------------------------------------------------------
+
+import base64
+import hashlib
+
+APP_NAME = "contents_hash"
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+from log_record import datetime_to_epoch_ms
+import tracing
+
+MD5 = "md5"
+XXH64 = "xxh64"
+CONTENTS_HASH_FORMATS = [MD5, XXH64]
+
+CONTENTS = "contents"
+CONTENTS_AND_DATETIME = "contents_and_datetime"
+CONTENTS_HASH_POLICIES = [CONTENTS, CONTENTS_AND_DATETIME]
+
+TWO_TO_THE_63 = 1 << 63
+TWO_TO_THE_64 = 1 << 64
+
+# ----------------------------------------------------------------------------
+#   xxhash's API has grown over time.
+# ----------------------------------------------------------------------------
+def _xxh64_unsigned(data):
+    return int(xxhash.xxh64(data).hexdigest(), 16)
+if xxhash is not None:
+    if hasattr(xxhash, "xxh64_intdigest"):
+        _xxh64_unsigned = xxhash.xxh64_intdigest
+    elif hasattr(xxhash.xxh64(""), "intdigest"):
+        _xxh64_unsigned = lambda data: xxhash.xxh64(data).intdigest()
+# ----------------------------------------------------------------------------
+
+def md5(data):
+    return base64.b64encode(hashlib.md5(data).digest())
+
+def xxh64(data):
+    """ Signed, so that it fits in a BSON int64."""
+    value = _xxh64_unsigned(data)
+    if value >= TWO_TO_THE_63:
+        value -= TWO_TO_THE_64
+    return value
+
+def is_format(contents_hash, contents_hash_format):
+    """ Is an existing contents_hash in contents_hash_format?"""
+    if contents_hash_format == MD5:
+        return isinstance(contents_hash, basestring)
+    return isinstance(contents_hash, (int, long))
+
+def get_contents_hash_format(requested_contents_hash_format, logger=None):
+    """ The format to hash in given what was asked for, falling back to MD5
+    if xxhash isn't available."""
+    if logger is None:
+        logger = tracing.get_logger(APP_NAME, "get_contents_hash_format")
+    assert(requested_contents_hash_format in CONTENTS_HASH_FORMATS), "%s is not a contents_hash format" % (requested_contents_hash_format, )
+    if requested_contents_hash_format == XXH64 and xxhash is None:
+        logger.error("xxhash isn't installed, so using md5 contents_hash.")
+        return MD5
+    return requested_contents_hash_format
+
+class ContentsHasher(object):
+    """ Callable that returns the contents_hash of a log given its contents
+    and datetime."""
+
+    def __init__(self, contents_hash_format=MD5, policy=CONTENTS):
+        assert(contents_hash_format in CONTENTS_HASH_FORMATS), "%s is not a contents_hash format" % (contents_hash_format, )
+        assert(policy in CONTENTS_HASH_POLICIES), "%s is not a contents_hash policy" % (policy, )
+        self.contents_hash_format = contents_hash_format
+        self.policy = policy
+        if contents_hash_format == MD5:
+            self._hash = md5
+        else:
+            self._hash = xxh64
+
+    def __call__(self, contents, datetime_obj):
+        if isinstance(contents, unicode):
+            contents = contents.encode("utf-8")
+        if self.policy == CONTENTS_AND_DATETIME:
+            contents = "%s\x00%d" % (contents, datetime_to_epoch_ms(datetime_obj))
+        return self._hash(contents)
+
+    def __repr__(self):
+        return "ContentsHasher(%s, %s)" % (self.contents_hash_format, self.policy)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   One writer for every parser, in place of a parser_tap_to_database per
+#   box and log, each with its own process, database connection and index
+#   builds.
+#
+#   -   Every --refresh_interval seconds ask the service_registry for its
+#       services. Parsers are registered as <host>_<parser name>, and
+#       parser names end with "_parser"; each one's log data go into the
+#       collection of the same name, as robust_ssh_tap's writers do. New
+#       parsers are subscribed to and parsers no longer registered are
+#       dropped, once what we have of theirs is stored or after
+#       INSERT_STOP_SECONDS, when the rest is left in their journal until
+#       they're registered again. --stream adds parsers the
+#       service_registry doesn't know about.
+#   -   Each collection has its own parser_tap_to_database.CollectionWriter,
+#       with its own journal, batches and credits for its parser, so
+#       nothing changes for the parsers or the journals.
+#   -   Every collection shares one database connection, and its pool, and
+#       one BatchInserter of --insert_threads threads. Each collection has at
+#       most one batch in flight, so inserts are taken in turn.
+#   -   Each poll reads at most --max_messages_per_poll messages from each
+#       parser with any, starting with a different parser every time, so a
+#       busy parser can't starve quiet ones.
+#   -   Each collection keeps a filter of the contents_hashes it has stored
+#       recently, seeded from the collection when its Stream is created,
+#       to skip log data it already has; see dedup.
+#   -   Every --stats_interval seconds publish each collection's ingest
+#       metrics on --metrics, as [collection name, JSON].
+#
+#   Enable with 'database_writer: on' in the global config. rill_start then
+#   runs one database_writer and passes --no_writer to robust_ssh_tap.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import json
+import argparse
+import collections
+
+import zmq
+import requests
+
+import database
+import parser_tap_to_database
+from metrics import BatchStatistics, FlowCounters
+import tracing
+
+# ----------------------------------------------------------------------------
+#   Signal handling
+# ----------------------------------------------------------------------------
+import signal
+def soft_handler(signum, frame):
+    logging.debug('Soft stop')
+    sys.exit(1)
+def hard_handler(signum, frame):
+    logging.debug('Hard stop')
+    os._exit(2)
+signal.signal(signal.SIGINT, soft_handler)
+signal.signal(signal.SIGTERM, hard_handler)
+# ----------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Constants.
+# ----------------------------------------------------------------------------
+APP_NAME = "database_writer"
+PARSER_SUFFIX = "_parser"
+# ----------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Logging.
+# ----------------------------------------------------------------------------
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+# ----------------------------------------------------------------------------
+
+def get_args():
+    parser = argparse.ArgumentParser("Subscribe to every parser's ZeroMQ stream of logs, push them into their collections.")
+    parser.add_argument("--service_registry",
+                        dest="service_registry_uri",
+                        metavar="URI",
+                        default=None,
+                        help="service_registry to find parsers with, e.g. http://127.0.0.1:10000.")
+    parser.add_argument("--stream",
+                        dest="streams",
+                        metavar=("COLLECTION", "ZEROMQ_BINDING"),
+                        nargs=2,
+                        action="append",
+                        default=[],
+                        help="A parser's binding we SUBSCRIBE to, and the collection its log data go into. May be given many times.")
+    parser.add_argument("--refresh_interval",
+                        dest="refresh_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=30,
+                        help="Ask the service_registry for parsers this often.")
+    parser.add_argument("--metrics",
+                        dest="metrics_zeromq_binding",
+                        metavar="ZEROMQ_BINDING",
+                        default=None,
+                        help="ZeroMQ binding we PUBLISH each collection's ingest metrics on.")
+    parser.add_argument("--insert_threads",
+                        dest="insert_threads",
+                        metavar="INTEGER",
+                        type=int,
+                        default=4,
+                        help="Number of batches to insert at once, across all collections.")
+    parser.add_argument("--max_messages_per_poll",
+                        dest="max_messages_per_poll",
+                        metavar="INTEGER",
+                        type=int,
+                        default=10,
+                        help="Most messages to read from one parser before moving on to the next.")
+    parser_tap_to_database.add_writer_arguments(parser)
+    parser.add_argument("--verbose",
+                        dest="verbose",
+                        action='store_true',
+                        default=False,
+                        help="Enable verbose debug mode.")
+    args = parser.parse_args()
+    if args.service_registry_uri is None and len(args.streams) == 0:
+        parser.error("give --service_registry, --stream, or both.")
+    return args
+
+def get_parser_bindings(service_registry_uri, logger):
+    """ Returns a dict of collection name to the binding of the parser that
+    fills it, or None if the service_registry can't be reached."""
+    try:
+        r = requests.get("%s/list_of_services" % (service_registry_uri.rstrip("/"), ))
+        r.raise_for_status()
+        services = json.loads(r.text)
+    except (requests.exceptions.RequestException, ValueError):
+        logger.exception("can't get services from %s" % (service_registry_uri, ))
+        return None
+    return dict((name, binding) for (name, binding) in services.iteritems()
+                if name.endswith(PARSER_SUFFIX))
+
+class Stream(object):
+    """ A parser's log data on their way into its collection."""
+
+    def __init__(self, context, collection_name, collection, results_zeromq_binding, inserter, contents_hasher, args):
+        self.collection_name = collection_name
+        self.results_zeromq_binding = results_zeromq_binding
+        self.logger = tracing.get_logger(APP_NAME, collection_name)
+        self.subscription_socket = parser_tap_to_database.get_subscription_socket(context, results_zeromq_binding, args.credit_window)
+        self.credit_granter = parser_tap_to_database.get_credit_granter(context, results_zeromq_binding, args.credit_window, self.logger)
+        self.journal = parser_tap_to_database.get_collection_journal(args, collection_name, self.logger)
+        self.flow_counters = FlowCounters()
+        contents_hash_filter = parser_tap_to_database.get_contents_hash_filter(args, collection_name, collection, self.logger)
+        self.writer = parser_tap_to_database.CollectionWriter(collection,
+                                                              self.journal,
+                                                              self.logger,
+                                                              contents_hasher,
+                                                              self.flow_counters,
+                                                              args.batch_records,
+                                                              args.batch_seconds,
+                                                              args.max_in_memory_records,
+                                                              args.batch_bytes,
+                                                              inserter,
+                                                              contents_hash_filter,
+                                                              args.dedup_trust_filter)
+        self.number_of_bytes = 0
+        self.last_metrics = None
+
+    def receive(self, max_messages):
+        """ Take up to max_messages waiting messages. Returns a two-element
+        tuple (elem1, elem2).
+        -   elem1: number of log data received.
+        -   elem2: number of bytes received."""
+        (number_of_records, number_of_bytes) = (0, 0)
+        for i in xrange(max_messages):
+            try:
+                parts = self.subscription_socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    break
+                raise
+            for incoming_string in parts:
+                self.writer.add(incoming_string)
+            number_of_records += len(parts)
+            number_of_bytes += sum(len(part) for part in parts)
+        if self.credit_granter is not None and number_of_records > 0:
+            self.credit_granter.received(number_of_records)
+        self.number_of_bytes += number_of_bytes
+        return (number_of_records, number_of_bytes)
+
+    def tick(self):
+        """ Everything due that doesn't wait on the parser."""
+        self.writer.insert_if_due()
+        if self.credit_granter is not None:
+            self.credit_granter.grant_if_due()
+        self.writer.sync_if_due()
+        self.flow_counters.queued = len(self.journal)
+
+    def get_metrics(self, interval):
+        """ Ingest metrics, with rates over the last interval seconds."""
+        metrics = {"collection": self.collection_name,
+                   "binding": self.results_zeromq_binding,
+                   "received": self.writer.number_received,
+                   "bytes": self.number_of_bytes,
+                   "inserted": self.writer.number_inserted,
+                   "failed_inserts": self.writer.number_failed_inserts,
+                   "insert_seconds": self.writer.insert_seconds,
+                   "dropped": self.flow_counters.dropped,
+                   "duplicates": self.flow_counters.duplicates,
+                   "false_positives": self.flow_counters.false_positives,
+                   "queued": self.flow_counters.queued,
+                   "in_memory": len(self.writer.queue) + self.writer.number_in_flight}
+        last_metrics = self.last_metrics or dict((key, 0) for key in ["received", "bytes", "inserted"])
+        for key in ["received", "bytes", "inserted"]:
+            metrics["%s_per_second" % (key, )] = (metrics[key] - last_metrics[key]) / float(interval)
+        self.last_metrics = metrics
+        return metrics
+
+    def close(self, flush=False):
+        """ If flush, first store everything received, waiting up to
+        INSERT_STOP_SECONDS. Whatever isn't stored stays in the journal."""
+        if flush and not self.writer.flush(timeout=parser_tap_to_database.INSERT_STOP_SECONDS):
+            self.logger.warning("%s log data not stored, left in the journal." % (len(self.journal), ))
+        self.writer.close(timeout=parser_tap_to_database.INSERT_STOP_SECONDS)
+        self.journal.close()
+        self.subscription_socket.close(linger=0)
+        if self.credit_granter is not None:
+            self.credit_granter.credit_socket.close(linger=0)
+
+def refresh_streams(context, db, poller, streams, parser_bindings, inserter, contents_hasher, args, logger):
+    """ Subscribe to parsers we don't have a Stream for yet, and close the
+    Streams of parsers that have gone or moved."""
+    for (collection_name, stream) in streams.items():
+        if parser_bindings.get(collection_name) == stream.results_zeromq_binding:
+            continue
+        logger.info("%s: no longer at %s, closing." % (collection_name, stream.results_zeromq_binding))
+        poller.unregister(stream.subscription_socket)
+        stream.close(flush=True)
+        del streams[collection_name]
+    for (collection_name, results_zeromq_binding) in sorted(parser_bindings.iteritems()):
+        if collection_name in streams:
+            continue
+        collection = parser_tap_to_database.setup_database(collection_name, db, args.partitioned)
+        if collection is None:
+            logger.error("%s: can't set up collection, will try again." % (collection_name, ))
+            continue
+        logger.info("%s: subscribing to %s." % (collection_name, results_zeromq_binding))
+        stream = Stream(context, collection_name, collection, results_zeromq_binding, inserter, contents_hasher, args)
+        poller.register(stream.subscription_socket, zmq.POLLIN)
+        streams[collection_name] = stream
+
+def publish_metrics(metrics_socket, streams, interval):
+    for (collection_name, stream) in sorted(streams.iteritems()):
+        metrics_socket.send_multipart([str(collection_name), json.dumps(stream.get_metrics(interval))])
+
+def main():
+    args = get_args()
+    logger = tracing.get_logger(APP_NAME, "main")
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+        tracing.enable(APP_NAME)
+        logger.debug("Verbose logging enabled.")
+    logger.debug("entry.")
+    tracing.install_signal_handler()
+    contents_hasher = parser_tap_to_database.get_contents_hasher(args, logger)
+    db = database.Database(logger=logger)
+    inserter = parser_tap_to_database.BatchInserter(logger, args.insert_threads)
+
+    context = zmq.Context(1)
+    metrics_socket = None
+    if args.metrics_zeromq_binding is not None:
+        metrics_socket = context.socket(zmq.PUB)
+        metrics_socket.bind(args.metrics_zeromq_binding)
+
+    poller = zmq.Poller()
+    poll_interval = 1000
+    streams = {}
+    # Rotated every poll, so that each parser takes its turn to be read first.
+    stream_order = collections.deque()
+    static_bindings = dict(args.streams)
+    last_refresh_time = None
+    last_metrics_time = time.time()
+    batch_statistics = BatchStatistics(logger, args.stats_interval)
+    try:
+        while 1:
+            time_now = time.time()
+            if last_refresh_time is None or (time_now - last_refresh_time) >= args.refresh_interval:
+                parser_bindings = dict(static_bindings)
+                if args.service_registry_uri is not None:
+                    registered_bindings = get_parser_bindings(args.service_registry_uri, logger)
+                    if registered_bindings is None:
+                        # Keep what we have until the service_registry's back.
+                        registered_bindings = dict((collection_name, stream.results_zeromq_binding)
+                                                   for (collection_name, stream) in streams.iteritems())
+                    parser_bindings.update(registered_bindings)
+                refresh_streams(context, db, poller, streams, parser_bindings, inserter, contents_hasher, args, logger)
+                stream_order = collections.deque(streams.itervalues())
+                last_refresh_time = time_now
+
+            socks = tracing.poll(poller, poll_interval)
+            stream_order.rotate(-1)
+            for stream in stream_order:
+                if socks.get(stream.subscription_socket, None) == zmq.POLLIN:
+                    batch_start_time = time.time()
+                    (number_of_records, number_of_bytes) = stream.receive(args.max_messages_per_poll)
+                    batch_statistics.add_batch(1, number_of_bytes, number_of_records, time.time() - batch_start_time)
+            for stream in stream_order:
+                stream.tick()
+            batch_statistics.flow_counters.queued = sum(stream.flow_counters.queued for stream in stream_order)
+            batch_statistics.flow_counters.dropped = sum(stream.flow_counters.dropped for stream in stream_order)
+            batch_statistics.flow_counters.duplicates = sum(stream.flow_counters.duplicates for stream in stream_order)
+            batch_statistics.flow_counters.false_positives = sum(stream.flow_counters.false_positives for stream in stream_order)
+            batch_statistics.report_if_due()
+
+            time_now = time.time()
+            if metrics_socket is not None and (time_now - last_metrics_time) >= args.stats_interval:
+                publish_metrics(metrics_socket, streams, time_now - last_metrics_time)
+                last_metrics_time = time_now
+
+    except KeyboardInterrupt:
+        logger.debug("CTRL-C")
+    finally:
+        logger.debug("exiting")
+        for stream in streams.itervalues():
+            stream.close()
+        inserter.stop(timeout=parser_tap_to_database.INSERT_STOP_SECONDS)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Which contents_hashes a collection has stored recently, so that a writer
+#   can skip the log data we've stored before, e.g. everything again after
+#   a tail -f restarts or reconcile_log cats a whole log file, without an
+#   insert and a unique index violation each.
+#
+#   A Bloom filter never says a contents_hash it was given is missing, but
+#   says one it wasn't given is there at error_rate. So "maybe stored" has to
+#   be checked against the collection, or trusted at the cost of losing a
+#   log datum now and then.
+#
+#   ContentsHashFilter keeps two Bloom filters, each of up to capacity
+#   contents_hashes. Once the current one is full it becomes the previous
+#   one, and the old previous one is forgotten. So it holds between
+#   capacity and twice capacity of the most recent contents_hashes, and its
+#   error rate never grows past twice error_rate.
+#
+#   Saved as a header, then each filter's bits:
+#
+#   -   "RLBF", format version, bits and hash functions per filter,
+#       capacity, epoch seconds when saved, and each filter's count.
+# ----------------------------------------------------------------------------
+
+import os
+import math
+import time
+import struct
+import hashlib
+import tempfile
+
+import bson
+
+APP_NAME = "dedup"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+DEFAULT_DEDUP_DIRECTORY = os.path.join(tempfile.gettempdir(), "rill_dedup")
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.001
+FILTER_EXTENSION = ".bloom"
+
+FILTER_MAGIC = "RLBF"
+FILTER_VERSION = 1
+FILTER_HEADER = struct.Struct(">4sIQIQdQQ")
+HASH_PAIR = struct.Struct("<QQ")
+
+def get_positions(contents_hash, number_of_bits, number_of_hashes):
+    """ The number_of_hashes bit positions of a contents_hash, MD5 string or
+    xxh64 integer.
+
+    Kirsch and Mitzenmacher: positions h1 + i * h2 from two independent
+    hashes are as good as number_of_hashes hashes. Both come from one MD5, so
+    whatever the contents_hash format they're evenly spread. Reducing them
+    first keeps the arithmetic in machine integers."""
+    (h1, h2) = HASH_PAIR.unpack(hashlib.md5(str(contents_hash)).digest())
+    h1 %= number_of_bits
+    h2 %= number_of_bits
+    positions = []
+    for i in xrange(number_of_hashes):
+        positions.append(h1)
+        h1 += h2
+        if h1 >= number_of_bits:
+            h1 -= number_of_bits
+    return positions
+
+class BloomFilter(object):
+    def __init__(self, number_of_bits, number_of_hashes, bits=None, count=0):
+        self.number_of_bits = number_of_bits
+        self.number_of_hashes = number_of_hashes
+        if bits is None:
+            bits = bytearray((number_of_bits + 7) // 8)
+        self.bits = bits
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """ Smallest filter that holds capacity items at error_rate."""
+        number_of_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        number_of_hashes = max(1, int(round(number_of_bits * math.log(2) / capacity)))
+        return cls(number_of_bits, number_of_hashes)
+
+    def add(self, positions):
+        bits = self.bits
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def has(self, positions):
+        bits = self.bits
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class ContentsHashFilter(object):
+    """ The most recent contents_hashes a collection has stored. See the top
+    of this module."""
+
+    def __init__(self, filepath, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.filepath = filepath
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter.for_capacity(capacity, error_rate)
+        self.previous = BloomFilter(self.current.number_of_bits, self.current.number_of_hashes)
+        # Epoch seconds this was last saved or loaded.
+        self.saved_time = None
+
+    def __len__(self):
+        return self.current.count + self.previous.count
+
+    def get_positions(self, contents_hash):
+        # Both filters are the same size, so the positions are the same in
+        # each.
+        return get_positions(contents_hash, self.current.number_of_bits, self.current.number_of_hashes)
+
+    def add(self, contents_hash):
+        if self.current.count >= self.capacity:
+            self.previous = self.current
+            self.current = BloomFilter(self.previous.number_of_bits, self.previous.number_of_hashes)
+        self.current.add(self.get_positions(contents_hash))
+
+    def __contains__(self, contents_hash):
+        positions = self.get_positions(contents_hash)
+        return self.current.has(positions) or self.previous.has(positions)
+
+    def save(self):
+        """ Write to filepath, replacing it atomically."""
+        filepath = self.filepath
+        directory = os.path.dirname(filepath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        saved_time = time.time()
+        temporary_filepath = filepath + ".tmp"
+        with open(temporary_filepath, "wb") as f:
+            f.write(FILTER_HEADER.pack(FILTER_MAGIC,
+                                       FILTER_VERSION,
+                                       self.current.number_of_bits,
+                                       self.current.number_of_hashes,
+                                       self.capacity,
+                                       saved_time,
+                                       self.current.count,
+                                       self.previous.count))
+            f.write(self.current.bits)
+            f.write(self.previous.bits)
+        if os.name == "nt" and os.path.isfile(filepath):
+            os.remove(filepath)
+        os.rename(temporary_filepath, filepath)
+        self.saved_time = saved_time
+
+    @classmethod
+    def load(cls, filepath, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, logger=logger):
+        """ Returns the filter saved at filepath, or None if there isn't one,
+        it's unreadable, or it was sized for a different capacity or
+        error_rate."""
+        if not os.path.isfile(filepath):
+            return None
+        contents_hash_filter = cls(filepath, capacity, error_rate)
+        with open(filepath, "rb") as f:
+            header = f.read(FILTER_HEADER.size)
+            if len(header) != FILTER_HEADER.size:
+                logger.error("%s: truncated header, ignoring it." % (filepath, ))
+                return None
+            (magic, version, number_of_bits, number_of_hashes, saved_capacity, saved_time, current_count, previous_count) = FILTER_HEADER.unpack(header)
+            if magic != FILTER_MAGIC or version != FILTER_VERSION:
+                logger.error("%s: not a version %s filter, ignoring it." % (filepath, FILTER_VERSION))
+                return None
+            if number_of_bits != contents_hash_filter.current.number_of_bits or \
+               number_of_hashes != contents_hash_filter.current.number_of_hashes or \
+               saved_capacity != capacity:
+                logger.info("%s: sized for a different capacity or error rate, ignoring it." % (filepath, ))
+                return None
+            number_of_bytes = len(contents_hash_filter.current.bits)
+            current_bits = bytearray(f.read(number_of_bytes))
+            previous_bits = bytearray(f.read(number_of_bytes))
+        if len(current_bits) != number_of_bytes or len(previous_bits) != number_of_bytes:
+            logger.error("%s: truncated, ignoring it." % (filepath, ))
+            return None
+        contents_hash_filter.current = BloomFilter(number_of_bits, number_of_hashes, current_bits, current_count)
+        contents_hash_filter.previous = BloomFilter(number_of_bits, number_of_hashes, previous_bits, previous_count)
+        contents_hash_filter.saved_time = saved_time
+        return contents_hash_filter
+
+    def seed(self, collection, since=None, stored_since=None):
+        """ Add the contents_hashes of the most recent log data in collection,
+        up to capacity of them, either with a datetime since the datetime
+        since or, if stored_since is given, inserted since the datetime
+        stored_since, whatever their datetime. Returns how many were
+        added."""
+        if stored_since is not None:
+            # _id starts with the time it was inserted.
+            spec = {"_id": {"$gte": bson.ObjectId.from_datetime(stored_since)}}
+            (sort_key, fields) = ("_id", {"contents_hash": 1})
+        else:
+            spec = {"datetime": {"$gte": since}}
+            (sort_key, fields) = ("datetime", {"contents_hash": 1, "datetime": 1, "_id": 0})
+        cursor = collection.find(spec, fields)
+        cursor = cursor.sort(sort_key, -1).limit(self.capacity).batch_size(10000)
+        contents_hashes = [row["contents_hash"] for row in cursor if "contents_hash" in row]
+        # Oldest first, as if we'd stored them ourselves.
+        for contents_hash in reversed(contents_hashes):
+            self.add(contents_hash)
+        return len(contents_hashes)
@@ -10,6 +10,8 @@
 import os
 import sys
 import database
+import tracing
+import partitions
 import datetime
 import pdb
 import time
@@ -85,7 +87,7 @@ def parse_args():
     return (args, parser)
 
 def main():
-    logger = logging.getLogger("%s.main" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "main")
     logger.debug("entry.")
 
     # ------------------------------------------------------------------------
@@ -94,9 +96,9 @@ def main():
     database_name = "logs"
     top_db = database.Database(database_name = database_name)
     read_database = top_db.read_database
-    collection_names = [str(elem) for elem in sorted(read_database.collection_names())]
-    if "system.indexes" in collection_names:
-        collection_names.remove("system.indexes")
+    # A day-partitioned stream is one name, and only its partitions in the
+    # interval are read.
+    collection_names = [str(elem) for elem in partitions.get_stream_names(read_database.collection_names())]
     datetime_query_string = "datetime"
     # ------------------------------------------------------------------------
 
@@ -119,7 +121,8 @@ def main():
     # ------------------------------------------------------------------------
     oldest_date = datetime.datetime.utcnow() - INTERVAL
     newest_date = datetime.datetime.utcnow()
-    collections = [read_database[collection_name] for collection_name in collection_names if re.search(args.collection_name, collection_name)]
+    collections = [partitions.PartitionedCollection(read_database, collection_name)
+                   for collection_name in collection_names if re.search(args.collection_name, collection_name)]
     for collection in collections:
         collection.ensure_index([(datetime_query_string, -1)],
                                 background = True)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Credit-based flow control between a parser and the writer that stores
+#   what it publishes, parser_tap_to_database.
+#
+#   A PUB socket drops messages once a subscriber falls HWM messages
+#   behind, and says nothing about it. Instead the writer grants the parser
+#   credits, one per log record it has room for, and the parser only
+#   publishes as many records as it has credits:
+#
+#   -   the parser binds a PULL socket on its PUB binding's port plus
+#       CREDIT_PORT_OFFSET. The writer connects a PUSH socket to it and
+#       sends {"credits": n, "window": window} as JSON.
+#   -   the writer keeps at most 'window' credits outstanding. It grants
+#       more as it receives records, and tops the parser back up to the
+#       window if it hasn't received anything for STALE_CREDIT_SECONDS, in
+#       case the parser restarted and lost its credits. The parser never
+#       holds more than the window.
+#   -   records the parser has no credits for are held in memory, up to
+#       max_queued_records, then spilled to a file, up to max_spill_bytes
+#       not yet published, and published in order as credits arrive. Only
+#       when the spill file is full are records dropped, and counted. Once
+#       SPILL_COMPACT_BYTES of the file have been published, and at least
+#       as much as is left, what's left is moved to the start of the file,
+#       so that under a sustained backlog the file stays bounded too.
+#   -   until a parser receives its first credits it publishes freely, as
+#       before, so it still works with writers that don't grant credits.
+#
+#   Other subscribers, e.g. the web server's real time stream, aren't
+#   credited and may still miss records if they fall behind.
+#
+#   The spill file outlives the parser, so records spilled before a
+#   restart are published after it. The writer's unique index on
+#   contents_hash drops any that were published twice.
+#
+#   Only one publisher may use a spill file at a time. Each holds an
+#   exclusive lock on it, and a second one fails to start rather than
+#   publish and truncate the first's records.
+# ----------------------------------------------------------------------------
+
+import os
+import json
+import time
+import struct
+import tempfile
+import collections
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import zmq
+
+APP_NAME = "flow_control"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+CREDIT_PORT_OFFSET = 1
+DEFAULT_CREDIT_WINDOW = 10000
+DEFAULT_MAX_QUEUED_RECORDS = 10000
+DEFAULT_MAX_SPILL_BYTES = 1024 * 1024 * 1024
+DEFAULT_SPILL_DIRECTORY = os.path.join(tempfile.gettempdir(), "rill_spill")
+GRANT_INTERVAL = 1.0
+STALE_CREDIT_SECONDS = 10.0
+CREDIT_HWM = 100
+MAX_PARTS_PER_MESSAGE = 1000
+SPILL_COMPACT_BYTES = 16 * 1024 * 1024
+SPILL_COPY_BYTES = 1024 * 1024
+SPILL_LOCK_EXTENSION = ".lock"
+
+FRAME_HEADER = struct.Struct(">I")
+
+def set_hwm(socket, hwm):
+    """ Set a socket's high water mark. libzmq 2 has HWM, libzmq 3 and
+    later SNDHWM and RCVHWM instead."""
+    if hasattr(zmq, "HWM"):
+        try:
+            socket.setsockopt(zmq.HWM, hwm)
+            return
+        except zmq.ZMQError:
+            pass
+    socket.setsockopt(zmq.SNDHWM, hwm)
+    socket.setsockopt(zmq.RCVHWM, hwm)
+
+def get_credit_binding(zeromq_binding):
+    """ Given a parser's PUB binding, e.g. "tcp://0.0.0.0:5000", return the
+    binding of its credit socket, e.g. "tcp://0.0.0.0:5001"."""
+    (prefix, port) = zeromq_binding.rsplit(":", 1)
+    return "%s:%s" % (prefix, int(port) + CREDIT_PORT_OFFSET)
+
+def get_credit_pull_socket(context, parser_zeromq_binding):
+    """ PULL credits from the writer, for a parser."""
+    credit_socket = context.socket(zmq.PULL)
+    set_hwm(credit_socket, CREDIT_HWM)
+    credit_socket.bind(get_credit_binding(parser_zeromq_binding))
+    return credit_socket
+
+def get_credit_push_socket(context, parser_zeromq_binding):
+    """ PUSH credits to a parser, for the writer. Grants aren't kept for a
+    parser that isn't there."""
+    credit_socket = context.socket(zmq.PUSH)
+    set_hwm(credit_socket, CREDIT_HWM)
+    credit_socket.setsockopt(zmq.LINGER, 0)
+    credit_socket.connect(get_credit_binding(parser_zeromq_binding))
+    return credit_socket
+
+def get_spill_filepath(spill_directory, box_name):
+    if not os.path.isdir(spill_directory):
+        os.makedirs(spill_directory)
+    return os.path.join(spill_directory, "%s.spill" % (box_name, ))
+
+class SpillFile(object):
+    """ First in, first out queue of strings in a file, each one a 4-byte
+    big-endian length then the string. Once everything in the file has
+    been read it's truncated, and once SPILL_COMPACT_BYTES have been read,
+    and no less than is unread, the unread strings are moved to the start
+    of the file. Anything left in the file when it's opened is read first,
+    less any string that was only partly written.
+
+    The file is locked, where fcntl is available, until it's closed. The
+    lock is on a file beside it, as compacting replaces the file itself.
+    Raises IOError if another SpillFile has it open."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock_file = self.lock(filepath + SPILL_LOCK_EXTENSION)
+        self.write_file = open(filepath, "ab")
+        self.read_file = open(filepath, "rb")
+        file_size = os.path.getsize(filepath)
+        self.bytes = 0
+        self.count = 0
+        while self.bytes + FRAME_HEADER.size <= file_size:
+            (length, ) = FRAME_HEADER.unpack(self.read_file.read(FRAME_HEADER.size))
+            if self.bytes + FRAME_HEADER.size + length > file_size:
+                break
+            self.read_file.seek(length, os.SEEK_CUR)
+            self.bytes += FRAME_HEADER.size + length
+            self.count += 1
+        if self.bytes < file_size:
+            self.write_file.truncate(self.bytes)
+        self.read_offset = 0
+
+    @staticmethod
+    def lock(lock_filepath):
+        lock_file = open(lock_filepath, "a")
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, e:
+            lock_file.close()
+            raise IOError(e.errno, "spill file %s is in use by another publisher" % (lock_filepath[:-len(SPILL_LOCK_EXTENSION)], ))
+        return lock_file
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def unread_bytes(self):
+        return self.bytes - self.read_offset
+
+    def append(self, frame):
+        self.write_file.write(FRAME_HEADER.pack(len(frame)))
+        self.write_file.write(frame)
+        self.bytes += FRAME_HEADER.size + len(frame)
+        self.count += 1
+
+    def popleft(self):
+        if self.count == 0:
+            return None
+        self.write_file.flush()
+        self.read_file.seek(self.read_offset)
+        (length, ) = FRAME_HEADER.unpack(self.read_file.read(FRAME_HEADER.size))
+        frame = self.read_file.read(length)
+        self.read_offset += FRAME_HEADER.size + length
+        self.count -= 1
+        if self.count == 0:
+            self.write_file.truncate(0)
+            self.read_offset = 0
+            self.bytes = 0
+        elif self.read_offset >= SPILL_COMPACT_BYTES and self.read_offset >= self.unread_bytes:
+            self.compact()
+        return frame
+
+    def compact(self):
+        """ Move the unread strings to the start of the file, replacing it
+        atomically."""
+        self.write_file.flush()
+        temporary_filepath = self.filepath + ".tmp"
+        self.read_file.seek(self.read_offset)
+        with open(temporary_filepath, "wb") as f:
+            remaining_bytes = self.unread_bytes
+            while remaining_bytes > 0:
+                block = self.read_file.read(min(remaining_bytes, SPILL_COPY_BYTES))
+                f.write(block)
+                remaining_bytes -= len(block)
+        self.write_file.close()
+        self.read_file.close()
+        if os.name == "nt" and os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+        os.rename(temporary_filepath, self.filepath)
+        self.write_file = open(self.filepath, "ab")
+        self.read_file = open(self.filepath, "rb")
+        self.bytes = self.unread_bytes
+        self.read_offset = 0
+
+    def close(self):
+        self.write_file.close()
+        self.read_file.close()
+        self.lock_file.close()
+
+class CreditedPublisher(object):
+    """ Stands in for a parser's PUB socket, publishing only as many log
+    records as the writer has granted credits for and holding the rest.
+
+    Call pump() regularly, e.g. on every poll, to receive credits and
+    publish held records when the parser has nothing new to publish.
+
+    queued, spilled and dropped are kept in flow_counters, a
+    metrics.FlowCounters."""
+
+    def __init__(self, publish_socket, credit_socket, flow_counters, spill_filepath, max_queued_records=DEFAULT_MAX_QUEUED_RECORDS, max_spill_bytes=DEFAULT_MAX_SPILL_BYTES, logger=logger):
+        self.publish_socket = publish_socket
+        self.credit_socket = credit_socket
+        self.flow_counters = flow_counters
+        self.max_queued_records = max_queued_records
+        self.max_spill_bytes = max_spill_bytes
+        self.logger = logger
+
+        # None until the first grant, when we start counting credits.
+        self.credits = None
+        self.queue = collections.deque()
+        self.held = 0
+        self.spill_file = SpillFile(spill_filepath)
+        if len(self.spill_file) > 0:
+            logger.info("%s records spilled before a restart in %s" % (len(self.spill_file), spill_filepath))
+        self.update_queued()
+
+    @property
+    def is_credited(self):
+        return self.credits is not None
+
+    def receive_credits(self):
+        while 1:
+            try:
+                message = self.credit_socket.recv(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    break
+                raise
+            try:
+                grant = json.loads(message)
+                (credits, window) = (int(grant["credits"]), int(grant["window"]))
+            except (ValueError, KeyError, TypeError):
+                self.logger.error("Not a valid credit grant: %r" % (message, ))
+                continue
+            if self.credits is None:
+                self.logger.info("writer granted credits, window %s" % (window, ))
+                self.credits = 0
+            self.credits = min(self.credits + credits, window)
+
+    def send_multipart(self, parts):
+        """ Publish the parts, one encoded log record each, as far as credits
+        allow, behind any that are already held, and hold the rest."""
+        self.receive_credits()
+        self.publish_held()
+        if len(self.queue) == 0 and len(self.spill_file) == 0:
+            sendable = len(parts) if self.credits is None else min(len(parts), self.credits)
+            self.send(parts[:sendable])
+            parts = parts[sendable:]
+        for part in parts:
+            self.hold(part)
+        self.update_queued()
+
+    def pump(self):
+        """ Receive any credits and publish held records with them. Returns
+        the number of records published."""
+        self.receive_credits()
+        number_of_records = self.publish_held()
+        self.update_queued()
+        return number_of_records
+
+    def send(self, parts):
+        if len(parts) == 0:
+            return
+        self.publish_socket.send_multipart(parts)
+        if self.credits is not None:
+            self.credits -= len(parts)
+
+    def hold(self, part):
+        """ Queue a record in memory, or once that's full or while older
+        records are spilled, in the spill file. Drop it if that's full
+        too."""
+        if len(self.spill_file) == 0 and len(self.queue) < self.max_queued_records:
+            self.queue.append(part)
+            return
+        if self.spill_file.unread_bytes + FRAME_HEADER.size + len(part) > self.max_spill_bytes:
+            if self.flow_counters.dropped % 10000 == 0:
+                self.logger.error("spill file %s full, dropping records. %s dropped so far." % \
+                                  (self.spill_file.filepath, self.flow_counters.dropped))
+            self.flow_counters.dropped += 1
+            return
+        if len(self.spill_file) == 0:
+            self.logger.warning("writer is behind, spilling records to %s" % (self.spill_file.filepath, ))
+        self.spill_file.append(part)
+        self.flow_counters.spilled += 1
+
+    def publish_held(self):
+        """ Publish held records, oldest first, as far as credits allow."""
+        number_of_records = 0
+        while len(self.queue) > 0 or len(self.spill_file) > 0:
+            if self.credits is None:
+                available = MAX_PARTS_PER_MESSAGE
+            else:
+                available = min(self.credits, MAX_PARTS_PER_MESSAGE)
+            if available <= 0:
+                break
+            parts = []
+            while len(parts) < available and len(self.queue) > 0:
+                parts.append(self.queue.popleft())
+            while len(parts) < available and len(self.spill_file) > 0:
+                parts.append(self.spill_file.popleft())
+            self.send(parts)
+            number_of_records += len(parts)
+        return number_of_records
+
+    def update_queued(self):
+        # flow_counters may be shared by several streams' publishers, so
+        # add what's changed rather than set it.
+        held = len(self.queue) + len(self.spill_file)
+        self.flow_counters.queued += held - self.held
+        self.held = held
+
+class CreditGranter(object):
+    """ The writer's side: grants a parser credits for up to 'window'
+    records at a time."""
+
+    def __init__(self, credit_socket, window=DEFAULT_CREDIT_WINDOW, logger=logger):
+        self.credit_socket = credit_socket
+        self.window = window
+        self.logger = logger
+
+        # Credits granted whose records haven't arrived yet.
+        self.outstanding = 0
+        self.last_receive_time = time.time()
+        self.last_grant_time = None
+
+    def received(self, number_of_records, time_now=None):
+        if time_now is None:
+            time_now = time.time()
+        self.outstanding = max(0, self.outstanding - number_of_records)
+        self.last_receive_time = time_now
+        self.grant_if_due(time_now)
+
+    def grant_if_due(self, time_now=None):
+        """ Grant credits up to the window, in lumps of at least a quarter of
+        it, or whatever's due every GRANT_INTERVAL seconds."""
+        if time_now is None:
+            time_now = time.time()
+        if self.outstanding > 0 and (time_now - self.last_receive_time) >= STALE_CREDIT_SECONDS:
+            # Either the stream is quiet or the parser restarted and lost
+            # its credits. Top it up; it never holds more than the window.
+            self.outstanding = 0
+            self.last_receive_time = time_now
+        credits = self.window - self.outstanding
+        if credits <= 0:
+            return 0
+        is_interval_due = self.last_grant_time is None or (time_now - self.last_grant_time) >= GRANT_INTERVAL
+        if credits < self.window / 4 and not is_interval_due:
+            return 0
+        try:
+            self.credit_socket.send(json.dumps({"credits": credits, "window": self.window}), zmq.NOBLOCK)
+        except zmq.ZMQError, e:
+            # No parser to take it. We'll grant again later.
+            if e.errno == zmq.EAGAIN:
+                return 0
+            raise
+        self.outstanding += credits
+        self.last_grant_time = time_now
+        return credits
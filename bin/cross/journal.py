@@ -0,0 +1,247 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   An append-only journal of records in memory-mapped segment files, for
+#   parser_tap_to_database to keep what it has received until the database
+#   has acknowledged storing it.
+#
+#   -   append() gives each record the next sequence number and copies it
+#       into the current segment. Writes to a shared mapping belong to the
+#       kernel as soon as they're made, so a record outlives the process
+#       being killed, even by os._exit(). sync() flushes them to disk, to
+#       outlive the box too.
+#   -   acknowledge(sequence) marks every record up to sequence as stored
+#       and deletes segments with nothing else in them.
+#   -   read(from_sequence) returns unacknowledged records in order, e.g.
+#       on startup to replay what was never stored.
+#
+#   A directory holds one journal:
+#
+#   -   <first sequence>.journal, the segments. Each is created at
+#       segment_bytes, or bigger for a bigger record, and filled with
+#       records of a 16-byte header, length, CRC32 of the record and
+#       sequence, then the record. The header is written after the
+#       record, so a zeroed header, or one that doesn't check out, is the
+#       end of the segment.
+#   -   acknowledged, the last acknowledged sequence, replaced atomically.
+# ----------------------------------------------------------------------------
+
+import os
+import mmap
+import zlib
+import struct
+import tempfile
+
+APP_NAME = "journal"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+DEFAULT_JOURNAL_DIRECTORY = os.path.join(tempfile.gettempdir(), "rill_journal")
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_EXTENSION = ".journal"
+ACKNOWLEDGED_FILENAME = "acknowledged"
+
+RECORD_HEADER = struct.Struct(">IIQ")
+
+def get_crc(record):
+    return zlib.crc32(record) & 0xffffffff
+
+class JournalSegment(object):
+    """ One memory-mapped segment file, starting at first_sequence."""
+
+    def __init__(self, filepath, first_sequence, size=None):
+        self.filepath = filepath
+        self.first_sequence = first_sequence
+        if size is not None:
+            with open(filepath, "wb") as f:
+                f.truncate(size)
+        self.file = open(filepath, "r+b")
+        self.size = os.path.getsize(filepath)
+        self.mmap = mmap.mmap(self.file.fileno(), self.size)
+        self.is_dirty = False
+        self.read_cursor = (first_sequence, 0)
+
+        # Find the end of what's been written, and check it as we go.
+        self.count = 0
+        self.end_offset = 0
+        while self.end_offset + RECORD_HEADER.size <= self.size:
+            (length, crc, sequence) = RECORD_HEADER.unpack_from(self.mmap, self.end_offset)
+            if length == 0:
+                break
+            start = self.end_offset + RECORD_HEADER.size
+            if start + length > self.size or \
+               sequence != first_sequence + self.count or \
+               get_crc(self.mmap[start:start + length]) != crc:
+                logger.error("%s: torn record at offset %s, ignoring it." % (filepath, self.end_offset))
+                self.mmap[self.end_offset:self.end_offset + RECORD_HEADER.size] = "\0" * RECORD_HEADER.size
+                break
+            self.end_offset = start + length
+            self.count += 1
+
+    @property
+    def last_sequence(self):
+        """ Sequence of the last record, or first_sequence - 1 if there are
+        none."""
+        return self.first_sequence + self.count - 1
+
+    def has_room(self, record):
+        return self.end_offset + RECORD_HEADER.size + len(record) <= self.size
+
+    def append(self, record):
+        start = self.end_offset + RECORD_HEADER.size
+        self.mmap[start:start + len(record)] = record
+        RECORD_HEADER.pack_into(self.mmap, self.end_offset, len(record), get_crc(record), self.first_sequence + self.count)
+        self.end_offset = start + len(record)
+        self.count += 1
+        self.is_dirty = True
+
+    def read(self, from_sequence, max_records):
+        """ Returns a list of (sequence, record) from from_sequence on."""
+        records = []
+        # Reads usually carry on from the last one, so start there rather
+        # than at the top of the segment.
+        (sequence, offset) = self.read_cursor
+        if from_sequence < sequence:
+            (sequence, offset) = (self.first_sequence, 0)
+        while offset < self.end_offset and len(records) < max_records:
+            (length, crc, sequence) = RECORD_HEADER.unpack_from(self.mmap, offset)
+            start = offset + RECORD_HEADER.size
+            if sequence >= from_sequence:
+                records.append((sequence, self.mmap[start:start + length]))
+            offset = start + length
+            self.read_cursor = (sequence + 1, offset)
+        return records
+
+    def sync(self):
+        if self.is_dirty:
+            self.mmap.flush()
+            self.is_dirty = False
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.filepath)
+
+class SegmentJournal(object):
+    """ The journal in a directory. See the top of this module."""
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, logger=logger):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.logger = logger
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.acknowledged = 0
+        acknowledged_filepath = os.path.join(directory, ACKNOWLEDGED_FILENAME)
+        if os.path.isfile(acknowledged_filepath):
+            with open(acknowledged_filepath) as f:
+                self.acknowledged = int(f.read().strip() or 0)
+
+        self.segments = []
+        filenames = [filename for filename in os.listdir(directory) if filename.endswith(SEGMENT_EXTENSION)]
+        for filename in sorted(filenames, key=lambda filename: int(filename[:-len(SEGMENT_EXTENSION)])):
+            first_sequence = int(filename[:-len(SEGMENT_EXTENSION)])
+            filepath = os.path.join(directory, filename)
+            if os.path.getsize(filepath) == 0:
+                # Never got as far as being sized, so nothing in it.
+                os.remove(filepath)
+                continue
+            segment = JournalSegment(filepath, first_sequence)
+            if len(self.segments) > 0 and first_sequence != self.segments[-1].last_sequence + 1:
+                # Only the last segment can be torn. Anything after a gap
+                # was never followed on from, so can't be trusted.
+                logger.error("%s: doesn't follow on from %s, deleting it." % (segment.filepath, self.segments[-1].filepath))
+                segment.delete()
+                continue
+            self.segments.append(segment)
+        self.trim()
+        if len(self.segments) > 0:
+            self.next_sequence = max(self.segments[-1].last_sequence, self.acknowledged) + 1
+        else:
+            self.next_sequence = self.acknowledged + 1
+        if len(self) > 0:
+            logger.info("%s: %s unacknowledged records from sequence %s." % (directory, len(self), self.acknowledged + 1))
+
+    def __len__(self):
+        """ Number of unacknowledged records."""
+        return self.next_sequence - 1 - self.acknowledged
+
+    @property
+    def bytes(self):
+        return sum(segment.end_offset for segment in self.segments)
+
+    def append(self, record):
+        """ Append a record and return its sequence number."""
+        if len(self.segments) == 0 or not self.segments[-1].has_room(record):
+            if len(self.segments) > 0:
+                self.segments[-1].sync()
+            filepath = os.path.join(self.directory, "%020d%s" % (self.next_sequence, SEGMENT_EXTENSION))
+            size = max(self.segment_bytes, RECORD_HEADER.size + len(record))
+            self.segments.append(JournalSegment(filepath, self.next_sequence, size))
+        self.segments[-1].append(record)
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        return sequence
+
+    def acknowledge(self, sequence):
+        """ Every record up to and including sequence has been stored."""
+        if sequence <= self.acknowledged:
+            return
+        self.acknowledged = sequence
+        acknowledged_filepath = os.path.join(self.directory, ACKNOWLEDGED_FILENAME)
+        temporary_filepath = acknowledged_filepath + ".tmp"
+        with open(temporary_filepath, "w") as f:
+            f.write("%s\n" % (sequence, ))
+        if os.name == "nt" and os.path.isfile(acknowledged_filepath):
+            os.remove(acknowledged_filepath)
+        os.rename(temporary_filepath, acknowledged_filepath)
+        self.trim()
+
+    def trim(self):
+        """ Delete segments whose records have all been acknowledged."""
+        while len(self.segments) > 0 and self.segments[0].last_sequence <= self.acknowledged:
+            segment = self.segments.pop(0)
+            if segment.count > 0 or len(self.segments) > 0:
+                segment.delete()
+            else:
+                # Nothing in it yet; keep appending to it.
+                self.segments.append(segment)
+                break
+
+    def read(self, from_sequence, max_records):
+        """ Returns a list of up to max_records (sequence, record), in order,
+        from from_sequence on."""
+        records = []
+        for segment in self.segments:
+            if len(records) >= max_records:
+                break
+            if segment.last_sequence < from_sequence:
+                continue
+            records.extend(segment.read(from_sequence, max_records - len(records)))
+        return records
+
+    def sync(self):
+        if len(self.segments) > 0:
+            self.segments[-1].sync()
+
+    def close(self):
+        self.sync()
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
@@ -0,0 +1,84 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Memoizing keyword extraction for the parsers.
+#
+#   Our logs repeat the same messages thousands of times an hour, with only
+#   the numbers, addresses and ids changing. So rather than caching on the
+#   exact body, mask out every run of hex digits that contains a digit,
+#   replacing each character with "0", and cache where the tokens are in
+#   the body. The masked characters are all word characters, as is "0", so
+#   the analyzer splits a body into tokens at exactly the same places as its
+#   masked version. Tokens with masked characters have digits in them, so
+#   they're never stop words either way, and the mask doesn't change any
+#   lengths. Hence the keywords are the same as running the analyzer on
+#   the body itself.
+# ----------------------------------------------------------------------------
+
+import re
+import time
+from collections import OrderedDict
+
+from whoosh.analysis import StandardAnalyzer
+
+RE_MASK = re.compile("[0-9a-fA-F]*[0-9][0-9a-fA-F]*")
+def mask(body):
+    """ Replace every run of hex digits that contains a digit with as many
+    "0"s."""
+    return RE_MASK.sub(lambda m: "0" * len(m.group()), body)
+
+class KeywordTokenizer(object):
+    """ Turns a message body into the sorted list of unique lowercase
+    keywords we store for full-text searching, with an LRU cache of token
+    positions keyed on the masked body.
+
+    If given a logger the cache size and hit rate are logged at INFO every
+    'interval' seconds."""
+
+    def __init__(self, analyzer=None, max_size=10000, logger=None, interval=60):
+        if analyzer is None:
+            analyzer = StandardAnalyzer()
+        self.analyzer = analyzer
+        self.max_size = max_size
+        self.logger = logger
+        self.interval = interval
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.last_report_time = time.time()
+
+    def tokenize(self, body):
+        key = mask(body)
+        spans = self._cache.pop(key, None)
+        if spans is None:
+            self.misses += 1
+            spans = [(token.startchar, token.endchar) for token in self.analyzer(body, chars=True)]
+            if len(self._cache) >= self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+        self._cache[key] = spans
+        if self.logger is not None:
+            self.report_if_due()
+        return sorted(set(body[start:end].lower() for (start, end) in spans))
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def report_if_due(self):
+        time_now = time.time()
+        if (time_now - self.last_report_time) < self.interval:
+            return
+        self.logger.info("keyword cache: size %s, hits %s, misses %s, hit rate %.1f%%" % \
+                         (len(self._cache), self.hits, self.misses, self.hit_rate * 100))
+        self.last_report_time = time_now
@@ -0,0 +1,97 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Incrementally assemble full lines out of a stream of arbitrarily sized
+#   chunks, e.g. the "contents" of ssh_tap messages.
+#
+#   base_parser used to join every chunk onto the trailing excess and
+#   re-split the whole lot. If a long line arrives in many small chunks that
+#   is quadratic. Instead keep one bytearray and two offsets:
+#
+#   -   start: where the excess (the unfinished line) begins.
+#   -   scan: where we stopped looking for line breaks.
+#
+#   so that each byte is only searched once, and the excess is only moved
+#   when the consumed prefix is at least as large as it.
+# ----------------------------------------------------------------------------
+
+NEWLINE = "\n"
+CARRIAGE_RETURN = ord("\r")
+
+class LineAssembler(object):
+    """ Streaming equivalent of base_parser.split_contents_and_return_excess.
+
+    Lines are delimited by "\n" or "\r\n", blank lines are stripped, and
+    whatever follows the last line break is held back until the next call
+    to feed().
+
+    If feed() is given unicode it returns unicode, and if it's given a
+    str it returns str.
+    """
+
+    # Don't bother compacting the buffer until this many bytes have been
+    # consumed; moving a few bytes around is more expensive than keeping
+    # them.
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0
+        self._scan = 0
+
+    def feed(self, contents):
+        """ Append contents to the buffer and return a list of all the full,
+        non-blank lines that are now available."""
+        is_unicode = isinstance(contents, unicode)
+        if is_unicode:
+            contents = contents.encode("utf-8")
+        buf = self._buffer
+        buf.extend(contents)
+
+        lines = []
+        start = self._start
+        index = buf.find(NEWLINE, self._scan)
+        while index != -1:
+            end = index
+            if end > start and buf[end - 1] == CARRIAGE_RETURN:
+                end -= 1
+            if end > start:
+                line = str(buf[start:end])
+                if is_unicode:
+                    line = line.decode("utf-8")
+                lines.append(line)
+            start = index + 1
+            index = buf.find(NEWLINE, start)
+        self._start = start
+        self._scan = len(buf)
+        self._compact()
+        return lines
+
+    def _compact(self):
+        start = self._start
+        if start == 0:
+            return
+        length = len(self._buffer)
+        if start == length:
+            del self._buffer[:]
+        elif start >= self.COMPACT_THRESHOLD and (start * 2) >= length:
+            del self._buffer[:start]
+        else:
+            return
+        self._scan -= start
+        self._start = 0
+
+    @property
+    def excess(self):
+        """ The unfinished line at the end of the buffer, as a str."""
+        return str(self._buffer[self._start:])
+
+    def __len__(self):
+        """ Number of bytes held back as excess."""
+        return len(self._buffer) - self._start
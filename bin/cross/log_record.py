@@ -0,0 +1,176 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   The log data that parsers emit.
+#
+#   A parser makes one of these for every log datum, i.e. every line or
+#   block of lines, so it uses __slots__ rather than a dict and keeps the
+#   timestamp as an integer. Fields every parser has are attributes; fields
+#   only some parsers have, like ep.log's log_id, go in extras, which stays
+#   None until something is added to it.
+# ----------------------------------------------------------------------------
+
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def datetime_to_epoch_ms(datetime_obj):
+    """ Milliseconds since the epoch, treating a naive datetime as UTC."""
+    delta = datetime_obj - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds / 1000
+
+def epoch_ms_to_datetime(epoch_ms):
+    return EPOCH + datetime.timedelta(milliseconds=epoch_ms)
+
+class LogRecord(object):
+    """ One log datum.
+
+    -   epoch_ms: integer, the timestamp in milliseconds since the epoch.
+    -   has_millisecond: boolean, whether the log's timestamp has
+        milliseconds, rather than them always being zero.
+    -   contents: full block from the log.
+    -   contents_hash: string, unique identifier of the contents.
+    -   keywords: list of strings for full-text searching.
+    -   extras: None, or a dict of any other fields.
+    -   box_name, log_type: strings, set by whatever publishes the record.
+    """
+
+    __slots__ = ("epoch_ms",
+                 "has_millisecond",
+                 "contents",
+                 "contents_hash",
+                 "keywords",
+                 "extras",
+                 "box_name",
+                 "log_type")
+
+    def __init__(self, epoch_ms, contents, contents_hash=None, keywords=None,
+                 has_millisecond=False, extras=None, box_name=None, log_type=None):
+        self.epoch_ms = epoch_ms
+        self.has_millisecond = has_millisecond
+        self.contents = contents
+        self.contents_hash = contents_hash
+        self.keywords = keywords
+        self.extras = extras
+        self.box_name = box_name
+        self.log_type = log_type
+
+    @classmethod
+    def from_datetime(cls, datetime_obj, contents, contents_hash=None, keywords=None,
+                      has_millisecond=False, extras=None):
+        return cls(datetime_to_epoch_ms(datetime_obj), contents, contents_hash, keywords,
+                   has_millisecond, extras)
+
+    @property
+    def datetime(self):
+        return epoch_ms_to_datetime(self.epoch_ms)
+
+    def set_extra(self, key, value):
+        if self.extras is None:
+            self.extras = {}
+        self.extras[key] = value
+
+    def get_extra(self, key, default=None):
+        if self.extras is None:
+            return default
+        return self.extras.get(key, default)
+
+    # ------------------------------------------------------------------------
+    #   Serialization.
+    #
+    #   -   to_document(): the document we store in MongoDB.
+    #   -   to_wire() / from_wire(): the list in wire_format's binary
+    #       frames.
+    #   -   to_json_dict(): the dict in wire_format's JSON frames, with the
+    #       timestamp as stringified fields, as parsers have always
+    #       published.
+    # ------------------------------------------------------------------------
+    def to_document(self):
+        if self.extras is None:
+            document = {}
+        else:
+            document = self.extras.copy()
+        document["datetime"] = epoch_ms_to_datetime(self.epoch_ms)
+        document["contents"] = self.contents
+        if self.contents_hash is not None:
+            document["contents_hash"] = self.contents_hash
+        if self.keywords is not None:
+            document["keywords"] = self.keywords
+        if self.box_name is not None:
+            document["box_name"] = self.box_name
+        if self.log_type is not None:
+            document["log_type"] = self.log_type
+        return document
+
+    def to_wire(self):
+        return [self.epoch_ms,
+                self.has_millisecond,
+                self.box_name,
+                self.log_type,
+                self.contents,
+                self.contents_hash,
+                self.keywords,
+                self.extras]
+
+    @classmethod
+    def from_wire(cls, wire):
+        (epoch_ms, has_millisecond, box_name, log_type, contents, contents_hash, keywords, extras) = wire
+        return cls(epoch_ms, contents, contents_hash, keywords, has_millisecond, extras or None,
+                   box_name, log_type)
+
+    def to_json_dict(self):
+        if self.extras is None:
+            json_dict = {}
+        else:
+            json_dict = self.extras.copy()
+        datetime_obj = epoch_ms_to_datetime(self.epoch_ms)
+        json_dict["year"] = str(datetime_obj.year)
+        json_dict["month"] = str(datetime_obj.month)
+        json_dict["day"] = str(datetime_obj.day)
+        json_dict["hour"] = str(datetime_obj.hour)
+        json_dict["minute"] = str(datetime_obj.minute)
+        json_dict["second"] = str(datetime_obj.second)
+        if self.has_millisecond:
+            json_dict["millisecond"] = str(datetime_obj.microsecond / 1000)
+        json_dict["contents"] = self.contents
+        if self.contents_hash is not None:
+            json_dict["contents_hash"] = self.contents_hash
+        if self.keywords is not None:
+            json_dict["keywords"] = self.keywords
+        if self.box_name is not None:
+            json_dict["box_name"] = self.box_name
+        if self.log_type is not None:
+            json_dict["log_type"] = self.log_type
+        return json_dict
+    # ------------------------------------------------------------------------
+
+    # ------------------------------------------------------------------------
+    #   Classes with __slots__ and no __dict__ need these to be pickled,
+    #   e.g. to be passed between processes.
+    # ------------------------------------------------------------------------
+    def __getstate__(self):
+        return self.to_wire()
+
+    def __setstate__(self, state):
+        (self.epoch_ms, self.has_millisecond, self.box_name, self.log_type,
+         self.contents, self.contents_hash, self.keywords, self.extras) = state
+    # ------------------------------------------------------------------------
+
+    def __eq__(self, other):
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return self.to_wire() == other.to_wire()
+
+    def __ne__(self, other):
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "LogRecord: %s" % (self.to_json_dict(), )
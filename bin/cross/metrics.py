@@ -0,0 +1,168 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Cheap running statistics that long-lived processes can keep and
+#   periodically log, e.g. how big the parser's batches are and how long
+#   they take to process.
+# ----------------------------------------------------------------------------
+
+import time
+import bisect
+
+class RunningStatistic(object):
+    """ Count, total, minimum, maximum and mean of a stream of numbers."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return float(self.total) / self.count
+
+    def __str__(self):
+        if self.count == 0:
+            return "n/a"
+        return "mean %.2f, min %s, max %s" % (self.mean, self.minimum, self.maximum)
+
+class LatencyHistogram(object):
+    """ Counts of latencies, in seconds, in fixed buckets from 1ms to 10
+    minutes, so that we can report percentiles without keeping every
+    value. A percentile is reported as the upper bound of its bucket."""
+
+    BUCKET_BOUNDS = [0.001, 0.002, 0.005,
+                     0.01, 0.02, 0.05,
+                     0.1, 0.2, 0.5,
+                     1, 2, 5,
+                     10, 20, 60,
+                     120, 300, 600]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # One more bucket than bounds, for anything over the last bound.
+        self.counts = [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.maximum = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, percent):
+        """ Upper bound of the bucket that holds the given percentile, or
+        the maximum if that's in the last bucket."""
+        if self.count == 0:
+            return None
+        target = self.count * percent / 100.0
+        running_count = 0
+        for (i, count) in enumerate(self.counts):
+            running_count += count
+            if running_count >= target and count != 0:
+                if i == len(self.BUCKET_BOUNDS):
+                    return self.maximum
+                return min(self.BUCKET_BOUNDS[i], self.maximum)
+        return self.maximum
+
+    def __str__(self):
+        if self.count == 0:
+            return "n/a"
+        return "p50 %s, p90 %s, p99 %s, max %.4f" % \
+               (self.percentile(50), self.percentile(90), self.percentile(99), self.maximum)
+
+class FlowCounters(object):
+    """ How a stage of the pipeline is keeping up: the number of messages
+    it's holding for the next stage, and how many it has spilled to disk
+    and dropped since it started. A writer also counts the duplicates it
+    skipped rather than inserting, and its filter's false positives."""
+
+    def __init__(self):
+        self.queued = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.false_positives = 0
+
+    def is_zero(self):
+        return self.queued == 0 and self.spilled == 0 and self.dropped == 0 and \
+               self.duplicates == 0 and self.false_positives == 0
+
+    def __str__(self):
+        text = "queued %s, spilled %s, dropped %s" % (self.queued, self.spilled, self.dropped)
+        if self.duplicates != 0 or self.false_positives != 0:
+            text += ", duplicates skipped %s, false positives %s" % (self.duplicates, self.false_positives)
+        return text
+
+class BatchStatistics(object):
+    """ Statistics about batches of messages, logged at INFO every
+    'interval' seconds and then reset.
+
+    -   messages: number of incoming messages in a batch.
+    -   bytes: number of incoming bytes in a batch.
+    -   records: number of outgoing records a batch produced.
+    -   latency: seconds from receiving the first message of a batch to
+        finishing publishing its records.
+    -   record_latency: seconds from receiving the first line of each
+        record to publishing it. For multi-line log data this includes the
+        time spent waiting for the line that finishes the block.
+
+    flow_counters, a FlowCounters, are logged too but never reset.
+    """
+
+    def __init__(self, logger, interval=60):
+        self.logger = logger
+        self.interval = interval
+        self.messages = RunningStatistic()
+        self.bytes = RunningStatistic()
+        self.records = RunningStatistic()
+        self.latency = RunningStatistic()
+        self.record_latency = LatencyHistogram()
+        self.flow_counters = FlowCounters()
+        self.last_report_time = time.time()
+
+    def add_batch(self, messages, bytes, records, latency):
+        self.messages.add(messages)
+        self.bytes.add(bytes)
+        self.records.add(records)
+        self.latency.add(latency)
+        self.report_if_due()
+
+    def report_if_due(self):
+        time_now = time.time()
+        if (time_now - self.last_report_time) < self.interval:
+            return
+        if self.messages.count != 0:
+            self.logger.info("batches: %s, messages/batch: %s, bytes/batch: %s, records/batch: %s, latency (s): mean %.4f, max %.4f" % \
+                             (self.messages.count, self.messages, self.bytes, self.records, self.latency.mean, self.latency.maximum))
+        if self.record_latency.count != 0:
+            self.logger.info("records: %s, record latency (s): %s" % \
+                             (self.record_latency.count, self.record_latency))
+        if not self.flow_counters.is_zero():
+            self.logger.info("flow: %s" % (self.flow_counters, ))
+        for statistic in [self.messages, self.bytes, self.records, self.latency, self.record_latency]:
+            statistic.reset()
+        self.last_report_time = time_now
@@ -13,6 +13,7 @@ import multiprocessing
 import time
 import requests
 import psutil
+import tracing
 
 # -----------------------------------------------------------------------------
 #   Constants.
@@ -59,7 +60,7 @@ def is_box_available(host, username, password, timeout=5):
     return return_code
 
 def execute_command(host, username, password, command, timeout=20):
-    logger = logging.getLogger("%s.execute_command.%s" % (APP_NAME, host))
+    logger = tracing.get_logger(APP_NAME, "execute_command", host)
     logger.info("entry. command: %s" % (command, ))
     (parent_conn, child_conn) = multiprocessing.Pipe()
     p = multiprocessing.Process(target = _execute_command,
@@ -83,7 +84,7 @@ def execute_command(host, username, password, command, timeout=20):
     return return_value
 
 def _execute_command(host, username, password, command, timeout, conn):
-    logger = logging.getLogger("%s._execute_command.%s" % (APP_NAME, host))
+    logger = tracing.get_logger(APP_NAME, "_execute_command", host)
     ssh = paramiko.SSHClient()
     try:
         try:
@@ -1,14 +1,191 @@
+import time
+import datetime
+
+from contents_hash import ContentsHasher
+
+class TimestampCache(object):
+    """ Memoizes parsing timestamps with datetime_format. Many lines per
+    second share the same second-resolution timestamp, so nearly every
+    strptime() call is a repeat.
+
+    The cache holds at most max_size timestamps and is cleared when it's
+    full. It's also cleared at midnight, according to now(), because some
+    timestamps are missing their year or date and we fill those in from
+    the current date:
+
+    -   strptime_current_year(): the timestamp has no year, e.g. the
+        "Mon dd hh:mm:ss" syslog prefix, and datetime_format starts with
+        "%Y ". A December timestamp seen in January is from last year and
+        a January timestamp seen in December is from next year.
+    -   strptime_today(): the timestamp has no date, e.g. "hh:mm:ss".
+
+    from_fields() memoizes building a datetime out of the stringified
+    fields the parsers publish; datetime_format isn't needed for that.
+    """
+
+    def __init__(self, datetime_format=None, max_size=4096, now=datetime.datetime.now):
+        self.datetime_format = datetime_format
+        self.max_size = max_size
+        self.now = now
+        self._cache = {}
+        self._next_refresh_time = 0
+        self._refresh()
+
+    def _refresh(self):
+        """ Work out today's date and the year, once a day."""
+        self._cache.clear()
+        now = self.now()
+        self._today = now.date()
+        self._year = now.year
+        if now.month == 1:
+            self._year_of_month = dict((month, now.year - 1 if month == 12 else now.year) for month in xrange(1, 13))
+        elif now.month == 12:
+            self._year_of_month = dict((month, now.year + 1 if month == 1 else now.year) for month in xrange(1, 13))
+        else:
+            self._year_of_month = dict((month, now.year) for month in xrange(1, 13))
+        tomorrow = datetime.datetime.combine(self._today + datetime.timedelta(days=1), datetime.time())
+        self._next_refresh_time = time.time() + (tomorrow - now).total_seconds()
+
+    def _get(self, key):
+        if time.time() >= self._next_refresh_time:
+            self._refresh()
+        return self._cache.get(key)
+
+    def _put(self, key, datetime_obj):
+        if len(self._cache) >= self.max_size:
+            self._cache.clear()
+        self._cache[key] = datetime_obj
+        return datetime_obj
+
+    def strptime(self, string):
+        """ Same as datetime.datetime.strptime(string, datetime_format)."""
+        datetime_obj = self._get(string)
+        if datetime_obj is None:
+            datetime_obj = self._put(string, datetime.datetime.strptime(string, self.datetime_format))
+        return datetime_obj
+
+    def strptime_current_year(self, string):
+        """ Parse a timestamp that doesn't have a year, like
+        datetime.datetime.strptime("%s %s" % (year, string), datetime_format)."""
+        datetime_obj = self._get(string)
+        if datetime_obj is None:
+            datetime_obj = datetime.datetime.strptime("%s %s" % (self._year, string), self.datetime_format)
+            year = self._year_of_month[datetime_obj.month]
+            if year != datetime_obj.year:
+                datetime_obj = datetime_obj.replace(year = year)
+            self._put(string, datetime_obj)
+        return datetime_obj
+
+    def strptime_today(self, string):
+        """ Parse a timestamp that doesn't have a date and put it on today's
+        date."""
+        datetime_obj = self._get(string)
+        if datetime_obj is None:
+            datetime_obj = datetime.datetime.strptime(string, self.datetime_format)
+            datetime_obj = self._put(string, datetime.datetime.combine(self._today, datetime_obj.time()))
+        return datetime_obj
+
+    def from_fields(self, year, month, day, hour, minute, second):
+        """ Same as datetime.datetime() on the integer values of the
+        arguments."""
+        key = (year, month, day, hour, minute, second)
+        datetime_obj = self._get(key)
+        if datetime_obj is None:
+            datetime_obj = self._put(key, datetime.datetime(int(year), int(month), int(day),
+                                                            int(hour), int(minute), int(second)))
+        return datetime_obj
+
 class NgmgBaseLogDatum(object):
-    def __init__(self, lines):
+    """ Parses full lines from a log into LogRecord objects.
+
+    This is a state machine that's fed one full line at a time. Each line is
+    only matched once, and a block of lines that make up one log datum is
+    carried over between calls until the line that starts the next one
+    arrives:
+
+    -   feed(line): returns a list of the LogRecord objects that line
+        finished, usually none or one.
+    -   feed_lines(lines): feed() for each line in turn, returning all the
+        LogRecord objects. Parsers may do this faster than line by line.
+    -   flush(): returns the LogRecord for the unfinished block, if any, and
+        forgets it. Call this when there won't be any more lines.
+    -   pending_lines: the lines of the unfinished block.
+    -   pending_line_count: how many lines that is, without copying them.
+
+    Subclasses implement reset(), which sets up the state, feed(), flush(),
+    pending_lines and pending_line_count. Multi-line parsers also set
+    MULTI_LINE and implement starts_log_datum(), so that a stream can be cut
+    into chunks that are parsed in parallel.
+
+    Constructing one with a list of lines feeds them all, sets log_records
+    to the LogRecord objects and excess_lines to the lines that don't yet
+    make up a full log datum. Construct one without lines to stream.
+
+    CONTENTS_HASHER makes each record's contents_hash. Parsers that host
+    this class replace it to change the format or policy."""
+
+    CONTENTS_HASHER = ContentsHasher()
+
+    # Whether a log datum may be more than one line. If so lines can only be
+    # cut where starts_log_datum() says so, and the last lines can't be
+    # parsed until the line after them arrives.
+    MULTI_LINE = False
+
+    def __init__(self, lines=None):
         self.lines = lines
-        self._dict_representations = None
+        self._log_records = None
         self._excess_lines = None
-        self.get_dict_representations()
+        self.reset()
+        if lines is not None:
+            self.get_log_records()
+
+    def get_log_records(self):
+        if self._log_records is not None:
+            return self._log_records
+        rv = self.feed_lines(self.lines)
+        self._log_records = rv
+        self._excess_lines = self.pending_lines
+        return self._log_records
 
     @property
-    def dict_representations(self):
-        return self._dict_representations
+    def log_records(self):
+        return self._log_records
 
     @property
     def excess_lines(self):
         return self._excess_lines
+
+    # ------------------------------------------------------------------------
+    #   Parsers of logs with one log datum per line have no state, so these
+    #   will do for them.
+    # ------------------------------------------------------------------------
+    def reset(self):
+        pass
+
+    def feed(self, line):
+        raise NotImplementedError
+
+    def feed_lines(self, lines):
+        rv = []
+        for line in lines:
+            rv.extend(self.feed(line))
+        return rv
+
+    def flush(self):
+        return []
+
+    @property
+    def pending_lines(self):
+        return []
+
+    @property
+    def pending_line_count(self):
+        return 0
+
+    def starts_log_datum(self, line):
+        """ Whether line starts a new log datum, i.e. whether the lines before
+        it and the lines from it on can be parsed separately and give the
+        same log data. Called once for every line, in order, on an object
+        that isn't fed them."""
+        return True
+    # ------------------------------------------------------------------------
@@ -10,13 +10,10 @@ import os
 import sys
 import zmq
 import pprint
-import datetime
 import re
 import json
 import platform
 import argparse
-import hashlib
-import base64
 
 from whoosh.analysis import FancyAnalyzer
 from whoosh.analysis import StemmingAnalyzer
@@ -36,7 +33,9 @@ ch.setFormatter(formatter)
 logger.addHandler(ch)
 
 import base_parser
-from ngmg_base_log_datum import NgmgBaseLogDatum
+from ngmg_base_log_datum import NgmgBaseLogDatum, TimestampCache
+from keyword_tokenizer import KeywordTokenizer
+from log_record import LogRecord
 
 # ----------------------------------------------------------------------------
 #   Signal handling
@@ -57,6 +56,7 @@ class NgmgEpParserLogDatum(NgmgBaseLogDatum):
     #   Format of the datetime at the start of the line.
     # ------------------------------------------------------------------------
     DATETIME_FORMAT = "%Y %b %d %H:%M:%S"
+    TIMESTAMP_CACHE = TimestampCache(DATETIME_FORMAT)
     # ------------------------------------------------------------------------
 
     # Mar  1 11:37:20 jabbah2 EP 11:37:20.272 0322 0   tDCCli DC_P2P DCClient::main() socket connection made
@@ -80,119 +80,126 @@ class NgmgEpParserLogDatum(NgmgBaseLogDatum):
     RE_LINE = re.compile(re1+re2+re3+re4+re5+re6+re7+re8+re9+re10+re11+re12+re13+re14, re.IGNORECASE | re.DOTALL)
     # ------------------------------------------------------------------------
 
-    def __init__(self, lines):
+    def __init__(self, lines=None):
         return super(NgmgEpParserLogDatum, self).__init__(lines)
 
-    def get_dict_representations(self):
-        """ Given a block of a full log event return a dict with the following
-        required keys:
-        -   year: integer
-        -   month: integer
-        -   day: integer
-        -   hour: integer
-        -   minute: integer
-        -   second: integer
-        -   contents: full block from the log.
-
-        and the following optional keys:
-        -   microsecond: integer
+    MULTI_LINE = True
 
-        Add whatever other keys you like for subscribers to this parser. The
-        most relevent is "_keywords", which we prepare for MongoDB consumers
-        so that we get to decide how they tokenize the string in preparation
-        for full-text searching.
+    def reset(self):
+        # List of (line, m, datetime_obj) for the lines of the current log,
+        # which all have the same log ID.
+        self._current_block = []
+        self._current_log_id = None
 
-        Example lines:
+        # Log ID of the last line passed to starts_log_datum().
+        self._boundary_log_id = None
 
-        2012-Feb-25 19:36:44 testvm.2 green a a a a a a a a a a a a a
-        2012-Feb-25 19:36:43 testvm.2 a a a a a a a a a a a a a i am a lion watch me roar
+    def parse_line(self, line):
+        """ Return (m, datetime_obj) for a line, or None if it can't be
+        parsed."""
+        m = self.RE_LINE.search(line)
+        if not m:
+            return None
+        month1 = m.group(1)
+        day1 = m.group(2)
+        time1 = m.group(3)
+        full_datetime = " ".join([month1, day1, time1])
+        try:
+            datetime_obj = self.TIMESTAMP_CACHE.strptime_current_year(full_datetime)
+        except ValueError:
+            return None
+        return (m, datetime_obj)
+
+    def starts_log_datum(self, line):
+        parsed_line = self.parse_line(line)
+        if parsed_line is None:
+            return False
+        log_id = parsed_line[0].group(4)
+        (previous_log_id, self._boundary_log_id) = (self._boundary_log_id, log_id)
+        return log_id != previous_log_id
+
+    def feed(self, line):
+        """ Given a full line of the log return a list of the LogRecord
+        objects it finishes. A log is finished by the first line of the next
+        one, i.e. the first line with a different log ID.
+
+        Lines that can't be parsed are dropped.
+        """
+        parsed_line = self.parse_line(line)
+        if parsed_line is None:
+            return []
+        (m, datetime_obj) = parsed_line
+        log_id = m.group(4)
 
-        - If the log outputs data in single lines contents will always be a single line.
-        - If the log outputs data to multiple lines for a given datetime contents may
-        be a line-delimited string.
+        if self._current_log_id is None or log_id == self._current_log_id:
+            self._current_log_id = log_id
+            self._current_block.append((line, m, datetime_obj))
+            return []
+        # We have a new log at this point.
+        old_current_block = self._current_block
+        self._current_block = [(line, m, datetime_obj)]
+        self._current_log_id = log_id
+        return [self.get_log_record(old_current_block)]
+
+    def flush(self):
+        if len(self._current_block) == 0:
+            return []
+        old_current_block = self._current_block
+        self.reset()
+        return [self.get_log_record(old_current_block)]
+
+    @property
+    def pending_lines(self):
+        return [line for (line, m, datetime_obj) in self._current_block]
+
+    @property
+    def pending_line_count(self):
+        return len(self._current_block)
+
+    def get_log_record(self, block):
+        """ Given the list of (line, m, datetime_obj) for a full log event
+        return a LogRecord with:
+        -   the datetime of the event.
+        -   contents: full block from the log.
+        -   contents_hash: unique identifier of the contents.
+        -   keywords: which we prepare for MongoDB consumers so that we get
+            to decide how they tokenize the string in preparation for
+            full-text searching.
 
-        Return None if the input can't be parsed.
+        and log_id, component_id and, for errors and warnings, error_level
+        and error_id in its extras.
         """
-        if self._dict_representations is not None:
-            return self._dict_representations
-
-        rv = []
-        current_block = []
-        old_current_block = []
-        current_log_id = None
-        for line in self.lines:
-            logger.debug("line: %s" % (line, ))
-            m = self.RE_LINE.search(line)
-            if not m:
-                continue
-            year = str(datetime.datetime.now().year)
-            month1 = m.group(1)
-            day1 = m.group(2)
-            time1 = m.group(3)
-            log_id = m.group(4)
-            logger_id_with_stars = m.group(5)
-            component_id = m.group(6)
-            contents = m.group(7)
-
-            full_datetime = " ".join([year, month1, day1, time1])
-            try:
-                datetime_obj = datetime.datetime.strptime(full_datetime, self.DATETIME_FORMAT)
-            except ValueError:
-                return None
-
-            if current_log_id is None:
-                current_log_id = log_id
-                current_block.append((line, m, datetime_obj))
-                continue
-            if log_id == current_log_id:
-                current_block.append((line, m, datetime_obj))
-                continue
-            # We have a new log at this point.
-            old_current_block = current_block[:]
-            current_block = [(line, m, datetime_obj)]
-
-            all_lines = (line for (line, m, datetime_obj) in old_current_block)
-            all_contents = '\n'.join(line for line in all_lines)
-            (line, m, datetime_obj) = old_current_block[0]
-
-            log_id = m.group(4)
-            logger_id_with_stars = m.group(5)
-            component_id = m.group(6)
-            contents = m.group(7)
-
-            return_value = {}
-            return_value["year"] = str(datetime_obj.year)
-            return_value["month"] = str(datetime_obj.month)
-            return_value["day"] = str(datetime_obj.day)
-            return_value["hour"] = str(datetime_obj.hour)
-            return_value["minute"] = str(datetime_obj.minute)
-            return_value["second"] = str(datetime_obj.second)
-            return_value["contents"] = all_contents
-            return_value["contents_hash"] = base64.b64encode(hashlib.md5(return_value["contents"]).digest())
-            return_value["keywords"] = self.tokenize(return_value["contents"])
-            return_value["log_id"] = log_id
-            return_value["component_id"] = component_id
-
-            # For ep.log two stars is error, one start is warning, when prepended to component.
-            if logger_id_with_stars.startswith("**"):
-                error_level = "error"
-            elif logger_id_with_stars.startswith("*"):
-                error_level = "warning"
-            if logger_id_with_stars.startswith("*"):
-                possible_error_id_match = re.search("\[(.*?)\]", contents)
-                if possible_error_id_match:
-                    error_id = possible_error_id_match.groups()[0]
-                    if ".cpp:" in error_id:
-                        return_value["error_level"] = error_level
-                        return_value["error_id"] = error_id
-
-            rv.append(return_value)
-
-        self._dict_representations = rv
-        self._excess_lines = [line for (line, m, datetime_obj) in current_block]
-        return self._dict_representations
+        all_contents = '\n'.join(line for (line, m, datetime_obj) in block)
+        (line, m, datetime_obj) = block[0]
+
+        log_id = m.group(4)
+        logger_id_with_stars = m.group(5)
+        component_id = m.group(6)
+        contents = m.group(7)
+
+        log_record = LogRecord.from_datetime(datetime_obj,
+                                             all_contents,
+                                             self.CONTENTS_HASHER(all_contents, datetime_obj),
+                                             self.KEYWORD_TOKENIZER.tokenize(all_contents[m.start(7):]),
+                                             extras = {"log_id": log_id,
+                                                       "component_id": component_id})
+
+        # For ep.log two stars is error, one start is warning, when prepended to component.
+        if logger_id_with_stars.startswith("**"):
+            error_level = "error"
+        elif logger_id_with_stars.startswith("*"):
+            error_level = "warning"
+        if logger_id_with_stars.startswith("*"):
+            possible_error_id_match = re.search("\[(.*?)\]", contents)
+            if possible_error_id_match:
+                error_id = possible_error_id_match.groups()[0]
+                if ".cpp:" in error_id:
+                    log_record.extras["error_level"] = error_level
+                    log_record.extras["error_id"] = error_id
+        return log_record
 
     analyzer = StandardAnalyzer()
+    KEYWORD_TOKENIZER = KeywordTokenizer(analyzer, logger=logger)
     def tokenize(self, input):
         """Given a blob of input prepare a list of strings that is suitable
         for full-text indexing by MongoDB.
@@ -203,20 +210,13 @@ class NgmgEpParserLogDatum(NgmgBaseLogDatum):
         if not m:
             return []
         contents = m.group(7)
-        tokens = []
-        for elem in self.analyzer(contents):
-            if hasattr(elem, "pos"):
-                tokens.append((elem.text, elem.pos))
-            else:
-                tokens.append((elem.text, None))
-        unique_tokens = list(set([text for (text, pos) in tokens]))
-        return sorted(unique_tokens)
+        return self.KEYWORD_TOKENIZER.tokenize(contents)
 
     def __repr__(self):
-        return "LogDatum: %s" % (self.get_dict_representation(), )
+        return "LogDatum: %s" % (self.log_records, )
 
     def __str__(self):
-        return "%s" % (self.get_dict_representation(), )
+        return "%s" % (self.log_records, )
 
 if __name__ == "__main__":
     logger.debug("starting")
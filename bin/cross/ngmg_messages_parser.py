@@ -10,13 +10,11 @@ import os
 import sys
 import zmq
 import pprint
-import datetime
 import re
 import json
 import platform
 import argparse
-import hashlib
-import base64
+import itertools
 
 from whoosh.analysis import FancyAnalyzer
 from whoosh.analysis import StemmingAnalyzer
@@ -36,7 +34,10 @@ ch.setFormatter(formatter)
 logger.addHandler(ch)
 
 import base_parser
-from ngmg_base_log_datum import NgmgBaseLogDatum
+from ngmg_base_log_datum import NgmgBaseLogDatum, TimestampCache
+from keyword_tokenizer import KeywordTokenizer
+from log_record import LogRecord
+from syslog_header import SyslogHeaderParser
 
 # ----------------------------------------------------------------------------
 #   Signal handling
@@ -58,6 +59,7 @@ class NgmgMessagesParserLogDatum(NgmgBaseLogDatum):
     #   Format of the datetime at the start of the line.
     # ------------------------------------------------------------------------
     DATETIME_FORMAT = "%Y %b %d %H:%M:%S"
+    TIMESTAMP_CACHE = TimestampCache(DATETIME_FORMAT)
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
@@ -72,29 +74,29 @@ class NgmgMessagesParserLogDatum(NgmgBaseLogDatum):
     re7='((?:[a-z][a-z]+))' # Word 1a
     re8=' (.*)' # the rest
     RE_LINE = re.compile(re1+re2+re3+re4+re5+re6+re7+re8, re.IGNORECASE | re.DOTALL)
+
+    # Anchored fast path, falling back to RE_LINE's fields with bounded fillers.
+    SYSLOG_HEADER = SyslogHeaderParser(month_pattern=re1,
+                                       day_pattern=re3,
+                                       time_pattern=re5,
+                                       host_pattern='(?<![a-z])' + re7 + ' ')
     # ------------------------------------------------------------------------
 
-    def __init__(self, lines):
+    def __init__(self, lines=None):
         return super(NgmgMessagesParserLogDatum, self).__init__(lines)
 
-    def get_dict_representations(self):
-        """ Given a block of a full log event return a dict with the following
-        required keys:
-        -   year: integer
-        -   month: integer
-        -   day: integer
-        -   hour: integer
-        -   minute: integer
-        -   second: integer
+    def feed(self, line):
+        """ Given a full line of the log return a list of the LogRecord it
+        makes, with:
+        -   the datetime of the event.
         -   contents: full block from the log.
+        -   contents_hash: unique identifier of the contents.
+        -   keywords: which we prepare for MongoDB consumers so that we get
+            to decide how they tokenize the string in preparation for
+            full-text searching.
 
-        and the following optional keys:
-        -   microsecond: integer
-
-        Add whatever other keys you like for subscribers to this parser. The
-        most relevent is "_keywords", which we prepare for MongoDB consumers
-        so that we get to decide how they tokenize the string in preparation
-        for full-text searching.
+        Add whatever other fields you like for subscribers to this parser to
+        the record's extras.
 
         Example lines:
 
@@ -105,70 +107,57 @@ class NgmgMessagesParserLogDatum(NgmgBaseLogDatum):
         - If the log outputs data to multiple lines for a given datetime contents may
         be a line-delimited string.
 
-        Return None if the input can't be parsed.
+        Return an empty list if the line can't be parsed.
         """
-        if self._dict_representations is not None:
-            return self._dict_representations
+        m = self.SYSLOG_HEADER.match_single_line(line)
+        if not m:
+            return []
+        return self.make_log_records(line, m)
 
+    def feed_lines(self, lines):
+        """ feed() each line, matching the whole list of lines at once."""
         rv = []
-        for line in self.lines:
-            if len(line.splitlines()) != 1:
-                continue
-            m = self.RE_LINE.search(line)
-            if not m:
-                continue
-            year = str(datetime.datetime.now().year)
-            month1 = m.group(1)
-            day1 = m.group(2)
-            time1 = m.group(3)
-            hostname = m.group(4)
-            contents = m.group(5)
-
-            full_datetime = " ".join([year, month1, day1, time1])
-            try:
-                datetime_obj = datetime.datetime.strptime(full_datetime, self.DATETIME_FORMAT)
-            except ValueError:
-                continue
-            return_value = {}
-            return_value["year"] = str(datetime_obj.year)
-            return_value["month"] = str(datetime_obj.month)
-            return_value["day"] = str(datetime_obj.day)
-            return_value["hour"] = str(datetime_obj.hour)
-            return_value["minute"] = str(datetime_obj.minute)
-            return_value["second"] = str(datetime_obj.second)
-            return_value["contents"] = line
-            return_value["contents_hash"] = base64.b64encode(hashlib.md5(return_value["contents"]).digest())
-            return_value["keywords"] = self.tokenize(return_value["contents"])
-            rv.append(return_value)
-        self._dict_representations = rv
-        self._excess_lines = []
-        return self._dict_representations
+        for (line, m) in itertools.izip(lines, self.SYSLOG_HEADER.match_single_lines(lines)):
+            if m:
+                rv.extend(self.make_log_records(line, m))
+        return rv
+
+    def make_log_records(self, line, m):
+        """ Given a line and what SYSLOG_HEADER matched in it return a list
+        of the LogRecord it makes, or an empty list if its datetime can't be
+        parsed."""
+        (month1, day1, time1, hostname, contents) = m
+
+        full_datetime = " ".join([month1, day1, time1])
+        try:
+            datetime_obj = self.TIMESTAMP_CACHE.strptime_current_year(full_datetime)
+        except ValueError:
+            return []
+        log_record = LogRecord.from_datetime(datetime_obj,
+                                             line,
+                                             self.CONTENTS_HASHER(line, datetime_obj),
+                                             self.KEYWORD_TOKENIZER.tokenize(contents))
+        return [log_record]
 
     analyzer = StandardAnalyzer()
+    KEYWORD_TOKENIZER = KeywordTokenizer(analyzer, logger=logger)
     def tokenize(self, input):
         """Given a blob of input prepare a list of strings that is suitable
         for full-text indexing by MongoDB.
 
         I'm going to cheat and use Whoosh."""
 
-        m = self.RE_LINE.search(input)
+        m = self.SYSLOG_HEADER.match(input)
         if not m:
             return []
-        contents = m.group(5)
-        tokens = []
-        for elem in self.analyzer(contents):
-            if hasattr(elem, "pos"):
-                tokens.append((elem.text, elem.pos))
-            else:
-                tokens.append((elem.text, None))
-        unique_tokens = list(set([text for (text, pos) in tokens]))
-        return sorted(unique_tokens)
+        contents = m[4]
+        return self.KEYWORD_TOKENIZER.tokenize(contents)
 
     def __repr__(self):
-        return "LogDatum: %s" % (self.get_dict_representation(), )
+        return "LogDatum: %s" % (self.log_records, )
 
     def __str__(self):
-        return "%s" % (self.get_dict_representation(), )
+        return "%s" % (self.log_records, )
 
 if __name__ == "__main__":
     logger.debug("starting")
@@ -9,14 +9,11 @@
 import os
 import sys
 import zmq
-import pprint
 import datetime
 import re
 import json
 import platform
 import argparse
-import hashlib
-import base64
 
 from whoosh.analysis import FancyAnalyzer
 from whoosh.analysis import StemmingAnalyzer
@@ -36,7 +33,9 @@ ch.setFormatter(formatter)
 logger.addHandler(ch)
 
 import base_parser
-from ngmg_base_log_datum import NgmgBaseLogDatum
+from ngmg_base_log_datum import NgmgBaseLogDatum, TimestampCache
+from keyword_tokenizer import KeywordTokenizer
+from log_record import LogRecord
 
 # ----------------------------------------------------------------------------
 #   Signal handling
@@ -63,6 +62,7 @@ class NgmgShmHpilistParserLogDatum(NgmgBaseLogDatum):
     #   Format of the datetime at the start of the line.
     # ------------------------------------------------------------------------
     DATETIME_FORMAT = "%H:%M:%S"
+    TIMESTAMP_CACHE = TimestampCache(DATETIME_FORMAT, now=datetime.datetime.utcnow)
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
@@ -80,132 +80,129 @@ class NgmgShmHpilistParserLogDatum(NgmgBaseLogDatum):
     RE_SENSOR_TYPE = re.compile(".*SensorType\s*:\s*(?P<sensor_type>.*)", re.IGNORECASE | re.DOTALL)
     # ------------------------------------------------------------------------
 
-    def __init__(self, lines):
+    def __init__(self, lines=None):
         return super(NgmgShmHpilistParserLogDatum, self).__init__(lines)
 
-    def get_dict_representations(self):
-        if self._dict_representations is not None:
-            return self._dict_representations
-
-        rv = []
-        current_block = []
-        old_current_block = []
-        is_in_block = False
-        for i, line in enumerate(self.lines):
-            logger.debug("i: %s, line: %s" % (i, line))
-            # ----------------------------------------------------------------
-            #   Judging by whether there's a datetime in the line adjust
-            #   our behaviour.
-            #   -   is_in_block: are we currently processing a block?
-            # ----------------------------------------------------------------
-            m = self.RE_BLOCK_START.search(line)
-            logger.debug("before. m: %s, is_in_block: %s, current_block: %s, old_current_block: %s" % (m, is_in_block, pprint.pformat(current_block), pprint.pformat(old_current_block)))
-            if not m and not is_in_block:
-                logger.debug("no datetime, not in block, so skip")
+    MULTI_LINE = True
+
+    def starts_log_datum(self, line):
+        return self.RE_BLOCK_START.search(line) is not None
+
+    def reset(self):
+        # Lines of the current block, and the RE_BLOCK_START match of its
+        # first line.
+        self._current_block = []
+        self._current_match = None
+
+    def feed(self, line):
+        """ Given a full line of the log return a list of the LogRecord
+        objects it finishes. A block is finished by the next line with a
+        datetime in it.
+
+        Lines before the first block are dropped, as are blocks whose
+        datetime can't be parsed.
+        """
+        # --------------------------------------------------------------------
+        #   Judging by whether there's a datetime in the line adjust
+        #   our behaviour.
+        # --------------------------------------------------------------------
+        m = self.RE_BLOCK_START.search(line)
+        if not m:
+            if self._current_match is not None:
+                self._current_block.append(line)
+            return []
+        (old_current_block, old_current_match) = (self._current_block, self._current_match)
+        (self._current_block, self._current_match) = ([line], m)
+        if old_current_match is None:
+            return []
+        # --------------------------------------------------------------------
+
+        log_record = self.get_log_record(old_current_block, old_current_match)
+        if log_record is None:
+            return []
+        return [log_record]
+
+    def flush(self):
+        if self._current_match is None:
+            return []
+        (old_current_block, old_current_match) = (self._current_block, self._current_match)
+        self.reset()
+        log_record = self.get_log_record(old_current_block, old_current_match)
+        if log_record is None:
+            return []
+        return [log_record]
+
+    @property
+    def pending_lines(self):
+        return self._current_block[:]
+
+    @property
+    def pending_line_count(self):
+        return len(self._current_block)
+
+    def get_log_record(self, block, m):
+        """ Given the lines of a full block and the RE_BLOCK_START match of
+        its first line return a LogRecord, or None if the datetime can't be
+        parsed."""
+        hhmmss = m.groupdict()["time"]
+        millisecond = m.groupdict()["millisecond"]
+        try:
+            datetime_obj = self.TIMESTAMP_CACHE.strptime_today(hhmmss)
+            datetime_obj = datetime_obj.replace(microsecond = int(millisecond) * 1000)
+        except ValueError:
+            logger.exception("failed to parse datetime in first line: %s" % (block[0], ))
+            return None
+        contents = '\n'.join(block)
+        log_record = LogRecord.from_datetime(datetime_obj,
+                                             contents,
+                                             self.CONTENTS_HASHER(contents, datetime_obj),
+                                             self.tokenize(contents),
+                                             has_millisecond = True)
+
+        # --------------------------------------------------------------------
+        #   Go line-by-line and parse for source, event_type,
+        #   component_path, sensor_num, and sensor_type.
+        # --------------------------------------------------------------------
+        for line in block:
+            m = self.RE_SOURCE.search(line)
+            if m:
+                log_record.set_extra("source", m.groupdict()["source"])
                 continue
-            if not m and is_in_block:
-                logger.debug("no datetime, but in a block. append line to current_block and continue")
-                current_block.append(line)
+            m = self.RE_EVENT_TYPE.search(line)
+            if m:
+                log_record.set_extra("event_type", m.groupdict()["event_type"])
                 continue
-            if m and not is_in_block:
-                logger.debug("datetime, but not in a block. odd! start new current_block")
-                is_in_block = True
-                current_block = [line]
+            m = self.RE_COMPONENT_PATH.search(line)
+            if m:
+                log_record.set_extra("component_path", m.groupdict()["component_path"])
                 continue
-            elif m and is_in_block:
-                logger.debug("datetime, and in a block. current_block is finished.")
-                old_current_block = current_block[:]
-                current_block = [line]
-            logger.debug("after. m: %s, is_in_block: %s, current_block: %s, old_current_block: %s" % (m, is_in_block, pprint.pformat(current_block), pprint.pformat(old_current_block)))
-            # ----------------------------------------------------------------
-
-            # ----------------------------------------------------------------
-            #   If current_block_is_finished we need to parse the contents
-            #   of current_block and append it to rv.
-            # ----------------------------------------------------------------
-            # The first line must match RE_BLOCK_START
-            m = self.RE_BLOCK_START.search(old_current_block[0])
-            assert(m)
-            hhmmss = m.groupdict()["time"]
-            millisecond = m.groupdict()["millisecond"]
-            try:
-                now = datetime.datetime.utcnow()
-                datetime_obj = datetime.datetime.strptime(hhmmss, self.DATETIME_FORMAT)
-                datetime_obj = datetime_obj.replace(year = now.year,
-                                                    month = now.month,
-                                                    day = now.day,
-                                                    microsecond = int(millisecond) * 1000)
-            except ValueError:
-                logger.exception("failed to parse datetime in first line: %s" % (old_current_block[0], ))
+            m = self.RE_SENSOR_NUM.search(line)
+            if m:
+                log_record.set_extra("sensor_num", m.groupdict()["sensor_num"])
                 continue
-            return_value = {}
-            return_value["year"] = str(datetime_obj.year)
-            return_value["month"] = str(datetime_obj.month)
-            return_value["day"] = str(datetime_obj.day)
-            return_value["hour"] = str(datetime_obj.hour)
-            return_value["minute"] = str(datetime_obj.minute)
-            return_value["second"] = str(datetime_obj.second)
-            return_value["millisecond"] = str(datetime_obj.microsecond / 1000)
-            return_value["contents"] = '\n'.join(old_current_block)
-            return_value["contents_hash"] = base64.b64encode(hashlib.md5(return_value["contents"]).digest())
-            return_value["keywords"] = self.tokenize(return_value["contents"])
-            # ----------------------------------------------------------------
-
-            # ----------------------------------------------------------------
-            #   Go line-by-line and parse for source, event_type,
-            #   component_path, sensor_num, and sensor_type.
-            # ----------------------------------------------------------------
-            for line in old_current_block:
-                m = self.RE_SOURCE.search(line)
-                if m:
-                    return_value["source"] = m.groupdict()["source"]
-                    continue
-                m = self.RE_EVENT_TYPE.search(line)
-                if m:
-                    return_value["event_type"] = m.groupdict()["event_type"]
-                    continue
-                m = self.RE_COMPONENT_PATH.search(line)
-                if m:
-                    return_value["component_path"] = m.groupdict()["component_path"]
-                    continue
-                m = self.RE_SENSOR_NUM.search(line)
-                if m:
-                    return_value["sensor_num"] = m.groupdict()["sensor_num"]
-                    continue
-                m = self.RE_SENSOR_TYPE.search(line)
-                if m:
-                    return_value["sensor_type"] = m.groupdict()["sensor_type"]
-                    continue
-            # ----------------------------------------------------------------
-
-            rv.append(return_value)
-        self._dict_representations = rv
-        self._excess_lines = current_block
-
-        logger.debug("returning: \n%s" % (pprint.pformat(self._dict_representations), ))
-        return self._dict_representations
+            m = self.RE_SENSOR_TYPE.search(line)
+            if m:
+                log_record.set_extra("sensor_type", m.groupdict()["sensor_type"])
+                continue
+        # --------------------------------------------------------------------
+
+        return log_record
 
     analyzer = StandardAnalyzer()
+    KEYWORD_TOKENIZER = KeywordTokenizer(analyzer, logger=logger)
     def tokenize(self, input):
         """Given a blob of input prepare a list of strings that is suitable
         for full-text indexing by MongoDB.
 
         I'm going to cheat and use Whoosh."""
 
-        tokens = []
-        for elem in self.analyzer(input):
-            if hasattr(elem, "pos"):
-                tokens.append((elem.text, elem.pos))
-            else:
-                tokens.append((elem.text, None))
-        unique_tokens = list(set([text for (text, pos) in tokens]))
-        return sorted(unique_tokens)
+        return self.KEYWORD_TOKENIZER.tokenize(input)
 
     def __repr__(self):
-        return "LogDatum: %s" % (self.get_dict_representation(), )
+        return "LogDatum: %s" % (self.log_records, )
 
     def __str__(self):
-        return "%s" % (self.get_dict_representation(), )
+        return "%s" % (self.log_records, )
 
 if __name__ == "__main__":
     logger.debug("starting")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Host the parsers for many boxes and logs in one pool of worker
+#   processes, instead of one "<parser>.py" process per box and log.
+#
+#   Each stream is an ssh_tap binding to SUBSCRIBE to, the parser binding to
+#   PUBLISH results on (the one registered with the service_registry), and
+#   the parser to use. Streams are pinned to workers so that each one is
+#   parsed in order and keeps its own trailing excess.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import zmq
+import time
+import pprint
+import argparse
+import multiprocessing
+
+APP_NAME = "parser_farm"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+import base_parser
+from metrics import BatchStatistics
+import wire_format
+import contents_hash
+import tracing
+trace = tracing.get_tracer(APP_NAME)
+
+# ----------------------------------------------------------------------------
+#   Signal handling
+# ----------------------------------------------------------------------------
+import signal
+def soft_handler(signum, frame):
+    logging.debug('Soft stop')
+    sys.exit(1)
+def hard_handler(signum, frame):
+    logging.debug('Hard stop')
+    os._exit(2)
+signal.signal(signal.SIGINT, soft_handler)
+signal.signal(signal.SIGTERM, hard_handler)
+# ----------------------------------------------------------------------------
+
+try:
+    from constants import *
+except:
+    logger.exception("unhandled exception during constant creation.")
+    raise
+
+def get_args():
+    parser = argparse.ArgumentParser("Parse many incoming ZeroMQ streams of logs in a pool of processes.")
+    parser.add_argument("--stream",
+                        dest="streams",
+                        nargs=4,
+                        action="append",
+                        metavar=("PARSER_NAME", "BOX_NAME", "SSH_TAP_ZEROMQ_BINDING", "PARSER_ZEROMQ_BINDING"),
+                        required=True,
+                        help="A stream to parse. May be given many times.")
+    parser.add_argument("--processes",
+                        dest="processes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Number of worker processes. Default is the number of cores.")
+    parser.add_argument("--batch_max_messages",
+                        dest="batch_max_messages",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100,
+                        help="Drain up to this many pending ssh_tap messages from a stream and parse them as one batch.")
+    parser.add_argument("--batch_max_bytes",
+                        dest="batch_max_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1024 * 1024,
+                        help="Stop draining a batch once it holds at least this many bytes.")
+    parser.add_argument("--stats_interval",
+                        dest="stats_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=60,
+                        help="Log batch size and latency statistics this often.")
+    parser.add_argument("--idle_flush_seconds",
+                        dest="idle_flush_seconds",
+                        metavar="SECONDS",
+                        type=float,
+                        default=base_parser.DEFAULT_IDLE_FLUSH_SECONDS,
+                        help="Publish a log datum that's still waiting for the line that finishes it once no lines have arrived on its stream for this long. 0 disables. Default is %s." % (base_parser.DEFAULT_IDLE_FLUSH_SECONDS, ))
+    parser.add_argument("--wire_format",
+                        dest="wire_format",
+                        choices=wire_format.WIRE_FORMATS,
+                        default=wire_format.JSON,
+                        help="How to encode the log data we PUBLISH. Subscribers detect the format of each message. Default is json.")
+    parser.add_argument("--contents_hash_format",
+                        dest="contents_hash_format",
+                        choices=contents_hash.CONTENTS_HASH_FORMATS,
+                        default=contents_hash.MD5,
+                        help="Format of each log's contents_hash. Default is md5.")
+    parser.add_argument("--contents_hash_policy",
+                        dest="contents_hash_policy",
+                        choices=contents_hash.CONTENTS_HASH_POLICIES,
+                        default=contents_hash.CONTENTS,
+                        help="What goes into each log's contents_hash. Default is just the contents.")
+    base_parser.add_flow_control_arguments(parser)
+    parser.add_argument("--verbose",
+                        dest="verbose",
+                        action='store_true',
+                        default=False,
+                        help="Enable verbose debug mode.")
+    args = parser.parse_args()
+    return args
+
+def get_log_datum_classes(parser_names):
+    """ Import each parser once and return a dict of parser name to its
+    log datum class."""
+    logger = tracing.get_logger(APP_NAME, "get_log_datum_classes")
+    log_datum_classes = {}
+    for parser_name in set(parser_names):
+        assert(parser_name in parser_farm_classes), "parser_farm can't host parser %s" % (parser_name, )
+        module = __import__(parser_name)
+        log_datum_classes[parser_name] = getattr(module, parser_farm_classes[parser_name])
+    trace("log_datum_classes:\n%s", tracing.Lazy(pprint.pformat, log_datum_classes))
+    return log_datum_classes
+
+def assign_streams_to_workers(streams, number_of_workers):
+    """ Deal out streams round-robin. A stream is only ever handled by one
+    worker."""
+    number_of_workers = max(1, min(number_of_workers, len(streams)))
+    workers_streams = [[] for i in xrange(number_of_workers)]
+    for (i, stream) in enumerate(streams):
+        workers_streams[i % number_of_workers].append(stream)
+    return workers_streams
+
+def worker_main(worker_number, streams, log_datum_classes, batch_max_messages, batch_max_bytes, stats_interval, publish_wire_format, contents_hasher, idle_flush_seconds, flow_control_args):
+    logger = logging.getLogger("%s.worker_%s" % (APP_NAME, worker_number))
+    worker_trace = tracing.get_tracer(logger.name)
+    worker_trace("entry. streams:\n%s", tracing.Lazy(pprint.pformat, streams))
+
+    for log_datum_class in log_datum_classes.itervalues():
+        log_datum_class.CONTENTS_HASHER = contents_hasher
+
+    batch_statistics = BatchStatistics(logger, stats_interval)
+    context = zmq.Context(1)
+    poller = zmq.Poller()
+    parser_streams = {}
+    publishers = []
+    for (parser_name, box_name, ssh_tap_zeromq_binding, parser_zeromq_binding) in streams:
+        logger.debug("box_name %s: ssh_tap %s, parser %s" % (box_name, ssh_tap_zeromq_binding, parser_zeromq_binding))
+        subscription_socket = base_parser.get_subscription_socket(context, ssh_tap_zeromq_binding)
+        publish_socket = base_parser.get_publish_socket(context, parser_zeromq_binding)
+        stream_logger = tracing.get_logger(APP_NAME, box_name)
+        publisher = base_parser.get_credited_publisher(context,
+                                                       publish_socket,
+                                                       parser_zeromq_binding,
+                                                       box_name,
+                                                       flow_control_args,
+                                                       batch_statistics.flow_counters,
+                                                       stream_logger)
+        publishers.append(publisher)
+        parser_streams[subscription_socket] = base_parser.ParserStream(box_name,
+                                                                       log_datum_classes[parser_name],
+                                                                       publisher,
+                                                                       stream_logger,
+                                                                       log_type=parser_name,
+                                                                       wire_format=publish_wire_format,
+                                                                       record_latency=batch_statistics.record_latency)
+        poller.register(subscription_socket, zmq.POLLIN)
+
+    poll_interval = base_parser.get_poll_interval(idle_flush_seconds)
+    try:
+        while 1:
+            socks = tracing.poll(poller, poll_interval)
+            for (subscription_socket, event) in socks.iteritems():
+                if not (event & zmq.POLLIN):
+                    continue
+                (batch, batch_start_time) = base_parser.receive_batch(subscription_socket, batch_max_messages, batch_max_bytes)
+                number_of_records = parser_streams[subscription_socket].handle_batch(batch, batch_start_time)
+                batch_statistics.add_batch(len(batch),
+                                           sum(len(incoming_string) for incoming_string in batch),
+                                           number_of_records,
+                                           time.time() - batch_start_time)
+            if idle_flush_seconds > 0:
+                time_now = time.time()
+                for parser_stream in parser_streams.itervalues():
+                    parser_stream.flush_if_idle(idle_flush_seconds, time_now)
+            for publisher in publishers:
+                publisher.pump()
+            batch_statistics.report_if_due()
+    except KeyboardInterrupt:
+        logger.debug("CTRL-C")
+    finally:
+        logger.debug("exiting")
+
+def main():
+    logger = tracing.get_logger(APP_NAME, "main")
+    args = get_args()
+    tracing.install_signal_handler()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+        logging.getLogger(APP_NAME).setLevel(logging.DEBUG)
+        tracing.enable(APP_NAME)
+        logger.debug("Verbose logging enabled.")
+    streams = [tuple(stream) for stream in args.streams]
+    trace("streams:\n%s", tracing.Lazy(pprint.pformat, streams))
+
+    log_datum_classes = get_log_datum_classes([stream[0] for stream in streams])
+    workers_streams = assign_streams_to_workers(streams, args.processes)
+    publish_wire_format = wire_format.get_wire_format(args.wire_format, logger)
+    contents_hasher = contents_hash.ContentsHasher(contents_hash.get_contents_hash_format(args.contents_hash_format, logger),
+                                                   args.contents_hash_policy)
+    logger.info("parsing %s streams in %s processes." % (len(streams), len(workers_streams)))
+
+    def start_worker(worker_number):
+        process = multiprocessing.Process(target = worker_main,
+                                          args = (worker_number,
+                                                  workers_streams[worker_number],
+                                                  log_datum_classes,
+                                                  args.batch_max_messages,
+                                                  args.batch_max_bytes,
+                                                  args.stats_interval,
+                                                  publish_wire_format,
+                                                  contents_hasher,
+                                                  args.idle_flush_seconds,
+                                                  args))
+        process.daemon = True
+        process.start()
+        return process
+
+    workers = [start_worker(i) for i in xrange(len(workers_streams))]
+    try:
+        while 1:
+            time.sleep(1)
+            for (i, process) in enumerate(workers):
+                if not process.is_alive():
+                    logger.error("worker %s ended, exit code %s, so restart it." % (i, process.exitcode))
+                    workers[i] = start_worker(i)
+    except KeyboardInterrupt:
+        logger.debug("CTRL-C")
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        logger.debug("exiting")
+
+if __name__ == "__main__":
+    logger.debug("starting")
+    main()
@@ -12,15 +12,25 @@ import zmq
 import pprint
 import datetime
 import re
-import json
 import platform
 import argparse
-import heapq
-import gc
+import time
+import collections
+import operator
+import threading
+import Queue
 
 import pymongo
 import database
 from utilities import retry
+import wire_format
+import contents_hash
+import tracing
+import flow_control
+import journal
+import dedup
+import partitions
+from metrics import BatchStatistics
 
 # ----------------------------------------------------------------------------
 #   Signal handling
@@ -40,6 +50,39 @@ signal.signal(signal.SIGTERM, hard_handler)
 #   Constants.
 # ----------------------------------------------------------------------------
 APP_NAME = "parser_tap_to_database"
+
+# Insert up to this many log data, or bytes of them as received, at a time.
+# MongoDB limits a message to 16MB; BSON documents come out a bit bigger than
+# the JSON or msgpack we receive, so leave plenty of room.
+DEFAULT_BATCH_RECORDS = 10000
+DEFAULT_BATCH_BYTES = 8 * 1024 * 1024
+
+# Insert whatever's accumulated once the oldest has waited this long.
+DEFAULT_BATCH_SECONDS = 60
+
+# Past this many log data waiting to be inserted keep the rest in the
+# journal only, and read them back as there's room.
+DEFAULT_MAX_IN_MEMORY_RECORDS = 2 * DEFAULT_BATCH_RECORDS
+
+# After a failed insert wait this long before trying again.
+INSERT_RETRY_SECONDS = 5
+
+# On the way out wait this long for the batch being inserted.
+INSERT_STOP_SECONDS = 30
+
+# Flush the journal to disk this often.
+JOURNAL_SYNC_INTERVAL = 1.0
+
+# Save each collection's filter of stored contents_hashes this often.
+FILTER_SAVE_INTERVAL = 300
+
+# Without a saved filter, seed it with the contents_hashes of log data
+# stored this recently.
+DEFAULT_DEDUP_SEED_HOURS = 24
+
+# With a saved filter, seed it with the contents_hashes of log data stored
+# this long before it was saved too.
+DEDUP_SEED_SLACK = datetime.timedelta(minutes=10)
 # ----------------------------------------------------------------------------
 
 # ----------------------------------------------------------------------------
@@ -67,6 +110,7 @@ def get_args():
                         metavar="NAME",
                         default=None,
                         help="MongoDB collection name")
+    add_writer_arguments(parser)
     parser.add_argument("--verbose",
                         dest="verbose",
                         action='store_true',
@@ -75,11 +119,115 @@ def get_args():
     args = parser.parse_args()
     return args
 
+def add_writer_arguments(parser):
+    """ Arguments for how log data are journaled and inserted, shared with
+    database_writer."""
+    parser.add_argument("--contents_hash_format",
+                        dest="contents_hash_format",
+                        choices=contents_hash.CONTENTS_HASH_FORMATS,
+                        default=None,
+                        help="If given, re-hash logs whose contents_hash is in a different format before storing them. By default logs are stored with the contents_hash the parser gave them, in whatever format.")
+    parser.add_argument("--contents_hash_policy",
+                        dest="contents_hash_policy",
+                        choices=contents_hash.CONTENTS_HASH_POLICIES,
+                        default=contents_hash.CONTENTS,
+                        help="What goes into a contents_hash when we re-hash a log.")
+    parser.add_argument("--credit_window",
+                        dest="credit_window",
+                        metavar="INTEGER",
+                        type=int,
+                        default=flow_control.DEFAULT_CREDIT_WINDOW,
+                        help="Most log data the parser may publish to us before we've received them, granted as credits. 0 grants none, and the parser publishes freely. Default is %s." % (flow_control.DEFAULT_CREDIT_WINDOW, ))
+    parser.add_argument("--stats_interval",
+                        dest="stats_interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=60,
+                        help="Log batch and flow statistics this often.")
+    parser.add_argument("--batch_records",
+                        dest="batch_records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_BATCH_RECORDS,
+                        help="Insert up to this many log data at a time. Default is %s." % (DEFAULT_BATCH_RECORDS, ))
+    parser.add_argument("--batch_bytes",
+                        dest="batch_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_BATCH_BYTES,
+                        help="Insert up to this many bytes of log data, as received, at a time. Keep it well under MongoDB's 16MB message limit. Default is %s." % (DEFAULT_BATCH_BYTES, ))
+    parser.add_argument("--batch_seconds",
+                        dest="batch_seconds",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_BATCH_SECONDS,
+                        help="Insert log data once the oldest has waited this long. Default is %s." % (DEFAULT_BATCH_SECONDS, ))
+    parser.add_argument("--max_in_memory_records",
+                        dest="max_in_memory_records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_MAX_IN_MEMORY_RECORDS,
+                        help="Most log data to hold in memory while waiting to insert them. The rest wait in the journal only. Default is %s." % (DEFAULT_MAX_IN_MEMORY_RECORDS, ))
+    parser.add_argument("--journal_directory",
+                        dest="journal_directory",
+                        metavar="DIRECTORY",
+                        default=journal.DEFAULT_JOURNAL_DIRECTORY,
+                        help="Journal log data here, in a directory per collection, until the database acknowledges them. Default is %s." % (journal.DEFAULT_JOURNAL_DIRECTORY, ))
+    parser.add_argument("--journal_segment_bytes",
+                        dest="journal_segment_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=journal.DEFAULT_SEGMENT_BYTES,
+                        help="Size of each journal segment file. Default is %s." % (journal.DEFAULT_SEGMENT_BYTES, ))
+    parser.add_argument("--partitioned",
+                        dest="partitioned",
+                        action="store_true",
+                        default=False,
+                        help="Store log data in a collection per day of their datetime, <collection>.<YYYYMMDD>, so that aging them is dropping whole collections.")
+    parser.add_argument("--no_dedup",
+                        dest="dedup",
+                        action="store_false",
+                        default=True,
+                        help="Don't keep a filter of the contents_hashes each collection has stored recently; try to insert every log datum, and leave it to the unique index to skip duplicates.")
+    parser.add_argument("--dedup_trust_filter",
+                        dest="dedup_trust_filter",
+                        action="store_true",
+                        default=False,
+                        help="Drop log data the filter says are stored without checking the collection. Saves a query per batch, but loses about 1 in %s log data that aren't stored." % (int(1 / dedup.DEFAULT_ERROR_RATE), ))
+    parser.add_argument("--dedup_directory",
+                        dest="dedup_directory",
+                        metavar="DIRECTORY",
+                        default=dedup.DEFAULT_DEDUP_DIRECTORY,
+                        help="Save each collection's filter here every %ss. Default is %s." % (FILTER_SAVE_INTERVAL, dedup.DEFAULT_DEDUP_DIRECTORY))
+    parser.add_argument("--dedup_capacity",
+                        dest="dedup_capacity",
+                        metavar="INTEGER",
+                        type=int,
+                        default=dedup.DEFAULT_CAPACITY,
+                        help="Each collection's filter holds between this many and twice this many of the most recent contents_hashes, in about 3.6 bytes each. Default is %s." % (dedup.DEFAULT_CAPACITY, ))
+    parser.add_argument("--dedup_seed_hours",
+                        dest="dedup_seed_hours",
+                        metavar="HOURS",
+                        type=float,
+                        default=DEFAULT_DEDUP_SEED_HOURS,
+                        help="Without a saved filter, seed it with the contents_hashes of log data up to this many hours old, up to the capacity. Default is %s." % (DEFAULT_DEDUP_SEED_HOURS, ))
+
 @retry()
-def setup_database(collection_name):
+def setup_database(collection_name, db=None, is_partitioned=False):
+    """ Get the collection, with its indexes, or a
+    partitions.PartitionedCollection that indexes each partition as it's
+    created. Pass db to share its connection pool between collections."""
     collection = None
-    db = database.Database()
+    if db is None:
+        db = database.Database()
+    if is_partitioned:
+        return partitions.PartitionedCollection(db.write_database, collection_name, ensure_indexes)
     collection = db.get_collection(collection_name)
+    ensure_indexes(collection)
+    return collection
+
+def ensure_indexes(collection):
+    """ The indexes every collection of log data has."""
     collection.ensure_index("contents_hash",
                             unique=True,
                             drop_dups=True,
@@ -107,9 +255,76 @@ def setup_database(collection_name):
         except pymongo.errors.OperationFailure:
             logger.exception("Exception when requesting index build. Not a disaster.")
             continue
-    return collection
 
-required_fields = ["contents", "year", "month", "day", "hour", "minute", "second"]
+def get_contents_hasher(args, logger):
+    """ What to re-hash logs with, or None to store them as they are."""
+    if args.contents_hash_format is None:
+        return None
+    contents_hasher = contents_hash.ContentsHasher(contents_hash.get_contents_hash_format(args.contents_hash_format, logger),
+                                                   args.contents_hash_policy)
+    logger.info("storing logs with contents_hash from %s" % (contents_hasher, ))
+    return contents_hasher
+
+def get_subscription_socket(context, results_zeromq_binding, credit_window):
+    """ SUBSCRIBE to the parsed logs from a parser."""
+    subscription_socket = context.socket(zmq.SUB)
+    subscription_socket.setsockopt(zmq.SUBSCRIBE, "")
+    # Only allow 1000 messages into the in-memory queue, or room for twice
+    # the credits we grant so that what the parser publishes on them is
+    # never dropped.
+    flow_control.set_hwm(subscription_socket, max(1000, 2 * credit_window))
+    subscription_socket.connect(results_zeromq_binding)
+    return subscription_socket
+
+def get_credit_granter(context, results_zeromq_binding, credit_window, logger):
+    """ Grant the parser credits for the log data we have room for, or
+    None if credit_window is 0."""
+    if credit_window <= 0:
+        return None
+    logger.debug("Granting credits to parser at: %s" % (flow_control.get_credit_binding(results_zeromq_binding), ))
+    return flow_control.CreditGranter(flow_control.get_credit_push_socket(context, results_zeromq_binding),
+                                      credit_window,
+                                      logger)
+
+def get_collection_journal(args, collection_name, logger):
+    """ A collection's journal, in the same place whichever writer it's
+    written by."""
+    journal_directory = os.path.join(args.journal_directory, collection_name)
+    logger.debug("Journaling to: %s" % (journal_directory, ))
+    return journal.SegmentJournal(journal_directory, args.journal_segment_bytes, logger)
+
+def get_contents_hash_filter(args, collection_name, collection, logger):
+    """ The filter of contents_hashes the collection has stored recently,
+    loaded from where it was saved and brought up to date from the
+    collection, or None if args.dedup is False."""
+    if not args.dedup:
+        return None
+    filepath = os.path.join(args.dedup_directory, collection_name + dedup.FILTER_EXTENSION)
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=args.dedup_seed_hours)
+    stored_since = None
+    contents_hash_filter = dedup.ContentsHashFilter.load(filepath, args.dedup_capacity, logger=logger)
+    if contents_hash_filter is None:
+        contents_hash_filter = dedup.ContentsHashFilter(filepath, args.dedup_capacity)
+    else:
+        # Only what's been stored since it was saved is missing, whatever
+        # its datetime, as reconciled and late log data have older ones.
+        # Less DEDUP_SEED_SLACK for batches that were in flight then.
+        stored_since = datetime.datetime.utcfromtimestamp(contents_hash_filter.saved_time) - DEDUP_SEED_SLACK
+    start_time = time.time()
+    try:
+        number_seeded = contents_hash_filter.seed(collection, since, stored_since)
+    except pymongo.errors.PyMongoError:
+        logger.exception("can't seed the contents_hash filter from the collection, carrying on without.")
+        number_seeded = 0
+    if stored_since is None:
+        logger.info("contents_hash filter: %s contents_hashes, %s of them since %s, in %.2fs." % \
+                    (len(contents_hash_filter), number_seeded, since, time.time() - start_time))
+    else:
+        logger.info("contents_hash filter: %s contents_hashes, %s of them stored since %s, in %.2fs." % \
+                    (len(contents_hash_filter), number_seeded, stored_since, time.time() - start_time))
+    return contents_hash_filter
+
+required_fields = ["contents", "datetime"]
 def validate_command(command):
     if not all(field in command for field in required_fields):
         return False
@@ -118,13 +333,14 @@ def validate_command(command):
 def main():
     args = get_args()
     collection_name = args.collection
-    logger = logging.getLogger("%s.%s" % (APP_NAME, collection_name))
+    logger = tracing.get_logger(APP_NAME, collection_name)
     if args.verbose:
         logger.setLevel(logging.DEBUG)
         ch.setLevel(logging.DEBUG)
         logger.debug("Verbose logging enabled.")
     logger.debug("entry.")
-    collection = setup_database(collection_name)
+    collection = setup_database(collection_name, is_partitioned=args.partitioned)
+    contents_hasher = get_contents_hasher(args, logger)
 
     context = zmq.Context(1)
 
@@ -132,129 +348,413 @@ def main():
     #   Subscribing to the parsed logs from a parser.
     # ------------------------------------------------------------------------
     logger.debug("Subscribing to parser at: %s" % (args.results_zeromq_binding, ))
-    subscription_socket = context.socket(zmq.SUB)
-    subscription_socket.setsockopt(zmq.SUBSCRIBE, "")
-    subscription_socket.setsockopt(zmq.HWM, 1000) # only allow 1000 messages into in-memory queue
-    subscription_socket.setsockopt(zmq.SWAP, 10 * 1024 * 1024) # offload 10MB of messages onto disk
-    subscription_socket.connect(args.results_zeromq_binding)
+    subscription_socket = get_subscription_socket(context, args.results_zeromq_binding, args.credit_window)
+    # ------------------------------------------------------------------------
+
+    # ------------------------------------------------------------------------
+    #   Granting the parser credits for the log data we have room for.
+    # ------------------------------------------------------------------------
+    credit_granter = get_credit_granter(context, args.results_zeromq_binding, args.credit_window, logger)
+    # ------------------------------------------------------------------------
+
+    # ------------------------------------------------------------------------
+    #   Journaling log data until the database acknowledges them, and
+    #   replaying any it never did.
+    # ------------------------------------------------------------------------
+    collection_journal = get_collection_journal(args, collection_name, logger)
+    contents_hash_filter = get_contents_hash_filter(args, collection_name, collection, logger)
+    batch_statistics = BatchStatistics(logger, args.stats_interval)
+    flow_counters = batch_statistics.flow_counters
+    writer = CollectionWriter(collection,
+                              collection_journal,
+                              logger,
+                              contents_hasher,
+                              flow_counters,
+                              args.batch_records,
+                              args.batch_seconds,
+                              args.max_in_memory_records,
+                              args.batch_bytes,
+                              contents_hash_filter=contents_hash_filter,
+                              is_filter_trusted=args.dedup_trust_filter)
     # ------------------------------------------------------------------------
 
     poller = zmq.Poller()
     poller.register(subscription_socket, zmq.POLLIN)
     poll_interval = 1000
-    parser_accumulator = []
     try:
         while 1:
             socks = dict(poller.poll(poll_interval))
-            parser_accumulator = send_old_parser_socket_data(collection_name, collection, parser_accumulator)
+            writer.insert_if_due()
             if socks.get(subscription_socket, None) == zmq.POLLIN:
-                parser_accumulator = handle_parser_socket_activity(subscription_socket, collection_name, collection, parser_accumulator)
+                batch_start_time = time.time()
+                (number_of_records, number_of_bytes) = handle_parser_socket_activity(subscription_socket, writer)
+                if credit_granter is not None:
+                    credit_granter.received(number_of_records)
+                batch_statistics.add_batch(1, number_of_bytes, number_of_records, time.time() - batch_start_time)
+            elif credit_granter is not None:
+                credit_granter.grant_if_due()
+            writer.sync_if_due()
+            flow_counters.queued = len(collection_journal)
+            batch_statistics.report_if_due()
 
     except KeyboardInterrupt:
         logger.debug("CTRL-C")
     finally:
         logger.debug("exiting")
+        writer.close(timeout=INSERT_STOP_SECONDS)
+        collection_journal.close()
 
 # --------------------------------------------------------
-#   Insert data once a minute. The reads kill the
-#   database because of how fast and constant they are
-#   so batch up both the reads to determine if the logs
-#   already exist and the insertion.
+#   Insert data in batches. The reads kill the database
+#   because of how fast and constant they are so batch up
+#   both the reads to determine if the logs already exist
+#   and the insertion.
+#
+#   Log data wait in a queue, oldest first, stored as
+#   (datetime_received, sequence, bytes, log_data,
+#   is_maybe_stored). A
+#   batch of up to 'batch_records' or 'batch_bytes' of the
+#   oldest is inserted once the oldest was received more
+#   than 'batch_seconds' ago, or as soon as there's a
+#   full batch; you're going to run into MongoDB's 16MB
+#   message limit if you let them grow. Each batch is
+#   sorted by datetime so the datetime index is inserted
+#   into at its right-hand edge.
+#
+#   Inserts happen in a BatchInserter thread, so that we
+#   keep reading the parser while the database is busy
+#   and the subscription socket doesn't reach its HWM.
+#   One batch is inserted while the next fills: the
+#   queue and the batch in flight are the two buffers.
+#   database_writer shares one BatchInserter between the
+#   writers of every collection.
 #
-#   Do this by maintaining a heap of logs. Logs are
-#   stored as (datetime_received, log_data). Hence
-#   the smallest element of the heap, accessible as O(1),
-#   is the oldest log received. If the oldest log received
-#   is more than 'insert_interval' old insert up to
-#   'chunk_size' elements of the heap.
+#   Every log datum is journaled as it's received, and
+#   only acknowledged in the journal once the database
+#   has acknowledged inserting it. If an insert fails
+#   the batch goes back on the front of the queue and is
+#   tried again later; if we're killed, it's replayed
+#   from the journal when we start. Only one batch is in
+#   flight and batches are in sequence order, so
+#   acknowledging a batch's last sequence acknowledges
+#   everything before it.
 #
-#   Irregardless of when logs are received if we have
-#   more than 'chunk_size' in the heap insert them now;
-#   you're going to run into MongoDB's 16MB query limit
-#   if you don't. (16*1024 / 10000 ~= 1.6KB, safe).
+#   Past 'max_in_memory_records' log data are kept in the
+#   journal only and read back as the queue drains, so
+#   riding out a database outage costs disk, not memory.
+#
+#   With a dedup.ContentsHashFilter, log data whose
+#   contents_hash it has seen are marked maybe stored.
+#   The inserter looks for all of a batch's in one query
+#   and doesn't insert those it finds; the rest were
+#   false positives. With is_filter_trusted they're
+#   dropped as they're received instead. Inserted log
+#   data are added to the filter.
 # --------------------------------------------------------
-def send_old_parser_socket_data(collection_name, collection, parser_accumulator):
-    logger = logging.getLogger("%s.%s.send_old_parser_socket_data" % (APP_NAME, collection_name))
-    datetime_now = datetime.datetime.utcnow()
-    insert_interval = datetime.timedelta(minutes=1)
-
-    if len(parser_accumulator) == 0:
-        return parser_accumulator
-    # The accumulator isn't full, so flush in chunk
-    # pieces every interval.
-    smallest_element = heapq.nsmallest(1, parser_accumulator)[0]
-    smallest_datetime = smallest_element[0]
-    logger.debug("smallest interval: %s" % (datetime_now - smallest_datetime, ))
-    if (datetime_now - smallest_datetime) < insert_interval:
-        return parser_accumulator
-
-    # The oldest log is older than 'insert_interval'.
-    logger.debug("oldest log is too old")
-    chunk_size = 10000
-    data_to_insert = []
-    while len(parser_accumulator) > 0 and len(data_to_insert) <= chunk_size:
-        datum = heapq.heappop(parser_accumulator)[1]
-        data_to_insert.append(datum)
-    if len(data_to_insert) > 0:
-        logger.debug("inserting %s rows, some may be dupes." % (len(data_to_insert), ))
-        insert_into_collection(collection, data_to_insert)
-        gc.collect()
-    return parser_accumulator
-
-def handle_parser_socket_activity(subscription_socket, collection_name, collection, parser_accumulator):
-    logger = logging.getLogger("%s.%s.handle_parser_socket_activity" % (APP_NAME, collection_name))
-    incoming_string = subscription_socket.recv()
-    try:
-        incoming_object = json.loads(incoming_string)
-    except:
-        logger.exception("Can't decode command:\n%s" % (incoming_string, ))
-        return parser_accumulator
-    if not validate_command(incoming_object):
-        logger.error("Not a valid command: \n%s" % (incoming_object))
-        return parser_accumulator
+class BatchInserter(object):
+    """ Inserts batches in number_of_threads background threads, sharing the
+    collections' connection pool. put() a batch, a list of
+    (datetime_received, sequence, bytes, log_data, is_maybe_stored), and its
+    (batch, is_inserted, seconds, number_of_duplicates, number_of_false_positives)
+    is put on results once it's done.
 
-    # --------------------------------------------------------
-    # Re-process the dict to get a real datetime object.
-    # --------------------------------------------------------
-    datetime_obj = datetime.datetime(int(incoming_object["year"]),
-                                     int(incoming_object["month"]),
-                                     int(incoming_object["day"]),
-                                     int(incoming_object["hour"]),
-                                     int(incoming_object["minute"]),
-                                     int(incoming_object["second"]))
-    if "millisecond" in incoming_object:
-        datetime_obj = datetime_obj.replace(microsecond = int(incoming_object["millisecond"]) * 1000)
-    data_to_store = incoming_object.copy()
-    for key in ["year", "month", "day", "hour", "minute", "second", "millisecond"]:
-        if key in data_to_store:
-            data_to_store.pop(key)
-    data_to_store["datetime"] = datetime_obj
-    # --------------------------------------------------------
+    A CollectionWriter has at most one batch in flight, so when several
+    share an inserter batches are taken in turn across collections."""
+
+    def __init__(self, logger, number_of_threads=1):
+        self.logger = logger
+        self.batches = Queue.Queue()
+        self.threads = []
+        for i in xrange(number_of_threads):
+            thread = threading.Thread(target=self.run, name="BatchInserter-%s" % (i, ))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, collection, batch, results):
+        self.batches.put((collection, batch, results))
+
+    def run(self):
+        while 1:
+            item = self.batches.get()
+            if item is None:
+                return
+            (collection, batch, results) = item
+            start_time = time.time()
+            data_to_insert = [data_to_store for (datetime_received, sequence, number_of_bytes, data_to_store, is_maybe_stored) in batch]
+            maybe_stored = [data_to_store["contents_hash"] for (datetime_received, sequence, number_of_bytes, data_to_store, is_maybe_stored) in batch if is_maybe_stored]
+            (number_of_duplicates, number_of_false_positives) = (0, 0)
+            try:
+                if len(maybe_stored) > 0:
+                    stored = find_stored_contents_hashes(collection, maybe_stored)
+                    if stored is not None:
+                        number_of_duplicates = sum(1 for contents_hash in maybe_stored if contents_hash in stored)
+                        number_of_false_positives = len(maybe_stored) - number_of_duplicates
+                        data_to_insert = [data_to_store for data_to_store in data_to_insert
+                                          if data_to_store.get("contents_hash") not in stored]
+                data_to_insert.sort(key=operator.itemgetter("datetime"))
+                if len(data_to_insert) > 0:
+                    is_inserted = insert_into_collection(collection, data_to_insert)
+                else:
+                    is_inserted = True
+            except pymongo.errors.OperationFailure:
+                self.logger.exception("Exception when inserting.")
+                is_inserted = False
+            except:
+                self.logger.exception("unhandled exception when inserting.")
+                is_inserted = False
+            results.put((batch, is_inserted, time.time() - start_time, number_of_duplicates, number_of_false_positives))
+
+    def stop(self, timeout=None):
+        for thread in self.threads:
+            self.batches.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+
+class CollectionWriter(object):
+    def __init__(self, collection, collection_journal, logger, contents_hasher=None, flow_counters=None, batch_records=DEFAULT_BATCH_RECORDS, batch_seconds=DEFAULT_BATCH_SECONDS, max_in_memory_records=DEFAULT_MAX_IN_MEMORY_RECORDS, batch_bytes=DEFAULT_BATCH_BYTES, inserter=None, contents_hash_filter=None, is_filter_trusted=False):
+        self.collection = collection
+        self.journal = collection_journal
+        self.logger = logger
+        self.contents_hasher = contents_hasher
+        self.flow_counters = flow_counters
+        self.batch_records = batch_records
+        self.batch_bytes = batch_bytes
+        self.batch_interval = datetime.timedelta(seconds=batch_seconds)
+        self.max_in_memory_records = max(max_in_memory_records, 2 * batch_records)
+
+        self.queue = collections.deque()
+        self.queue_bytes = 0
+        self.number_in_flight = 0
+        self.retry_time = None
+        self.last_sync_time = time.time()
+        # Without an inserter to share, have one of our own.
+        self.is_inserter_owned = inserter is None
+        if inserter is None:
+            inserter = BatchInserter(logger)
+        self.inserter = inserter
+        self.results = Queue.Queue()
+        self.is_in_flight = False
+        self.contents_hash_filter = contents_hash_filter
+        self.is_filter_trusted = is_filter_trusted
+        self.last_filter_save_time = time.time()
+
+        # For ingest metrics.
+        self.number_received = 0
+        self.number_inserted = 0
+        self.number_failed_inserts = 0
+        self.insert_seconds = 0.0
+
+        # Sequence of the first log datum that's only in the journal, or
+        # None if they're all in the queue.
+        self.journal_only_sequence = None
+        if len(self.journal) > 0:
+            logger.info("replaying %s log data from the journal." % (len(self.journal), ))
+            self.journal_only_sequence = self.journal.acknowledged + 1
+            self.load_from_journal()
+
+    def decode(self, incoming_string):
+        """ Decode either wire format into the document we store, with a real
+        datetime object. Returns None for log data we can't store."""
+        try:
+            data_to_store = wire_format.decode(incoming_string)
+        except ValueError:
+            self.logger.exception("Can't decode command:\n%r" % (incoming_string, ))
+            return None
+        if not validate_command(data_to_store):
+            self.logger.error("Not a valid command: \n%s" % (data_to_store))
+            return None
+
+        # --------------------------------------------------------
+        # While parsers are being moved from one contents_hash
+        # format to another store everything in one format.
+        # --------------------------------------------------------
+        if self.contents_hasher is not None and \
+           not contents_hash.is_format(data_to_store.get("contents_hash"), self.contents_hasher.contents_hash_format):
+            data_to_store["contents_hash"] = self.contents_hasher(data_to_store["contents"], data_to_store["datetime"])
+        # --------------------------------------------------------
+        return data_to_store
+
+    def is_maybe_stored(self, data_to_store):
+        """ True if the filter has seen the log datum's contents_hash."""
+        return self.contents_hash_filter is not None and \
+               "contents_hash" in data_to_store and \
+               data_to_store["contents_hash"] in self.contents_hash_filter
 
-    chunk_size = 10000
-    heapq.heappush(parser_accumulator, (datetime.datetime.utcnow(), data_to_store))
-    data_to_insert = []
-
-    if len(parser_accumulator) > chunk_size:
-        # The accumulator exceeds the chunk size. Flush
-        # in chunk_size pieces.
-        for i in xrange(chunk_size):
-            datum = heapq.heappop(parser_accumulator)[1]
-            data_to_insert.append(datum)
-    if len(data_to_insert) > 0:
-        logger.debug("inserting %s rows, some may be dupes." % (len(data_to_insert), ))
-        insert_into_collection(collection, data_to_insert)
-        gc.collect()
+    def add(self, incoming_string):
+        data_to_store = self.decode(incoming_string)
+        if data_to_store is None:
+            if self.flow_counters is not None:
+                self.flow_counters.dropped += 1
+            return
+        self.number_received += 1
+        is_maybe_stored = self.is_maybe_stored(data_to_store)
+        if is_maybe_stored and self.is_filter_trusted:
+            if self.flow_counters is not None:
+                self.flow_counters.duplicates += 1
+            return
+        sequence = self.journal.append(incoming_string)
+        if self.journal_only_sequence is None:
+            if len(self.queue) + self.number_in_flight < self.max_in_memory_records:
+                self.append((datetime.datetime.utcnow(), sequence, len(incoming_string), data_to_store, is_maybe_stored))
+            else:
+                self.logger.info("%s log data waiting, keeping the rest in the journal only." % (len(self.queue) + self.number_in_flight, ))
+                self.journal_only_sequence = sequence
+        if len(self.queue) >= self.batch_records or self.queue_bytes >= self.batch_bytes:
+            self.insert()
+
+    def append(self, element):
+        self.queue.append(element)
+        self.queue_bytes += element[2]
+
+    def insert_if_due(self):
+        """ Take in the last batch if it's done and insert the next one if
+        the oldest log datum has waited long enough."""
+        self.collect_inserted()
+        if len(self.queue) == 0:
+            return
+        if (len(self.queue) < self.batch_records and self.queue_bytes < self.batch_bytes) and \
+           (datetime.datetime.utcnow() - self.queue[0][0]) < self.batch_interval:
+            return
+        self.insert()
+
+    def insert(self):
+        """ Hand the inserter up to batch_records or batch_bytes of the
+        oldest log data, if it's not still busy with the last batch."""
+        self.collect_inserted()
+        if len(self.queue) == 0 or self.is_in_flight:
+            return
+        if self.retry_time is not None and time.time() < self.retry_time:
+            return
+        batch = []
+        batch_bytes = 0
+        while len(self.queue) > 0 and len(batch) < self.batch_records and \
+              (len(batch) == 0 or batch_bytes + self.queue[0][2] <= self.batch_bytes):
+            element = self.queue.popleft()
+            batch.append(element)
+            batch_bytes += element[2]
+        self.queue_bytes -= batch_bytes
+        self.number_in_flight = len(batch)
+        self.logger.debug("inserting %s rows, %s bytes, some may be dupes." % (len(batch), batch_bytes))
+        self.is_in_flight = True
+        self.inserter.put(self.collection, batch, self.results)
+
+    def collect_inserted(self, block=False, timeout=None):
+        """ Acknowledge the batch in flight in the journal once the database
+        has, or queue it again if it failed."""
+        try:
+            (batch, is_inserted, seconds, number_of_duplicates, number_of_false_positives) = self.results.get(block, timeout)
+        except Queue.Empty:
+            return
+        self.is_in_flight = False
+        self.number_in_flight = 0
+        self.insert_seconds += seconds
+        if is_inserted:
+            self.number_inserted += len(batch) - number_of_duplicates
+            self.journal.acknowledge(batch[-1][1])
+            if self.flow_counters is not None:
+                self.flow_counters.duplicates += number_of_duplicates
+                self.flow_counters.false_positives += number_of_false_positives
+            if self.contents_hash_filter is not None:
+                # Those it said were maybe stored it already has.
+                for (datetime_received, sequence, number_of_bytes, data_to_store, is_maybe_stored) in batch:
+                    if not is_maybe_stored and "contents_hash" in data_to_store:
+                        self.contents_hash_filter.add(data_to_store["contents_hash"])
+            self.retry_time = None
+            self.load_from_journal()
+        else:
+            self.logger.error("failed to insert %s log data, will try again in %ss. %s waiting in the journal." % \
+                              (len(batch), INSERT_RETRY_SECONDS, len(self.journal)))
+            self.number_failed_inserts += 1
+            self.queue.extendleft(reversed(batch))
+            self.queue_bytes += sum(element[2] for element in batch)
+            self.retry_time = time.time() + INSERT_RETRY_SECONDS
+
+    def load_from_journal(self):
+        """ Queue log data that are only in the journal, as there's room."""
+        if self.journal_only_sequence is None:
+            return
+        room = self.max_in_memory_records - len(self.queue) - self.number_in_flight
+        if room <= 0:
+            return
+        # They've waited already, so insert them as soon as we can.
+        datetime_received = datetime.datetime.utcnow() - self.batch_interval
+        for (sequence, incoming_string) in self.journal.read(self.journal_only_sequence, room):
+            data_to_store = self.decode(incoming_string)
+            if data_to_store is not None:
+                self.append((datetime_received, sequence, len(incoming_string), data_to_store, self.is_maybe_stored(data_to_store)))
+            self.journal_only_sequence = sequence + 1
+        if self.journal_only_sequence >= self.journal.next_sequence:
+            self.journal_only_sequence = None
+
+    def flush(self, timeout=None):
+        """ Insert everything queued, waiting for each batch. Returns True
+        if everything was inserted."""
+        start_time = time.time()
+        while len(self.queue) > 0 or self.journal_only_sequence is not None or self.is_in_flight:
+            if timeout is not None and (time.time() - start_time) > timeout:
+                return False
+            self.retry_time = None
+            self.insert()
+            time.sleep(0.01)
+            self.collect_inserted()
+        return True
+
+    def sync_if_due(self):
+        time_now = time.time()
+        if (time_now - self.last_sync_time) >= JOURNAL_SYNC_INTERVAL:
+            self.journal.sync()
+            self.last_sync_time = time_now
+        if self.contents_hash_filter is not None and (time_now - self.last_filter_save_time) >= FILTER_SAVE_INTERVAL:
+            self.save_filter()
+            self.last_filter_save_time = time_now
+
+    def save_filter(self):
+        try:
+            self.contents_hash_filter.save()
+        except (IOError, OSError):
+            self.logger.exception("can't save the contents_hash filter to %s." % (self.contents_hash_filter.filepath, ))
+
+    def close(self, timeout=None):
+        """ Wait for the batch in flight, if any, so that it's acknowledged in
+        the journal, save the filter, and stop the inserter if it's ours."""
+        if self.is_in_flight:
+            self.collect_inserted(block=True, timeout=timeout)
+        if self.contents_hash_filter is not None:
+            self.save_filter()
+        if self.is_inserter_owned:
+            self.inserter.stop(timeout)
+
+def handle_parser_socket_activity(subscription_socket, writer):
+    """ Returns a two-element tuple (elem1, elem2).
+    -   elem1: number of log data received.
+    -   elem2: number of bytes received."""
+    # --------------------------------------------------------
+    # Parsers publish a batch of log data as one multipart
+    # message, one encoded log datum per part.
     # --------------------------------------------------------
+    parts = subscription_socket.recv_multipart()
+    for incoming_string in parts:
+        writer.add(incoming_string)
+    return (len(parts), sum(len(part) for part in parts))
 
-    if len(parser_accumulator) % 1000 == 0:
-        logger.debug("returning parser_accumulator of length: %s" % (len(parser_accumulator), ))
-    return parser_accumulator
+@retry()
+def find_stored_contents_hashes(collection, contents_hashes):
+    """ Returns the set of contents_hashes already in the collection, or
+    None if it couldn't be reached."""
+    cursor = collection.find({"contents_hash": {"$in": contents_hashes}}, {"contents_hash": 1, "_id": 0})
+    return set(row["contents_hash"] for row in cursor)
 
 @retry()
 def insert_into_collection(collection, data):
-    collection.insert(data, continue_on_error=True)
+    """ Returns True once the database has acknowledged the insert, or None
+    if it couldn't be reached. Log data already stored, i.e. with the same
+    contents_hash, are skipped."""
+    try:
+        collection.insert(data, continue_on_error=True, safe=True)
+    except pymongo.errors.DuplicateKeyError:
+        pass
+    return True
 
 if __name__ == "__main__":
     main()
-
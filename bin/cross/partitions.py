@@ -0,0 +1,326 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Day-partitioned collections, so that aging the logs is dropping whole
+#   collections rather than removing documents a block at a time.
+#
+#   A stream, i.e. a box and log like "jabbah2_ngmg_ep_parser", is written
+#   to one collection per UTC day of its log data's datetime, named
+#   <stream>.<YYYYMMDD>, e.g. "jabbah2_ngmg_ep_parser.20120301". Every
+#   partition has the indexes the unpartitioned collection would.
+#
+#   PartitionedCollection stands in for a stream's collection, whether it's
+#   partitioned, unpartitioned as streams were written before, or both
+#   while moving from one to the other. Reads go to the partitions that
+#   overlap the datetime range of the query, and the unpartitioned
+#   collection if there is one, and cursors are merged to look like one.
+#   Writes go to the partition of each document's datetime, creating and
+#   indexing it first if need be.
+#
+#   The unique index on contents_hash is per partition. A log datum sent
+#   again has the same datetime, so goes to the same partition and is
+#   still only stored once.
+# ----------------------------------------------------------------------------
+
+import re
+import time
+import heapq
+import datetime
+import itertools
+
+import pymongo
+
+APP_NAME = "partitions"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+PARTITION_FIELD = "datetime"
+PARTITION_DATE_FORMAT = "%Y%m%d"
+PARTITION_INTERVAL = datetime.timedelta(days=1)
+PARTITION_NAME_RE = re.compile(r"^(?P<stream_name>.+)\.(?P<date>\d{8})$")
+
+# Look for partitions that other processes have created this often.
+COLLECTION_NAMES_REFRESH_SECONDS = 60
+
+def get_partition_name(stream_name, datetime_obj):
+    return "%s.%s" % (stream_name, datetime_obj.strftime(PARTITION_DATE_FORMAT))
+
+def split_partition_name(collection_name):
+    """ Returns a two-element tuple (elem1, elem2).
+    -   elem1: the stream's name.
+    -   elem2: datetime at the start of the partition's day, or None if
+        collection_name isn't a partition."""
+    m = PARTITION_NAME_RE.search(collection_name)
+    if m is None:
+        return (collection_name, None)
+    try:
+        day = datetime.datetime.strptime(m.group("date"), PARTITION_DATE_FORMAT)
+    except ValueError:
+        return (collection_name, None)
+    return (m.group("stream_name"), day)
+
+def get_stream_names(collection_names):
+    """ Sorted names of the streams in a database's collections."""
+    stream_names = set(split_partition_name(collection_name)[0] for collection_name in collection_names
+                       if not collection_name.startswith("system."))
+    return sorted(stream_names)
+
+def is_partitioned(collection_names, stream_name):
+    """ True if the stream has any partitions."""
+    for collection_name in collection_names:
+        (name, day) = split_partition_name(collection_name)
+        if name == stream_name and day is not None:
+            return True
+    return False
+
+def get_stream_collection_names(collection_names, stream_name, start_datetime=None, end_datetime=None):
+    """ Names of the stream's collections that may hold log data with a
+    datetime between start_datetime and end_datetime, either of which may
+    be None. The unpartitioned collection, if any, comes first, then the
+    partitions oldest first."""
+    unpartitioned = []
+    partitioned = []
+    for collection_name in collection_names:
+        (name, day) = split_partition_name(collection_name)
+        if name != stream_name:
+            continue
+        if day is None:
+            unpartitioned.append(collection_name)
+        elif (start_datetime is None or day + PARTITION_INTERVAL > start_datetime) and \
+             (end_datetime is None or day <= end_datetime):
+            partitioned.append((day, collection_name))
+    partitioned.sort()
+    return unpartitioned + [collection_name for (day, collection_name) in partitioned]
+
+def get_expired_collection_names(collection_names, oldest_datetime, newest_datetime):
+    """ Names of partitions that only hold log data with a datetime before
+    oldest_datetime or after newest_datetime."""
+    expired = []
+    for collection_name in sorted(collection_names):
+        (stream_name, day) = split_partition_name(collection_name)
+        if day is None:
+            continue
+        if day + PARTITION_INTERVAL <= oldest_datetime or day > newest_datetime:
+            expired.append(collection_name)
+    return expired
+
+def get_datetime_bounds(spec, field=PARTITION_FIELD):
+    """ Returns a two-element tuple (elem1, elem2), the earliest and latest
+    datetime a query spec could match on field, either None if it's not
+    bounded that way."""
+    (start_datetime, end_datetime) = (None, None)
+    if not spec or field not in spec:
+        return (start_datetime, end_datetime)
+    condition = spec[field]
+    if isinstance(condition, datetime.datetime):
+        return (condition, condition)
+    if isinstance(condition, dict):
+        for operator in ["$gt", "$gte"]:
+            if isinstance(condition.get(operator), datetime.datetime):
+                start_datetime = condition[operator]
+        for operator in ["$lt", "$lte"]:
+            if isinstance(condition.get(operator), datetime.datetime):
+                end_datetime = condition[operator]
+    return (start_datetime, end_datetime)
+
+class Descending(object):
+    """ Orders the value it wraps backwards, to merge cursors sorted
+    descending."""
+    __slots__ = ["value"]
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+class PartitionedCursor(object):
+    """ Cursors over several collections that read as one. If sorted, on a
+    single key, their rows are merged in order, otherwise each cursor is
+    read in turn."""
+
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.sort_key = None
+        self.sort_direction = pymongo.ASCENDING
+        self.limit_count = 0
+        self.iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, list):
+            assert(len(key_or_list) == 1), "can only sort partitions on one key, not %s" % (key_or_list, )
+            (key, direction) = key_or_list[0]
+        else:
+            key = key_or_list
+        if direction is None:
+            direction = pymongo.ASCENDING
+        for cursor in self.cursors:
+            cursor.sort(key, direction)
+        (self.sort_key, self.sort_direction) = (key, direction)
+        return self
+
+    def limit(self, limit):
+        for cursor in self.cursors:
+            cursor.limit(limit)
+        self.limit_count = limit
+        return self
+
+    def batch_size(self, batch_size):
+        for cursor in self.cursors:
+            cursor.batch_size(batch_size)
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        total = sum(cursor.count(with_limit_and_skip) for cursor in self.cursors)
+        if with_limit_and_skip and self.limit_count:
+            total = min(total, self.limit_count)
+        return total
+
+    def rewind(self):
+        for cursor in self.cursors:
+            cursor.rewind()
+        self.iterator = None
+        return self
+
+    def get_sorted_rows(self, index, cursor):
+        key = self.sort_key
+        if self.sort_direction == pymongo.DESCENDING:
+            for (i, row) in enumerate(cursor):
+                yield ((Descending(row.get(key)), index, i), row)
+        else:
+            for (i, row) in enumerate(cursor):
+                yield ((row.get(key), index, i), row)
+
+    def get_iterator(self):
+        if self.sort_key is None:
+            rows = itertools.chain(*self.cursors)
+        else:
+            rows = (row for (sort_value, row) in heapq.merge(*[self.get_sorted_rows(index, cursor)
+                                                               for (index, cursor) in enumerate(self.cursors)]))
+        if self.limit_count:
+            rows = itertools.islice(rows, self.limit_count)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.iterator is None:
+            self.iterator = self.get_iterator()
+        return self.iterator.next()
+
+class PartitionedCollection(object):
+    """ A stream's collections, read and written as one. See the top of this
+    module. ensure_indexes(collection) is called for each partition the
+    first time we write to it."""
+
+    def __init__(self, database, stream_name, ensure_indexes=None):
+        self.database = database
+        self.name = stream_name
+        self.ensure_indexes = ensure_indexes
+        self.collection_names = []
+        self.last_refresh_time = None
+        self.indexed_partition_names = set()
+
+    def __repr__(self):
+        return "PartitionedCollection(%s, %s)" % (self.database.name, self.name)
+
+    def get_collection_names(self, start_datetime=None, end_datetime=None):
+        time_now = time.time()
+        if self.last_refresh_time is None or (time_now - self.last_refresh_time) >= COLLECTION_NAMES_REFRESH_SECONDS:
+            self.collection_names = get_stream_collection_names(self.database.collection_names(), self.name)
+            self.last_refresh_time = time_now
+        return get_stream_collection_names(self.collection_names, self.name, start_datetime, end_datetime)
+
+    def get_collections(self, spec=None):
+        (start_datetime, end_datetime) = get_datetime_bounds(spec)
+        return [self.database[collection_name] for collection_name in self.get_collection_names(start_datetime, end_datetime)]
+
+    def get_partition(self, datetime_obj):
+        """ The partition to write a log datum with datetime_obj to."""
+        partition_name = get_partition_name(self.name, datetime_obj)
+        partition = self.database[partition_name]
+        if partition_name not in self.indexed_partition_names:
+            if partition_name not in self.collection_names:
+                logger.info("%s: writing to partition %s." % (self.name, partition_name))
+            if self.ensure_indexes is not None:
+                self.ensure_indexes(partition)
+            self.indexed_partition_names.add(partition_name)
+            if partition_name not in self.collection_names:
+                self.collection_names.append(partition_name)
+        return partition
+
+    def insert(self, data, *args, **kwargs):
+        """ Insert each document into the partition of its datetime. Every
+        partition is inserted into even if one raises, then the first
+        exception is raised."""
+        if isinstance(data, dict):
+            data = [data]
+        data_by_partition_name = {}
+        for data_to_store in data:
+            partition_name = get_partition_name(self.name, data_to_store[PARTITION_FIELD])
+            data_by_partition_name.setdefault(partition_name, []).append(data_to_store)
+        first_exception = None
+        for (partition_name, data_to_insert) in sorted(data_by_partition_name.iteritems()):
+            partition = self.get_partition(data_to_insert[0][PARTITION_FIELD])
+            try:
+                partition.insert(data_to_insert, *args, **kwargs)
+            except pymongo.errors.OperationFailure, e:
+                if first_exception is None:
+                    first_exception = e
+        if first_exception is not None:
+            raise first_exception
+
+    def find(self, spec=None, fields=None, *args, **kwargs):
+        return PartitionedCursor([collection.find(spec, fields, *args, **kwargs) for collection in self.get_collections(spec)])
+
+    def find_one(self, spec=None, *args, **kwargs):
+        """ Newest partitions first."""
+        for collection in reversed(self.get_collections(spec)):
+            row = collection.find_one(spec, *args, **kwargs)
+            if row is not None:
+                return row
+        return None
+
+    def count(self):
+        return sum(collection.count() for collection in self.get_collections())
+
+    def group(self, key, condition, initial, reduce, *args, **kwargs):
+        """ group() each collection and combine the groups with the same key.
+        Only correct if reduce sums into initial, as counting does."""
+        if isinstance(key, dict):
+            key_names = sorted(key)
+        else:
+            key_names = sorted(key or [])
+        groups = {}
+        for collection in self.get_collections(condition):
+            for row in collection.group(key, condition, initial, reduce, *args, **kwargs):
+                group_key = tuple(row.get(key_name) for key_name in key_names)
+                if group_key not in groups:
+                    groups[group_key] = row
+                    continue
+                for (field, value) in initial.iteritems():
+                    groups[group_key][field] += row[field]
+        return groups.values()
+
+    def ensure_index(self, *args, **kwargs):
+        for collection in self.get_collections():
+            collection.ensure_index(*args, **kwargs)
@@ -6,6 +6,58 @@
 # file license.txt or http://www.opensource.org/licenses/mit-license.php.
 # -----------------------------------------------------------------------------
 
+# -----------------------------------------------------------------------------
+#   Fill the gaps in a box's log that the real-time robust_ssh_tap missed,
+#   e.g. during a network outage, without cat'ing every rotated file.
+#
+#   Every --interval seconds we stat the log file and its rotated copies
+#   over SSH, and for each file, by inode so that it's followed through
+#   rotation, keep a checkpoint: the byte offset the database is known to
+#   be complete up to. The bytes a file grew by since the last pass are
+#   known complete by the next pass if masspinger saw the host responsive
+#   throughout, as robust_ssh_tap will have stored them. If the host was
+#   unresponsive, or masspinger wasn't watching, that byte range is fetched
+#   with tail -c and head -c, parsed, and inserted. A checkpoint only moves
+#   past a range once it's inserted, so a range that fails is fetched again
+#   next pass.
+#
+#   Ranges are fetched at most --max_range_bytes at a time through one
+#   ssh_tap and a parser that's left running, and inserted in batches of
+#   chunk_size, so memory is bounded by neither the size of the log nor
+#   of the outage.
+#
+#   The first pass only records where every file is. A new file, e.g. the
+#   live log after rotation, is checked from its start.
+#
+#   Range boundaries come from file sizes, so are at the end of a line
+#   unless stat caught the box mid-write. A range is cut into pieces at
+#   the line breaks after each --max_range_bytes, and the parser only
+#   flushes an idle log datum after longer than it's idle between pieces,
+#   so a multi-line log datum is only cut short where its range ends. The
+#   parser is restarted after a piece fails and before a piece that
+#   doesn't follow on from the last, so it never joins the lines of two
+#   ranges.
+#
+#   With --compare a range isn't fetched whole. The box summarises it per
+#   minute, with awk: a run of lines whose first timestamp has the same
+#   HH:MM, its byte offset and length, the number of non-blank lines and
+#   the MD5 of those lines sorted. We summarise the log data the database
+#   has for the same minutes, from their contents, in the box's local time
+#   given by date +%z. Only the runs that don't match are fetched. Sorting
+#   makes the summary independent of the order log data with the same
+#   datetime come back from the database in. Lines with no timestamp
+#   belong to the run before them, as the parser makes them part of the
+#   log datum before them; a log datum whose lines straddle a minute
+#   doesn't match, so costs fetching the two minutes again.
+#
+#   Every pass reports the bytes it transferred against what cat'ing every
+#   file, as reconcile_log used to, would have.
+#
+#   With --scheduler a due pass waits for catch_up_scheduler to grant it,
+#   saying whether this log has a gap so that it's granted sooner, and
+#   reports how long each insert takes while it runs.
+# -----------------------------------------------------------------------------
+
 import os
 import sys
 import argparse
@@ -19,13 +71,22 @@ import signal
 from glob import glob
 import pprint
 import random
-import heapq
-import gc
+import operator
+import socket
+import tempfile
+import hashlib
 
 import zmq
+import paramiko
+import pymongo
 
 from utilities import retry
 import database
+import wire_format
+import tracing
+import flow_control
+import partitions
+import catch_up_scheduler
 
 # -----------------------------------------------------------------------------
 #   Logging.
@@ -65,8 +126,400 @@ except:
     raise
 five_days = datetime.timedelta(days=5)
 one_day = datetime.timedelta(days=1)
+chunk_size = 10000
+
+DEFAULT_CHECKPOINT_DIRECTORY = os.path.join(tempfile.gettempdir(), "rill_reconcile")
+CHECKPOINT_EXTENSION = ".checkpoint"
+SPILL_SUBDIRECTORY = "spill"
+DEFAULT_INTERVAL_SECONDS = 10 * 60
+DEFAULT_MAX_RANGE_BYTES = 16 * 1024 * 1024
+STAT_TIMEOUT_SECONDS = 20
+RANGE_TIMEOUT_SECONDS = 10 * 60
+
+# How far a log datum's datetime may be from when we saw its bytes on the
+# box. Without the box's UTC offset, any offset it could have.
+COMPARE_SLACK = datetime.timedelta(minutes=10)
+MAXIMUM_UTC_OFFSET = datetime.timedelta(hours=14)
+
+# Once ssh_tap has finished a piece, the parser's last log data are in once
+# it's been quiet this long.
+DRAIN_SECONDS = 10
+
+# The parser flushes an idle log datum after longer than we wait for it to
+# drain a piece and for ssh_tap to connect for the next one. At the end of a
+# range we wait for that flush as well.
+PARSER_IDLE_FLUSH_SECONDS = DRAIN_SECONDS + STAT_TIMEOUT_SECONDS + 10
+
+# Time for a restarted parser to subscribe to ssh_tap.
+PARSER_START_SECONDS = 2
+
+# Rotated copies we can't tail -c into.
+COMPRESSED_EXTENSIONS = [".gz", ".bz2", ".xz", ".Z", ".zip"]
 # -----------------------------------------------------------------------------
 
+class Checkpoints(object):
+    """ Per file of one box's log, keyed by inode, as a dict of:
+    -   offset: bytes the database is known to be complete up to.
+    -   since: epoch seconds since when an outage means the bytes after
+        offset may be missing.
+    -   size, time: the file's size, and epoch seconds, at the last pass.
+    -   path: where the file was at the last pass.
+
+    Saved to filepath as JSON with the epoch seconds of the last pass."""
+
+    def __init__(self, filepath, files=None, last_pass_time=None):
+        self.filepath = filepath
+        if files is None:
+            files = {}
+        self.files = files
+        self.last_pass_time = last_pass_time
+
+    @classmethod
+    def load(cls, filepath, logger=logger):
+        if not os.path.isfile(filepath):
+            return cls(filepath)
+        try:
+            with open(filepath) as f:
+                tree = json.load(f)
+        except ValueError:
+            logger.exception("%s: unreadable, starting afresh." % (filepath, ))
+            return cls(filepath)
+        return cls(filepath, tree["files"], tree["last_pass_time"])
+
+    def save(self):
+        """ Write to filepath, replacing it atomically."""
+        directory = os.path.dirname(self.filepath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary_filepath = self.filepath + ".tmp"
+        with open(temporary_filepath, "w") as f:
+            json.dump({"files": self.files, "last_pass_time": self.last_pass_time}, f, indent=4, sort_keys=True)
+        if os.name == "nt" and os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+        os.rename(temporary_filepath, self.filepath)
+
+    def plan(self, log_files, time_now, has_outage):
+        """ Given the (inode, size, path) of every file now, and
+        has_outage(since, until), a function of epoch seconds, return the
+        ranges to fetch as a list of (inode, path, start, end, start_time,
+        end_time), the bytes being written between epoch seconds start_time
+        and end_time, and mark the rest known complete. Files that are gone
+        are forgotten."""
+        ranges = []
+        files = {}
+        for (inode, size, path) in log_files:
+            key = str(inode)
+            state = self.files.get(key)
+            if state is None:
+                if self.last_pass_time is None:
+                    state = {"offset": size, "since": time_now, "size": size, "time": time_now}
+                else:
+                    state = {"offset": 0, "since": self.last_pass_time, "size": 0, "time": self.last_pass_time}
+            elif size < state["size"]:
+                # Truncated, e.g. by logrotate's copytruncate.
+                state.update({"offset": 0, "since": state["time"], "size": 0})
+            if state["size"] > state["offset"]:
+                if has_outage(state["since"], time_now):
+                    ranges.append((inode, path, state["offset"], state["size"], state["since"], state["time"]))
+                else:
+                    state.update({"offset": state["size"], "since": state["time"]})
+            state.update({"size": size, "time": time_now, "path": path})
+            files[key] = state
+        self.files = files
+        self.last_pass_time = time_now
+        return ranges
+
+    def get_pending(self):
+        """ Returns a two-element tuple (elem1, elem2).
+        -   elem1: epoch seconds since when an outage means bytes after the
+            checkpoints may be missing, or None before the first pass.
+        -   elem2: bytes the checkpoints were behind at the last pass."""
+        if self.last_pass_time is None:
+            return (None, 0)
+        pending = [state for state in self.files.itervalues() if state["size"] > state["offset"]]
+        since = min([state["since"] for state in pending] + [self.last_pass_time])
+        return (since, sum(state["size"] - state["offset"] for state in pending))
+
+    def confirm(self, inode, offset, since=None):
+        """ The database is complete up to offset of the file, and if since
+        is given, nothing after offset could be missing before since."""
+        state = self.files.get(str(inode))
+        if state is None:
+            return
+        state["offset"] = offset
+        if since is not None:
+            state["since"] = since
+
+def get_checkpoint_filepath(checkpoint_directory, collection_name):
+    return os.path.join(checkpoint_directory, collection_name + CHECKPOINT_EXTENSION)
+
+def execute_command(host, username, password, command, timeout):
+    """ Returns the output of command on host, or None if it can't be run."""
+    logger = tracing.get_logger(APP_NAME, "execute_command", host)
+    ssh = paramiko.SSHClient()
+    try:
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(host, username=username, password=password, timeout=timeout)
+        (stdin, stdout, stderr) = ssh.exec_command(command)
+        stdout.channel.settimeout(timeout)
+        return stdout.read()
+    except (socket.error, socket.timeout, paramiko.SSHException):
+        logger.exception("can't execute '%s'." % (command, ))
+        return None
+    finally:
+        ssh.close()
+
+def get_log_files(host, username, password, log_file, timeout=STAT_TIMEOUT_SECONDS):
+    """ Returns a list of (inode, size, path) of log_file and its rotated
+    copies, or None if we can't tell."""
+    output = execute_command(host, username, password, "stat -c '%%i %%s %%n' %s*" % (log_file, ), timeout)
+    if output is None:
+        return None
+    log_files = []
+    for line in output.splitlines():
+        fields = line.split(" ", 2)
+        if len(fields) != 3 or not fields[0].isdigit() or not fields[1].isdigit():
+            continue
+        (inode, size, path) = (int(fields[0]), int(fields[1]), fields[2])
+        if os.path.splitext(path)[1] in COMPRESSED_EXTENSIONS:
+            continue
+        log_files.append((inode, size, path))
+    return log_files
+
+def get_range_command(path, inode, start, end):
+    """ Shell command that outputs bytes start to end of the file with inode
+    in path's directory, wherever it's been rotated to."""
+    return "nice -n 19 ionice -c3 find %s -maxdepth 1 -inum %s -exec tail -c +%s {} \\; | head -c %s" % \
+           (os.path.dirname(path), inode, start + 1, end - start)
+
+# --------------------------------------------------------
+#   Summarise the lines on stdin per minute, see the top
+#   of this module. Prints one line per run:
+#
+#   HH:MM offset bytes lines md5
+#
+#   where md5 is "-" for a run of blank lines, and HH:MM
+#   is "?" for the lines before the first timestamp.
+#   Only the run's key, counts and md5 are buffered, the
+#   lines go straight to sort.
+# --------------------------------------------------------
+SUMMARY_AWK = r"""
+function flush_run() {
+    if (key == "") return
+    printf "%s %d %d %d ", key, run_start, run_bytes, lines
+    if (lines == 0) { print "-"; return }
+    fflush()
+    close(cmd)
+}
+BEGIN { cmd = "LC_ALL=C sort | md5sum"; key = "" }
+{
+    n = length($0) + 1
+    line = $0
+    sub(/\r$/, "", line)
+    k = key
+    if (match(line, /[0-9][0-9]:[0-9][0-9]:[0-9][0-9]/) && RSTART <= 40) k = substr(line, RSTART, 5)
+    else if (key == "") k = "?"
+    if (k != key) { flush_run(); key = k; run_start = offset; run_bytes = 0; lines = 0 }
+    offset += n
+    run_bytes += n
+    if (line != "") { lines++; print line | cmd }
+}
+END { flush_run() }
+"""
+
+def get_summary_command(path, inode, start, end):
+    """ Shell command that outputs the box's UTC offset, then the summary of
+    bytes start to end of the file with inode in path's directory."""
+    return "date +%z; " + get_range_command(path, inode, start, end) + \
+           " | LC_ALL=C nice -n 19 awk -v offset=" + str(start) + " '" + SUMMARY_AWK + "'"
+
+def parse_utc_offset(text):
+    """ datetime.timedelta of date +%z's output, e.g. "-0500", or None."""
+    text = text.strip()
+    if len(text) != 5 or text[0] not in "+-" or not text[1:].isdigit():
+        return None
+    utc_offset = datetime.timedelta(hours=int(text[1:3]), minutes=int(text[3:5]))
+    if text[0] == "-":
+        return -utc_offset
+    return utc_offset
+
+def get_remote_summaries(host, username, password, path, inode, start, end):
+    """ Returns a three-element tuple (elem1, elem2, elem3), or None if the
+    box can't summarise the range.
+    -   elem1: the box's UTC offset as a datetime.timedelta, or None.
+    -   elem2: list of runs, (key, offset, bytes, lines, md5).
+    -   elem3: bytes of output transferred."""
+    output = execute_command(host, username, password, get_summary_command(path, inode, start, end), RANGE_TIMEOUT_SECONDS)
+    if output is None:
+        return None
+    output_lines = output.splitlines()
+    if len(output_lines) == 0:
+        return None
+    utc_offset = parse_utc_offset(output_lines[0])
+    runs = []
+    for output_line in output_lines[1:]:
+        fields = output_line.split()
+        if len(fields) < 5 or not all(field.isdigit() for field in fields[1:4]):
+            continue
+        runs.append((fields[0], int(fields[1]), int(fields[2]), int(fields[3]), fields[4]))
+    return (utc_offset, runs, len(output))
+
+def get_summary(lines):
+    """ (lines, md5) of a minute's non-blank lines, as the box's awk and
+    sort | md5sum make it."""
+    lines = sorted(line for line in lines if line)
+    return (len(lines), hashlib.md5("".join(line + "\n" for line in lines)).hexdigest())
+
+@retry()
+def get_stored_summaries(collection, start_datetime, end_datetime):
+    """ Returns a dict of HH:MM to the set of (lines, md5) of the log data in
+    collection with a datetime between start_datetime and end_datetime, one
+    per day that has that minute. Reads one minute's contents at a time."""
+    summaries = {}
+    (minute, lines) = (None, [])
+    cursor = collection.find({"datetime": {"$gte": start_datetime, "$lt": end_datetime}},
+                             {"datetime": 1, "contents": 1, "_id": 0})
+    for row in cursor.sort("datetime", pymongo.ASCENDING).batch_size(1000):
+        row_minute = row["datetime"].replace(second=0, microsecond=0)
+        if row_minute != minute:
+            if minute is not None:
+                summaries.setdefault(minute.strftime("%H:%M"), set()).add(get_summary(lines))
+            (minute, lines) = (row_minute, [])
+        contents = row.get("contents", "")
+        if isinstance(contents, unicode):
+            contents = contents.encode("utf-8")
+        lines.extend(contents.split("\n"))
+    if minute is not None:
+        summaries.setdefault(minute.strftime("%H:%M"), set()).add(get_summary(lines))
+    return summaries
+
+def is_run_stored(run, stored_summaries):
+    (key, offset, number_of_bytes, number_of_lines, md5) = run
+    return number_of_lines == 0 or (number_of_lines, md5) in stored_summaries.get(key, ())
+
+def get_missing_ranges(runs):
+    """ Byte ranges, (start, end), of runs, with adjacent runs merged."""
+    missing_ranges = []
+    for (key, offset, number_of_bytes, number_of_lines, md5) in runs:
+        if len(missing_ranges) > 0 and missing_ranges[-1][1] == offset:
+            missing_ranges[-1] = (missing_ranges[-1][0], offset + number_of_bytes)
+        else:
+            missing_ranges.append((offset, offset + number_of_bytes))
+    return missing_ranges
+
+def get_compared_ranges(host, parser_name, username, password, collection, path, inode, start, end, start_time, end_time):
+    """ Returns a two-element tuple (elem1, elem2).
+    -   elem1: the byte ranges of start to end that the database is
+        missing, or [(start, end)] if the box can't summarise it.
+    -   elem2: bytes of summary transferred."""
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name, "get_compared_ranges")
+    remote_summaries = get_remote_summaries(host, username, password, path, inode, start, end)
+    if remote_summaries is None:
+        return ([(start, end)], 0)
+    (utc_offset, runs, summary_bytes) = remote_summaries
+    if utc_offset is None:
+        (before, after) = (MAXIMUM_UTC_OFFSET, MAXIMUM_UTC_OFFSET)
+    else:
+        (before, after) = (-utc_offset, utc_offset)
+    start_datetime = datetime.datetime.utcfromtimestamp(start_time) - before - COMPARE_SLACK
+    end_datetime = datetime.datetime.utcfromtimestamp(end_time) + after + COMPARE_SLACK
+    stored_summaries = get_stored_summaries(collection, start_datetime, end_datetime)
+    if stored_summaries is None:
+        return ([(start, end)], summary_bytes)
+    missing_runs = [run for run in runs if not is_run_stored(run, stored_summaries)]
+    missing_ranges = [(max(start, range_start), min(end, range_end))
+                      for (range_start, range_end) in get_missing_ranges(missing_runs)]
+    logger.info("%s bytes %s to %s: %s of %s minutes differ, %s bytes." % \
+                (path, start, end, len(missing_runs), len(runs),
+                 sum(range_end - range_start for (range_start, range_end) in missing_ranges)))
+    return (missing_ranges, summary_bytes)
+
+def get_gap(checkpoints, pings_collection, time_now):
+    """ Returns a two-element tuple (elem1, elem2), for the scheduler.
+    -   elem1: True if the next pass may have bytes to fetch.
+    -   elem2: bytes we already know it will have to consider."""
+    (since, pending_bytes) = checkpoints.get_pending()
+    if since is None:
+        return (False, 0)
+    return (has_outage(pings_collection, since, time_now) is not False, pending_bytes)
+
+def split_range(start, end, max_range_bytes):
+    return [(piece_start, min(piece_start + max_range_bytes, end))
+            for piece_start in xrange(start, end, max_range_bytes)]
+
+def get_line_breaks_command(path, inode, offsets):
+    """ Shell command that outputs, for each offset, the number of bytes from
+    the byte before it to the end of its line."""
+    return "find %s -maxdepth 1 -inum %s -exec sh -c 'for offset in %s; do tail -c +$offset \"$0\" | head -n 1 | wc -c; done' {} \\;" % \
+           (os.path.dirname(path), inode, " ".join(str(offset) for offset in offsets))
+
+def split_range_at_line_breaks(host, username, password, path, inode, start, end, max_range_bytes):
+    """ Returns split_range's pieces, with each cut moved on to the next line
+    break, or None if the line breaks can't be found."""
+    pieces = split_range(start, end, max_range_bytes)
+    if len(pieces) == 1:
+        return pieces
+    cuts = [piece_end for (piece_start, piece_end) in pieces[:-1]]
+    output = execute_command(host, username, password, get_line_breaks_command(path, inode, cuts), STAT_TIMEOUT_SECONDS)
+    if output is None:
+        return None
+    lengths = output.split()
+    if len(lengths) != len(cuts) or not all(length.isdigit() for length in lengths):
+        return None
+    boundaries = [start]
+    for (cut, length) in zip(cuts, lengths):
+        boundary = min(cut - 1 + int(length), end)
+        if boundary > boundaries[-1] and boundary < end:
+            boundaries.append(boundary)
+    boundaries.append(end)
+    return zip(boundaries[:-1], boundaries[1:])
+
+class RangeParser(object):
+    """ The parser that ranges are streamed through, and the inode and
+    offset it was last fed up to. It keeps the end of any line and log
+    datum it's been fed that isn't finished, so it's restarted before it's
+    fed a piece that doesn't follow on."""
+
+    def __init__(self, command, verbose):
+        self.command = command
+        self.verbose = verbose
+        self.process = None
+        self.position = None
+
+    def keep_running(self, logger):
+        if self.process is None:
+            logger.info("parser_process not running, so restart it.")
+            self.process = start_process(self.command, self.verbose)
+            self.position = None
+        if self.process.poll() is not None:
+            logger.info("parser_process ended, return code %s." % (self.process.poll(), ))
+            self.process = None
+
+    def follows(self, inode, offset):
+        """ True if the parser is new or was last fed up to offset of inode."""
+        return self.position is None or self.position == (inode, offset)
+
+    def restart(self, logger):
+        logger.info("restarting parser_process.")
+        self.terminate()
+        self.keep_running(logger)
+        time.sleep(PARSER_START_SECONDS)
+
+    def terminate(self):
+        terminate_process(self.process, "parser_process", kill=True)
+        self.process = None
+        self.position = None
+
+@retry()
+def has_outage(pings_collection, since, until):
+    """ True if masspinger saw the host unresponsive between epoch seconds
+    since and until, or wasn't watching it."""
+    datetime_range = {"$gte": datetime.datetime.utcfromtimestamp(since),
+                      "$lte": datetime.datetime.utcfromtimestamp(until)}
+    if pings_collection.find_one({"datetime": datetime_range, "responsive": False}) is not None:
+        return True
+    return pings_collection.find_one({"datetime": datetime_range}) is None
+
 def create_context():
     context = zmq.Context(1)
     return context
@@ -77,8 +530,7 @@ def close_context(context):
 def create_parser_sub_socket(context, parser_zeromq_binding):
     parser_sub_socket = context.socket(zmq.SUB)
     parser_sub_socket.setsockopt(zmq.SUBSCRIBE, "")
-    parser_sub_socket.setsockopt(zmq.HWM, 100) # only allow 100 messages into in-memory queue
-    parser_sub_socket.setsockopt(zmq.SWAP, 10 * 1024 * 1024) # offload 10MB of messages onto disk
+    flow_control.set_hwm(parser_sub_socket, 100) # only allow 100 messages into in-memory queue
     parser_sub_socket.connect(parser_zeromq_binding)
     return parser_sub_socket
 
@@ -106,24 +558,36 @@ def main(masspinger_zeromq_binding,
          parser_zeromq_binding,
          parser_name,
          host,
-         command,
+         log_file,
          username,
          password,
          timeout,
          collection_name,
-         verbose):
-    logger = logging.getLogger("%s.main.%s.%s" % (APP_NAME, host, parser_name))
+         verbose,
+         partitioned=False,
+         checkpoint_directory=DEFAULT_CHECKPOINT_DIRECTORY,
+         interval=DEFAULT_INTERVAL_SECONDS,
+         max_range_bytes=DEFAULT_MAX_RANGE_BYTES,
+         compare=False,
+         scheduler_zeromq_binding=None):
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name)
     logger.debug("entry.")
     logger.debug("masspinger_zeromq_binding: %s" % (masspinger_zeromq_binding, ))
     logger.debug("ssh_tap_zeromq_binding: %s" % (ssh_tap_zeromq_binding, ))
     logger.debug("parser_zeromq_binding: %s" % (parser_zeromq_binding, ))
     logger.debug("parser_name: %s" % (parser_name, ))
     logger.debug("host: %s" % (host, ))
-    logger.debug("command: %s" % (command, ))
+    logger.debug("log_file: %s" % (log_file, ))
     logger.debug("username: %s" % (username, ))
     logger.debug("timeout: %s" % (timeout, ))
     logger.debug("collection_name: %s" % (collection_name, ))
     logger.debug("verbose: %s" % (verbose, ))
+    logger.debug("partitioned: %s" % (partitioned, ))
+    logger.debug("checkpoint_directory: %s" % (checkpoint_directory, ))
+    logger.debug("interval: %s" % (interval, ))
+    logger.debug("max_range_bytes: %s" % (max_range_bytes, ))
+    logger.debug("compare: %s" % (compare, ))
+    logger.debug("scheduler_zeromq_binding: %s" % (scheduler_zeromq_binding, ))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -165,8 +629,6 @@ def main(masspinger_zeromq_binding,
     assert(not all([is_bin_parser, is_cross_parser])), "Parser is both a binary and a cross."
     # ------------------------------------------------------------------------
 
-    context = None
-
     # ------------------------------------------------------------------------
     # State for monitoring the liveliness of the host.
     # ------------------------------------------------------------------------
@@ -176,30 +638,19 @@ def main(masspinger_zeromq_binding,
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
-    # State for executing ssh_tap
+    # State for the passes. The first is at a random point in the first
+    # interval so that every box's reconcile_log doesn't SSH in at once.
     # ------------------------------------------------------------------------
     logger.debug("ssh_tap location: %s" % (ssh_tap_filepath, ))
-    ssh_tap_process = None
-    ssh_tap_command = ssh_tap_template.substitute(executable = ssh_tap_filepath,
-                                                  host = host,
-                                                  command = command,
-                                                  username = username,
-                                                  password = password,
-                                                  zeromq_bind = ssh_tap_zeromq_binding).strip()
-    #if verbose:
-    #    ssh_tap_command += " --verbose"
-    logger.debug("ssh_tap_command: %s" % (ssh_tap_command, ))
-    ssh_tap_interval_minutes_minimum = 60
-    ssh_tap_interval_minutes_maximum = 120
-    ssh_tap_interval = datetime.timedelta(minutes = random.randint(ssh_tap_interval_minutes_minimum, ssh_tap_interval_minutes_maximum))
-    next_ssh_tap_runtime = datetime.datetime.utcnow() #+ ssh_tap_interval
+    checkpoint_filepath = get_checkpoint_filepath(checkpoint_directory, collection_name)
+    checkpoints = Checkpoints.load(checkpoint_filepath)
+    next_pass_time = time.time() + random.uniform(0, min(interval, 60))
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
     # State for the parser.
     # ------------------------------------------------------------------------
     logger.debug("parser location: %s" % (parser_filepath, ))
-    parser_process = None
     if is_bin_parser:
         parser_executable = os.path.join(bin_directory, parser_name + bin_extension)
     else:
@@ -207,52 +658,38 @@ def main(masspinger_zeromq_binding,
         parser_executable += os.path.join(cross_bin_directory, parser_name + ".py")
     parser_command = parser_template.substitute(executable = parser_executable,
                                                 ssh_tap_zeromq_bind = ssh_tap_zeromq_binding,
-                                                parser_zeromq_bind = parser_zeromq_binding).strip()
+                                                parser_zeromq_bind = parser_zeromq_binding,
+                                                box_name = collection_name).strip()
+    # Our parser's box_name is the live parser's, so it needs its own spill
+    # directory or it would publish, and then truncate, the live parser's
+    # spilled log data.
+    parser_command += ' --spill_directory "%s"' % (os.path.join(checkpoint_directory, SPILL_SUBDIRECTORY), )
+    parser_command += " --idle_flush_seconds %s" % (PARSER_IDLE_FLUSH_SECONDS, )
     #if verbose:
     #    parser_command += " --verbose"
     logger.debug("parser command: %s" % (parser_command, ))
+    range_parser = RangeParser(parser_command, verbose)
     # ------------------------------------------------------------------------
 
-    (db, collection) = setup_database(collection_name)
+    (db, collection) = setup_database(collection_name, partitioned)
+    pings_collection = setup_pings_database(host)
+    context = create_context()
+    masspinger_sub_socket = create_masspinger_sub_socket(context, masspinger_zeromq_binding, host)
+    parser_sub_socket = create_parser_sub_socket(context, parser_zeromq_binding)
+    sockets = [masspinger_sub_socket, parser_sub_socket]
+    catch_up_client = None
+    if scheduler_zeromq_binding is not None:
+        catch_up_client = catch_up_scheduler.CatchUpClient(context, scheduler_zeromq_binding, host, collection_name, logger)
+        sockets.append(catch_up_client.socket)
+    poller = create_poller(sockets)
+    poll_interval = 1000
     parser_accumulator = []
 
     try:
         while 1:
-            if context is None:
-                logger.info("ZeroMQ context is None, so create.")
-                context = create_context()
-                masspinger_sub_socket = create_masspinger_sub_socket(context, masspinger_zeromq_binding, host)
-                parser_sub_socket = create_parser_sub_socket(context, parser_zeromq_binding)
-                poller = create_poller([masspinger_sub_socket, parser_sub_socket])
-                poll_interval = 1000
-            if host_alive:
-                if ssh_tap_process is None:
-                    if (datetime.datetime.utcnow() > next_ssh_tap_runtime):
-                        logger.info("ssh_tap_process not running, so restart it.")
-                        ssh_tap_process = start_process(ssh_tap_command, verbose)
-                if parser_process is None:
-                    logger.info("parser_process not running, so restart it.")
-                    parser_process = start_process(parser_command, verbose)
-            else:
-                if ssh_tap_process and (ssh_tap_process.poll() is None):
-                    logger.info("ssh_tap_process running but host dead, so kill it.")
-                    terminate_process(ssh_tap_process, "ssh_tap_process")
-                if parser_process and (parser_process.poll() is None):
-                    logger.info("parser running but host dead, so kill it.")
-                    terminate_process(parser_process, "parser_process")
-
-            if ssh_tap_process and (ssh_tap_process.poll() is not None):
-                logger.info("ssh_tap_process ended, return code %s." % (ssh_tap_process.poll(), ))
-                ssh_tap_process = None
-                ssh_tap_interval = datetime.timedelta(minutes = random.randint(ssh_tap_interval_minutes_minimum, ssh_tap_interval_minutes_maximum))
-                next_ssh_tap_runtime = datetime.datetime.utcnow() + ssh_tap_interval
-                #terminate_process(parser_process, "parser_process")
-            if parser_process and (parser_process.poll() is not None):
-                logger.info("parser_process ended, return code %s." % (parser_process.poll(), ))
-                parser_process = None
+            range_parser.keep_running(logger)
 
             socks = dict(poller.poll(poll_interval))
-            parser_accumulator = send_old_parser_socket_data(host, parser_name, db, collection, parser_accumulator)
             if socks.get(masspinger_sub_socket, None) == zmq.POLLIN:
                 # Receive host liveliness.
                 [hostname, contents] = masspinger_sub_socket.recv_multipart()
@@ -260,109 +697,220 @@ def main(masspinger_zeromq_binding,
                 last_host_response_time = time.time()
                 logger.debug(contents)
             if socks.get(parser_sub_socket, None) == zmq.POLLIN:
+                # Stragglers from the last range, e.g. an idle log datum
+                # flushed late.
                 parser_accumulator = handle_parser_socket_activity(host, parser_name, parser_sub_socket, db, collection, parser_accumulator)
+                flush_parser_accumulator(collection, parser_accumulator)
+            if catch_up_client is not None:
+                if socks.get(catch_up_client.socket, None) == zmq.POLLIN:
+                    catch_up_client.receive(time.time())
+                catch_up_client.resend_if_due(time.time())
             if (host_alive == False) and ((time.time() - last_host_response_time) > last_host_response_time_threshold):
                 # If we haven't received an update about the host
                 # within a certain amount of time assume masspinger
                 # is dead and further assume the host is alive.
                 logger.debug("Assuming masspinger is dead, and host is alive")
                 host_alive = True
-            if (ssh_tap_process is None) and (len(parser_accumulator) == 0):
-                # ssh_tap is gone so there won't be more results. parser_accumulator is empty so we're
-                # not processing any more results. Hence let's kill the ZeroMQ context; it may be
-                # leaking memory and this is a cover up.
-                logger.debug("No more results, so close ZeroMQ objects.")
-                close_poller(poller, [masspinger_sub_socket, parser_sub_socket])
-                for socket in [masspinger_sub_socket, parser_sub_socket]:
-                    close_socket(socket)
-                close_context(context)
-                context = None
-                masspinger_sub_socket = None
-                parser_sub_socket = None
-                poller = None
-
-                # !!AI need some way to tell the parser to do the same, but for now let's just collapse.
-                #logger.info("!!AI quitting to clean up memory. expect to be re-launched.")
-                #sys.exit(1)
+            if time.time() < next_pass_time:
+                continue
+            if catch_up_client is None:
+                if host_alive:
+                    reconcile(host, parser_name, username, password, log_file, checkpoints, pings_collection,
+                              ssh_tap_zeromq_binding, range_parser, parser_sub_socket, db, collection, max_range_bytes, verbose, compare)
+                    next_pass_time = time.time() + interval
+                continue
+            # Ask catch_up_scheduler for a turn, and take it once granted.
+            if host_alive and not (catch_up_client.is_waiting or catch_up_client.is_granted):
+                (gap, gap_bytes) = get_gap(checkpoints, pings_collection, time.time())
+                catch_up_client.request(gap, gap_bytes, time.time())
+            if catch_up_client.may_run(time.time()):
+                try:
+                    reconcile(host, parser_name, username, password, log_file, checkpoints, pings_collection,
+                              ssh_tap_zeromq_binding, range_parser, parser_sub_socket, db, collection, max_range_bytes, verbose, compare,
+                              catch_up_client)
+                finally:
+                    catch_up_client.done()
+                next_pass_time = time.time() + interval
 
     except KeyboardInterrupt:
         logger.debug("CTRL-C")
     finally:
-        terminate_process(ssh_tap_process, "ssh_tap_process", kill=True)
-        terminate_process(parser_process, "parser_process", kill=True)
+        range_parser.terminate()
+        if catch_up_client is not None:
+            catch_up_client.done()
+        close_poller(poller, sockets)
+        for socket in sockets:
+            close_socket(socket)
+        close_context(context)
         logger.debug("finished.")
 
+def reconcile(host, parser_name, username, password, log_file, checkpoints, pings_collection,
+              ssh_tap_zeromq_binding, range_parser, parser_sub_socket, db, collection, max_range_bytes, verbose, compare=False,
+              catch_up_client=None):
+    """ One pass: find the byte ranges that may be missing and fetch them,
+    or with compare the parts of them that differ, saving checkpoints as
+    each range is inserted. Insert latencies are reported to
+    catch_up_client, if given."""
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name, "reconcile")
+    log_files = get_log_files(host, username, password, log_file)
+    if log_files is None:
+        return
+    is_first_pass = checkpoints.last_pass_time is None
+    ranges = checkpoints.plan(log_files,
+                              time.time(),
+                              lambda since, until: has_outage(pings_collection, since, until) is not False)
+    checkpoints.save()
+    if is_first_pass:
+        logger.info("first pass, recorded %s files." % (len(log_files), ))
+    (summary_bytes, log_bytes) = (0, 0)
+    for (inode, path, start, end, start_time, end_time) in ranges:
+        logger.info("fetching %s bytes %s to %s after an outage." % (path, start, end))
+        if compare:
+            (missing_ranges, range_summary_bytes) = get_compared_ranges(host, parser_name, username, password, collection,
+                                                                        path, inode, start, end, start_time, end_time)
+            summary_bytes += range_summary_bytes
+        else:
+            missing_ranges = [(start, end)]
+        pieces = []
+        is_fetched = True
+        for (range_start, range_end) in missing_ranges:
+            range_pieces = split_range_at_line_breaks(host, username, password, path, inode, range_start, range_end, max_range_bytes)
+            if range_pieces is None:
+                logger.error("can't find the line breaks in %s bytes %s to %s, will try again next pass." % (path, range_start, range_end))
+                is_fetched = False
+                break
+            pieces.extend(range_pieces)
+        for (i, (piece_start, piece_end)) in enumerate(pieces):
+            if not range_parser.follows(inode, piece_start):
+                range_parser.restart(logger)
+            # Wait for the parser to flush its last log datum where a range
+            # ends, as it may be restarted before the next piece.
+            is_range_end = i + 1 == len(pieces) or pieces[i + 1][0] != piece_end
+            drain_seconds = DRAIN_SECONDS + (PARSER_IDLE_FLUSH_SECONDS if is_range_end else 0)
+            if not fetch_range(host, parser_name, username, password, path, inode, piece_start, piece_end,
+                               ssh_tap_zeromq_binding, parser_sub_socket, db, collection, verbose, catch_up_client, drain_seconds):
+                logger.error("failed to fetch %s bytes %s to %s, will try again next pass." % (path, piece_start, piece_end))
+                # It may hold part of the piece, which is fetched again.
+                range_parser.restart(logger)
+                is_fetched = False
+                break
+            range_parser.position = (inode, piece_end)
+            log_bytes += piece_end - piece_start
+            if is_range_end:
+                # Everything before the piece either matched or was fetched,
+                # and the parser has published all of it.
+                checkpoints.confirm(inode, piece_end)
+                checkpoints.save()
+        if is_fetched:
+            checkpoints.confirm(inode, end, end_time)
+            checkpoints.save()
+    if len(ranges) > 0:
+        full_bytes = sum(size for (inode, size, path) in log_files)
+        transferred_bytes = summary_bytes + log_bytes
+        logger.info("transferred %s bytes, %s of summaries and %s of log, for %s bytes after outages. A full-file reconcile would transfer %s bytes, %.2f%% of it." % \
+                    (transferred_bytes, summary_bytes, log_bytes,
+                     sum(end - start for (inode, path, start, end, start_time, end_time) in ranges),
+                     full_bytes, 100.0 * transferred_bytes / max(full_bytes, 1)))
+
+def fetch_range(host, parser_name, username, password, path, inode, start, end,
+                ssh_tap_zeromq_binding, parser_sub_socket, db, collection, verbose, catch_up_client=None,
+                drain_seconds=DRAIN_SECONDS):
+    """ Stream bytes start to end of a file through ssh_tap and the parser,
+    inserting log data as they arrive until the parser's been quiet for
+    drain_seconds after ssh_tap exits. Returns True once they're all
+    inserted."""
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name, "fetch_range")
+    command = get_range_command(path, inode, start, end)
+    ssh_tap_command = ssh_tap_template.substitute(executable = ssh_tap_filepath,
+                                                  host = host,
+                                                  command = command,
+                                                  username = username,
+                                                  password = password,
+                                                  zeromq_bind = ssh_tap_zeromq_binding).strip()
+    logger.debug("ssh_tap_command: %s" % (ssh_tap_command, ))
+    start_time = time.time()
+    ssh_tap_process = start_process(ssh_tap_command, verbose)
+    last_activity_time = time.time()
+    ssh_tap_exit_time = None
+    parser_accumulator = []
+    number_of_records = 0
+    try:
+        while 1:
+            time_now = time.time()
+            if (time_now - start_time) > RANGE_TIMEOUT_SECONDS:
+                logger.error("timed out.")
+                return False
+            if ssh_tap_process.poll() is not None:
+                if ssh_tap_exit_time is None:
+                    ssh_tap_exit_time = time_now
+                if (time_now - max(last_activity_time, ssh_tap_exit_time)) > drain_seconds:
+                    break
+            if parser_sub_socket.poll(100) == zmq.POLLIN:
+                parser_accumulator = handle_parser_socket_activity(host, parser_name, parser_sub_socket, db, collection, parser_accumulator)
+                last_activity_time = time.time()
+            if len(parser_accumulator) >= chunk_size:
+                number_of_records += len(parser_accumulator)
+                if not flush_parser_accumulator(collection, parser_accumulator, catch_up_client):
+                    return False
+        if ssh_tap_process.returncode != 0:
+            logger.error("ssh_tap_process return code %s." % (ssh_tap_process.returncode, ))
+            return False
+        number_of_records += len(parser_accumulator)
+        if not flush_parser_accumulator(collection, parser_accumulator, catch_up_client):
+            return False
+    finally:
+        terminate_process(ssh_tap_process, "ssh_tap_process", kill=True)
+    logger.debug("%s bytes, %s records in %.1fs." % (end - start, number_of_records, time.time() - start_time))
+    return True
+
 # --------------------------------------------------------
-#   Insert data once a minute. The reads kill the
-#   database because of how fast and constant they are
-#   so batch up both the reads to determine if the logs
-#   already exist and the insertion.
+#   fetch_range inserts log data in chunks of 'chunk_size'
+#   as the parser publishes them, and what's left at the
+#   end of each range, so that however big a range is we
+#   hold no more than a chunk of it.
 #
-#   Do this by maintaining a heap of logs. Logs are
-#   stored as (datetime_received, log_data). Hence
-#   the smallest element of the heap, accessible as O(1),
-#   is the oldest log received. If the oldest log received
-#   is more than 'insert_interval' old insert up to
-#   'chunk_size' elements of the heap.
+#   A range is mostly log data we already have, so inserts
+#   are safe and duplicate keys are expected.
 #
-#   Irregardless of when logs are received if we have
-#   more than 'chunk_size' in the heap insert them now;
-#   you're going to run into MongoDB's 16MB query limit
-#   if you don't. (16*1024 / 10000 ~= 1.6KB, safe).
+#   How long each insert took goes to catch_up_client, if
+#   any, so the scheduler can tell when Mongo's struggling.
 # --------------------------------------------------------
-def send_old_parser_socket_data(host, parser_name, db, collection, parser_accumulator):
-    logger = logging.getLogger("%s.main.%s.%s.send_old_parser_socket_data" % (APP_NAME, host, parser_name))
-    datetime_now = datetime.datetime.utcnow()
-    insert_interval = datetime.timedelta(minutes=1)
-
+def flush_parser_accumulator(collection, parser_accumulator, catch_up_client=None):
     if len(parser_accumulator) == 0:
-        return parser_accumulator
-    # The accumulator isn't full, so flush in chunk
-    # pieces every interval.
-    smallest_element = heapq.nsmallest(1, parser_accumulator)[0]
-    smallest_datetime = smallest_element[0]
-    if (datetime_now - smallest_datetime) < insert_interval:
-        return parser_accumulator
+        return True
+    parser_accumulator.sort(key=operator.itemgetter("datetime"))
+    insert_start_time = time.time()
+    rv = insert_into_collection(collection, parser_accumulator)
+    if catch_up_client is not None:
+        catch_up_client.report_latency(time.time() - insert_start_time)
+    del parser_accumulator[:]
+    return rv is True
 
-    # The oldest log is older than 'insert_interval'.
-    logger.debug("oldest log is too old")
-    chunk_size = 10000
-    data_to_insert = []
-    while len(parser_accumulator) > 0 and len(data_to_insert) <= chunk_size:
-        datum = heapq.heappop(parser_accumulator)[1]
-        data_to_insert.append(datum)
-    if len(data_to_insert) > 0:
-        logger.debug("inserting %s rows, some may be dupes." % (len(data_to_insert), ))
-        insert_into_collection(collection, data_to_insert)
-        gc.collect()
+def handle_parser_socket_activity(host, parser_name, parser_sub_socket, db, collection, parser_accumulator):
+    # --------------------------------------------------------
+    # Parsers publish a batch of log data as one multipart
+    # message, one encoded log datum per part.
+    # --------------------------------------------------------
+    for incoming_string in parser_sub_socket.recv_multipart():
+        parser_accumulator = handle_parser_message(host, parser_name, incoming_string, db, collection, parser_accumulator)
     return parser_accumulator
 
-def handle_parser_socket_activity(host, parser_name, parser_sub_socket, db, collection, parser_accumulator):
-    logger = logging.getLogger("%s.main.%s.%s.handle_parser_socket_activity" % (APP_NAME, host, parser_name))
-    incoming_string = parser_sub_socket.recv()
+def handle_parser_message(host, parser_name, incoming_string, db, collection, parser_accumulator):
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name, "handle_parser_message")
     #logger.debug("Update: '%s'" % (incoming_string, ))
+    # --------------------------------------------------------
+    # Decode either wire format into the document we store,
+    # with a real datetime object.
+    # --------------------------------------------------------
     try:
-        incoming_object = json.loads(incoming_string)
-    except:
-        logger.exception("Can't decode command:\n%s" % (incoming_string, ))
+        data_to_store = wire_format.decode(incoming_string)
+    except ValueError:
+        logger.exception("Can't decode command:\n%r" % (incoming_string, ))
         return parser_accumulator
-    if not validate_command(incoming_object):
-        logger.error("Not a valid command: \n%s" % (incoming_object))
+    if not validate_command(data_to_store):
+        logger.error("Not a valid command: \n%s" % (data_to_store))
         return parser_accumulator
-
-    # --------------------------------------------------------
-    # Re-process the dict to get a real datetime object.
-    # --------------------------------------------------------
-    datetime_obj = datetime.datetime(int(incoming_object["year"]),
-                                     int(incoming_object["month"]),
-                                     int(incoming_object["day"]),
-                                     int(incoming_object["hour"]),
-                                     int(incoming_object["minute"]),
-                                     int(incoming_object["second"]))
-    data_to_store = incoming_object.copy()
-    for key in ["year", "month", "day", "hour", "minute", "second"]:
-        data_to_store.pop(key)
-    data_to_store["datetime"] = datetime_obj
+    datetime_obj = data_to_store["datetime"]
     if datetime.datetime.utcnow() - five_days > datetime_obj:
         #logger.debug("Log is too old.")
         return parser_accumulator
@@ -371,47 +919,48 @@ def handle_parser_socket_activity(host, parser_name, parser_sub_socket, db, coll
         return parser_accumulator
     # --------------------------------------------------------
 
-    chunk_size = 10000
-    heapq.heappush(parser_accumulator, (datetime.datetime.utcnow(), data_to_store))
-    data_to_insert = []
-
-    if len(parser_accumulator) > chunk_size:
-        # The accumulator exceeds the chunk size. Flush
-        # in chunk_size pieces.
-        for i in xrange(chunk_size):
-            datum = heapq.heappop(parser_accumulator)[1]
-            data_to_insert.append(datum)
-    if len(data_to_insert) > 0:
-        logger.debug("inserting %s rows, some may be dupes." % (len(data_to_insert), ))
-        insert_into_collection(collection, data_to_insert)
-        gc.collect()
-    # --------------------------------------------------------
-
-    if len(parser_accumulator) % 1000 == 0:
-        logger.debug("returning parser_accumulator of length: %s" % (len(parser_accumulator), ))
+    parser_accumulator.append(data_to_store)
     return parser_accumulator
 
-required_fields = ["contents", "year", "month", "day", "hour", "minute", "second"]
+required_fields = ["contents", "datetime"]
 def validate_command(command):
     if not all(field in command for field in required_fields):
         return False
     return True
 
 @retry()
-def setup_database(collection_name):
+def setup_database(collection_name, is_partitioned=False):
     db = database.Database()
-    collection = db.get_collection(collection_name)
+    if is_partitioned:
+        collection = partitions.PartitionedCollection(db.write_database, collection_name, ensure_contents_hash_index)
+    else:
+        collection = db.get_collection(collection_name)
+        ensure_contents_hash_index(collection)
+    return (db, collection)
+
+def ensure_contents_hash_index(collection):
     collection.ensure_index("contents_hash",
                             unique=True,
                             drop_dups=True)
-    return (db, collection)
+
+@retry()
+def setup_pings_database(host):
+    db = database.Database(database_name = "pings")
+    return db.get_read_collection("%s_pings" % (host, ))
 
 @retry()
 def insert_into_collection(collection, data):
-    collection.insert(data, continue_on_error=True)
+    try:
+        collection.insert(data, continue_on_error=True, safe=True)
+    except pymongo.errors.DuplicateKeyError:
+        pass
+    except pymongo.errors.OperationFailure:
+        logger.exception("Exception when inserting.")
+        return False
+    return True
 
 def start_process(command_line, verbose = False):
-    logger = logging.getLogger("%s.start_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "start_process")
     logger.debug("Starting: command_line: %s, verbose: %s" % (command_line, verbose))
     null_fp = open(os.devnull, "w")
     if platform.system() == "Linux":
@@ -438,7 +987,7 @@ def start_process(command_line, verbose = False):
     return proc
 
 def terminate_process(process_object, process_name, kill=False):
-    logger = logging.getLogger("%s.terminate_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "terminate_process")
     logger.debug("Terminating: %s" % (process_name, ))
     if not process_object:
         return True
@@ -484,11 +1033,11 @@ if __name__ == "__main__":
                         metavar="DNS_OR_IP",
                         required=True,
                         help="DNS hostname or IP address to SSH to.")
-    parser.add_argument("--command",
-                        dest="command",
-                        metavar="COMMAND",
+    parser.add_argument("--log_file",
+                        dest="log_file",
+                        metavar="PATH",
                         required=True,
-                        help="Command to execute.")
+                        help="Full path of the log file on the host. Its rotated copies are <PATH>*.")
     parser.add_argument("--username",
                         dest="username",
                         metavar="USERNAME",
@@ -509,6 +1058,38 @@ if __name__ == "__main__":
                         metavar="COLLECTION",
                         default=None,
                         help="MongoDB collection to insert logs into.")
+    parser.add_argument("--partitioned",
+                        dest="partitioned",
+                        action='store_true',
+                        default=False,
+                        help="Insert logs into a collection per day, <collection>.<YYYYMMDD>.")
+    parser.add_argument("--checkpoint_directory",
+                        dest="checkpoint_directory",
+                        metavar="DIRECTORY",
+                        default=DEFAULT_CHECKPOINT_DIRECTORY,
+                        help="Directory to keep how far each log file is known to be stored in. Default is %s." % (DEFAULT_CHECKPOINT_DIRECTORY, ))
+    parser.add_argument("--interval",
+                        dest="interval",
+                        metavar="SECONDS",
+                        type=int,
+                        default=DEFAULT_INTERVAL_SECONDS,
+                        help="Seconds between passes. Default is %s." % (DEFAULT_INTERVAL_SECONDS, ))
+    parser.add_argument("--max_range_bytes",
+                        dest="max_range_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=DEFAULT_MAX_RANGE_BYTES,
+                        help="Fetch a missing byte range at most this many bytes at a time. Default is %s." % (DEFAULT_MAX_RANGE_BYTES, ))
+    parser.add_argument("--compare",
+                        dest="compare",
+                        action='store_true',
+                        default=False,
+                        help="Compare per-minute summaries of a range that may be missing with the database, and only fetch the minutes that differ.")
+    parser.add_argument("--scheduler",
+                        dest="scheduler_zeromq_binding",
+                        metavar="ZEROMQ_BINDING",
+                        default=None,
+                        help="catch_up_scheduler to ask for a turn before each pass, e.g. tcp://127.0.0.1:10003.")
     parser.add_argument("--verbose",
                         dest="verbose",
                         action='store_true',
@@ -525,11 +1106,17 @@ if __name__ == "__main__":
          parser_zeromq_binding = args.parser_zeromq_binding,
          parser_name = args.parser_name,
          host = args.host,
-         command = args.command,
+         log_file = args.log_file,
          username = args.username,
          password = args.password,
          timeout = args.timeout,
          collection_name = args.collection_name,
-         verbose = args.verbose)
+         verbose = args.verbose,
+         partitioned = args.partitioned,
+         checkpoint_directory = args.checkpoint_directory,
+         interval = args.interval,
+         max_range_bytes = args.max_range_bytes,
+         compare = args.compare,
+         scheduler_zeromq_binding = args.scheduler_zeromq_binding)
 
     logger.debug("finishing.")
@@ -64,9 +64,10 @@ except:
 # -----------------------------------------------------------------------------
 
 from utilities import GlobalConfig, BoxConfig, LogFile, ParserConfig, StoreConfig, parse_config_files
+import tracing
 
 def add_service_to_service_registry(port, service_name, service_value):
-    logger = logging.getLogger("%s.add_service_to_service_registry" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "add_service_to_service_registry")
     logger.debug("entry. port: %s, service_name: %s, service_value: %s" % (port, service_name, service_value))
     url = "http://127.0.0.1:%s/add_service" % (port, )
     data = {"service_data": json.dumps({service_name: service_value})}
@@ -75,7 +76,7 @@ def add_service_to_service_registry(port, service_name, service_value):
     r.raise_for_status()
 
 def main(verbose):
-    logger = logging.getLogger("%s.main" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "main")
     logger.debug("entry. verbose: %s" % (verbose, ))
 
     rv = parse_config_files()
@@ -157,6 +158,14 @@ def main(verbose):
         parser_port = int(global_config.get_parser_port_start())
         results_port = int(global_config.get_results_port_start())
         commands = []
+        reconcile_log_commands = []
+        parser_farm_streams = []
+        is_parser_farm = global_config.get_parser_farm()
+        is_database_writer = global_config.get_database_writer()
+        is_partitioned = global_config.get_partitioned_collections()
+        is_reconcile_log = global_config.get_reconcile_log()
+        is_catch_up_scheduler = is_reconcile_log and global_config.get_catch_up_scheduler()
+        catch_up_scheduler_port = global_config.get_catch_up_scheduler_port()
         is_global_production = global_config.get_production()
         for box_config in box_configs:
             if is_global_production and not box_config.get_production():
@@ -230,6 +239,17 @@ def main(verbose):
                         password = password).strip()
                 if global_config.get_robust_ssh_tap_verbose():
                     command += " --verbose"
+                if is_parser_farm and parser_name in parser_farm_classes:
+                    command += " --no_parser"
+                    parser_farm_streams.append(parser_farm_stream_template.substitute( \
+                            parser_name = parser_name,
+                            box_name = "%s_%s" % (host, parser_name),
+                            ssh_tap_zeromq_bind = ssh_tap_zeromq_bind,
+                            parser_zeromq_bind = parser_zeromq_bind).strip())
+                if is_database_writer:
+                    command += " --no_writer"
+                elif is_partitioned:
+                    command += " --partitioned"
                 commands.append((command, host, parser_name, parser_zeromq_bind))
 
                 # Register the parser PUBLISH bindings with the service registry.
@@ -239,57 +259,110 @@ def main(verbose):
                 # ------------------------------------------------------------
 
                 # ------------------------------------------------------------
-                #   One reconcile_log instance to make sure the portions
-                #   of the log outputted during network outages are
-                #   in there too.
+                #   If enabled one reconcile_log instance to make sure the
+                #   portions of the log outputted during network outages
+                #   are in there too. Commands' output can't be fetched
+                #   again, so only log files.
                 # ------------------------------------------------------------
-                #reconcile_log_executable = python_executable + ' ' + reconcile_log_filepath
-                #masspinger_zeromq_bind = "tcp://127.0.0.1:%s" % (masspinger_port, )
-                #ssh_tap_zeromq_bind = "tcp://127.0.0.1:%s" % (ssh_tap_port + 1, )
-                #parser_zeromq_bind = "tcp://0.0.0.0:%s" % (parser_port + 1, )
-                #parser_name = parser_config.get_parser_name()
-                #host = box_config.get_dns_hostname()
-
-                #log_file_fullpath = log_file.get_full_path()
-                ##log_file_fullpath = log_file_fullpath.replace(r"/", r"\/")
-                ##command = """for file in \\\\\$( find %s\\* ); do nice -n 19 ionice -c3 cat \\\\\$file; done""" % (log_file_fullpath, )
-                #command = """find %s* | xargs | while read file; do sleep 5; nice -n 19 ionice -c3 cat \\\\\$file; done""" % (log_file_fullpath, )
-
-                #username = box_config.get_username()
-                #password = box_config.get_password()
-                #collection_name = "%s_%s" % (host, parser_name)
-                #command = reconcile_log_template.substitute( \
-                #        executable = reconcile_log_executable,
-                #        masspinger_zeromq_bind = masspinger_zeromq_bind,
-                #        ssh_tap_zeromq_bind = ssh_tap_zeromq_bind,
-                #        parser_zeromq_bind = parser_zeromq_bind,
-                #        parser_name = parser_name,
-                #        results_zeromq_bind = results_zeromq_bind,
-                #        host = host,
-                #        command = command,
-                #        username = username,
-                #        password = password,
-                #        collection_name = collection_name).strip()
-                #if global_config.get_reconcile_log_verbose():
-                #    command += " --verbose"
-
-                # !!AI reconcile_log leaks memory like nobody's business, so
-                # don't use for now.
-                #commands.append((command, host, parser_name, parser_zeromq_bind))
+                if is_reconcile_log and parser_config.get_parser_type() == "logfile":
+                    reconcile_log_executable = python_executable + ' ' + reconcile_log_filepath
+                    command = reconcile_log_template.substitute( \
+                            executable = reconcile_log_executable,
+                            masspinger_zeromq_bind = masspinger_zeromq_bind,
+                            ssh_tap_zeromq_bind = "tcp://127.0.0.1:%s" % (ssh_tap_port + RECONCILE_LOG_PORT_OFFSET, ),
+                            parser_zeromq_bind = "tcp://127.0.0.1:%s" % (parser_port + RECONCILE_LOG_PORT_OFFSET, ),
+                            parser_name = parser_name,
+                            host = host,
+                            log_file = task_config.get_full_path(),
+                            username = username,
+                            password = password,
+                            collection_name = "%s_%s" % (host, parser_name)).strip()
+                    if global_config.get_reconcile_log_verbose():
+                        command += " --verbose"
+                    if is_partitioned:
+                        command += " --partitioned"
+                    if is_catch_up_scheduler:
+                        command += " --scheduler \"tcp://127.0.0.1:%s\"" % (catch_up_scheduler_port, )
+                    reconcile_log_commands.append((command, host, parser_name))
                 # ------------------------------------------------------------
 
-                ssh_tap_port += 5
-                parser_port += 5
-                results_port += 5
+                # See constants for what each port in a block is for.
+                ssh_tap_port += PORTS_PER_STREAM
+                parser_port += PORTS_PER_STREAM
+                results_port += PORTS_PER_STREAM
         # --------------------------------------------------------------------
 
         logger.debug("robust_ssh_tap commands:\n%s" % (pprint.pformat([elem[0] for elem in commands]), ))
 
+        # --------------------------------------------------------------------
+        #   If enabled one parser_farm parses every stream whose parser it
+        #   can host, in place of the parsers robust_ssh_tap would launch.
+        # --------------------------------------------------------------------
+        if len(parser_farm_streams) > 0:
+            parser_farm_executable = python_executable + ' ' + parser_farm_filepath
+            parser_farm_cmd = parser_farm_template.substitute(executable = parser_farm_executable,
+                                                              streams = ' '.join(parser_farm_streams)).strip()
+            if global_config.get_robust_ssh_tap_verbose():
+                parser_farm_cmd += " --verbose"
+            logger.debug("parser_farm_cmd: %s" % (parser_farm_cmd, ))
+            proc = start_process(parser_farm_cmd, verbose)
+            parser_farm_process = Process(parser_farm_cmd, "parser_farm", proc)
+            all_processes.append(parser_farm_process)
+        # --------------------------------------------------------------------
+
+        # --------------------------------------------------------------------
+        #   If enabled one database_writer stores the logs of every parser
+        #   registered above, in place of the parser_tap_to_database
+        #   robust_ssh_tap would launch for each.
+        # --------------------------------------------------------------------
+        if is_database_writer:
+            database_writer_executable = python_executable + ' ' + database_writer_filepath
+            database_writer_metrics_port = global_config.get_database_writer_metrics_port()
+            database_writer_cmd = database_writer_template.substitute(executable = database_writer_executable,
+                                                                      service_registry_uri = "http://127.0.0.1:%s" % (service_registry_port, ),
+                                                                      metrics_zeromq_bind = "tcp://0.0.0.0:%s" % (database_writer_metrics_port, )).strip()
+            if global_config.get_robust_ssh_tap_verbose():
+                database_writer_cmd += " --verbose"
+            if is_partitioned:
+                database_writer_cmd += " --partitioned"
+            logger.debug("database_writer_cmd: %s" % (database_writer_cmd, ))
+            proc = start_process(database_writer_cmd, verbose)
+            database_writer_process = Process(database_writer_cmd, "database_writer", proc)
+            all_processes.append(database_writer_process)
+            add_service_to_service_registry(port = service_registry_port,
+                                            service_name = "database_writer_metrics",
+                                            service_value = "tcp://%s:%s" % (socket.getfqdn(), database_writer_metrics_port))
+        # --------------------------------------------------------------------
+
+        # --------------------------------------------------------------------
+        #   If enabled one catch_up_scheduler takes the reconcile_log
+        #   instances' passes in turn, rather than each one running its
+        #   own whenever it likes.
+        # --------------------------------------------------------------------
+        if is_catch_up_scheduler and len(reconcile_log_commands) > 0:
+            catch_up_scheduler_executable = python_executable + ' ' + catch_up_scheduler_filepath
+            catch_up_scheduler_cmd = catch_up_scheduler_template.substitute(executable = catch_up_scheduler_executable,
+                                                                            scheduler_zeromq_bind = "tcp://127.0.0.1:%s" % (catch_up_scheduler_port, ),
+                                                                            max_transfers = global_config.get_catch_up_max_transfers(),
+                                                                            max_transfers_per_box = global_config.get_catch_up_max_transfers_per_box(),
+                                                                            target_latency = global_config.get_catch_up_target_insert_latency()).strip()
+            if global_config.get_reconcile_log_verbose():
+                catch_up_scheduler_cmd += " --verbose"
+            logger.debug("catch_up_scheduler_cmd: %s" % (catch_up_scheduler_cmd, ))
+            proc = start_process(catch_up_scheduler_cmd, verbose)
+            catch_up_scheduler_process = Process(catch_up_scheduler_cmd, "catch_up_scheduler", proc)
+            all_processes.append(catch_up_scheduler_process)
+        # --------------------------------------------------------------------
+
         for (command, host, parser_name, results_zeromq_bind) in commands:
             #logger.debug("robust_ssh_tap command: %s" % (command, ))
             proc = start_process(command, verbose)
             process = Process(command, "robust_ssh_tap. {host=%s, parser_name=%s}" % (host, parser_name), proc)
             all_processes.append(process)
+        for (command, host, parser_name) in reconcile_log_commands:
+            proc = start_process(command, verbose)
+            process = Process(command, "reconcile_log. {host=%s, parser_name=%s}" % (host, parser_name), proc)
+            all_processes.append(process)
         for (command, host, parser_name, results_zeromq_bind) in commands:
             print '-' * 79
             logger.info("{Host=%s, parser_name=%s, results_zeromq_bind=%s}" % (host, parser_name, results_zeromq_bind))
@@ -345,7 +418,7 @@ class Process(object):
         return self.process_name
 
 def start_process(command_line, verbose=False):
-    logger = logging.getLogger("%s.start_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "start_process")
     logger.debug("Starting: %s. verbose: %s" % (command_line, verbose))
     null_fp = open(os.devnull, "w")
     if platform.system() == "Linux":
@@ -371,7 +444,7 @@ def start_process(command_line, verbose=False):
     return proc
 
 def terminate_process(process_object, process_name, kill=False):
-    logger = logging.getLogger("%s.terminate_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "terminate_process")
     logger.info("Terminating: %s" % (process_name, ))
     if not process_object:
         return True
@@ -389,7 +462,7 @@ def terminate_process(process_object, process_name, kill=False):
         return False
 
 def killtree(pid, including_parent=True):
-    logger = logging.getLogger("%s.killtree" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "killtree")
     logger.debug("entry. pid: %s, including_parent: %s" % (pid, including_parent))
     try:
         parent = psutil.Process(pid)
@@ -22,6 +22,7 @@ import pprint
 import zmq
 from zmq.eventloop.ioloop import IOLoop, PeriodicCallback
 from zmq.eventloop.zmqstream import ZMQStream
+import tracing
 
 # -----------------------------------------------------------------------------
 #   Logging.
@@ -71,8 +72,11 @@ def main(masspinger_zeromq_binding,
          username,
          password,
          timeout,
-         verbose):
-    logger = logging.getLogger("%s.main.%s.%s" % (APP_NAME, host, parser_name))
+         verbose,
+         no_parser=False,
+         no_writer=False,
+         partitioned=False):
+    logger = tracing.get_logger(APP_NAME, "main", host, parser_name)
     logger.debug("entry.")
     logger.debug("masspinger_zeromq_binding: %s" % (masspinger_zeromq_binding, ))
     logger.debug("ssh_tap_zeromq_binding: %s" % (ssh_tap_zeromq_binding, ))
@@ -84,6 +88,9 @@ def main(masspinger_zeromq_binding,
     logger.debug("username: %s" % (username, ))
     logger.debug("timeout: %s" % (timeout, ))
     logger.debug("verbose: %s" % (verbose, ))
+    logger.debug("no_parser: %s" % (no_parser, ))
+    logger.debug("no_writer: %s" % (no_writer, ))
+    logger.debug("partitioned: %s" % (partitioned, ))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -222,6 +229,8 @@ def main(masspinger_zeromq_binding,
                                                                                 collection = collection).strip()
     if verbose:
         parser_tap_to_database_command += " --verbose"
+    if partitioned:
+        parser_tap_to_database_command += " --partitioned"
     logger.debug("parser_tap_to_database command: %s" % (parser_tap_to_database_command, ))
     # ------------------------------------------------------------------------
 
@@ -239,10 +248,10 @@ def main(masspinger_zeromq_binding,
                 if is_tail_query_inode_required and tail_query_inode_process is None:
                     logger.debug("tail_query_inode_process not running, so restart it.")
                     tail_query_inode_process = start_process(tail_query_inode_command, verbose)
-                if parser_process is None:
+                if parser_process is None and not no_parser:
                     logger.debug("parser_process not running, so restart it.")
                     parser_process = start_process(parser_command, verbose)
-                if parser_tap_to_database_process is None:
+                if parser_tap_to_database_process is None and not no_writer:
                     logger.debug("parser_tap_to_database_process not running, so restart it.")
                     parser_tap_to_database_process = start_process(parser_tap_to_database_command, verbose)
             else:
@@ -310,7 +319,7 @@ def main(masspinger_zeromq_binding,
         logger.debug("finished.")
 
 def start_process(command_line, verbose = False):
-    logger = logging.getLogger("%s.start_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "start_process")
     logger.debug("Starting: command_line: %s, verbose: %s" % (command_line, verbose))
     null_fp = open(os.devnull, "w")
     if platform.system() == "Linux":
@@ -336,7 +345,7 @@ def start_process(command_line, verbose = False):
     return proc
 
 def terminate_process(process_object, process_name, kill=False):
-    logger = logging.getLogger("%s.terminate_process" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "terminate_process")
     logger.debug("Terminating: %s" % (process_name, ))
     if not process_object:
         return True
@@ -412,6 +421,21 @@ if __name__ == "__main__":
                         action='store_true',
                         default=False,
                         help="Enable verbose debug mode.")
+    parser.add_argument("--no_parser",
+                        dest="no_parser",
+                        action='store_true',
+                        default=False,
+                        help="Don't launch the parser, e.g. because a parser_farm is parsing this ssh_tap.")
+    parser.add_argument("--no_writer",
+                        dest="no_writer",
+                        action='store_true',
+                        default=False,
+                        help="Don't launch parser_tap_to_database, e.g. because a database_writer is storing this parser's logs.")
+    parser.add_argument("--partitioned",
+                        dest="partitioned",
+                        action='store_true',
+                        default=False,
+                        help="Have parser_tap_to_database store logs in a collection per day.")
     args = parser.parse_args()
     if args.verbose:
         logger.setLevel(logging.DEBUG)
@@ -428,7 +452,10 @@ if __name__ == "__main__":
          username = args.username,
          password = args.password,
          timeout = args.timeout,
-         verbose = args.verbose)
+         verbose = args.verbose,
+         no_parser = args.no_parser,
+         no_writer = args.no_writer,
+         partitioned = args.partitioned)
 
     logger.debug("finishing.")
 
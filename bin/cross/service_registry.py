@@ -3,6 +3,7 @@
 import argparse
 import bottle
 import json
+import tracing
 
 # -----------------------------------------------------------------------------
 #   Logging.
@@ -46,7 +47,7 @@ data = {}
 
 @bottle.route('/list_of_services')
 def list_of_services():
-    logger = logging.getLogger("%s.list_of_services" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "list_of_services")
     logger.debug("entry.")
     objs = [elem.get_dict_representation().items()[0] for elem in data.itervalues()]
     logger.debug("objs: %s" % (objs, ))
@@ -56,7 +57,7 @@ def list_of_services():
 
 @bottle.route('/add_service', method='POST')
 def add_service():
-    logger = logging.getLogger("%s.add_service" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "add_service")
     logger.debug("entry.")
 
     service_data  = str(bottle.request.forms.get("service_data"))
@@ -70,7 +71,7 @@ def add_service():
 
 @bottle.route('/delete_service', method='POST')
 def delete_service():
-    logger = logging.getLogger("%s.delete_service" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "delete_service")
     logger.debug("entry.")
 
     service_name = str(bottle.request.forms.get("service_name"))
@@ -82,7 +83,7 @@ def delete_service():
 
 @bottle.route('/get_service')
 def get_service():
-    logger = logging.getLogger("%s.get_service" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "get_service")
     logger.debug("entry.")
 
     service_name = str(bottle.request.query.get("service_name"))
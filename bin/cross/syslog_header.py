@@ -0,0 +1,111 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Fast path for the "Mon dd hh:mm:ss host rest" syslog prefix that the
+#   NGMG messages parsers look for.
+#
+#   The parsers' RE_LINE patterns glue the fields together with ".*?"
+#   fillers and are run with search(), so on a long line that doesn't match
+#   they try every filler length at every starting position. Almost every
+#   real line starts with a plain syslog header though, so:
+#
+#   -   Match the month, day and time with a pattern anchored at the start
+#       of the line, then the first host after them with the same
+#       sub-pattern RE_LINE uses, all in one match().
+#   -   If the header doesn't match (e.g. "June", "Sept", no seconds, am/pm,
+#       or leading junk) fall back to RE_LINE's own fields, with its fillers
+#       bounded: at most FALLBACK_MAX_PREFIX characters of junk before the
+#       month and at most FALLBACK_MAX_FILLER between the fields. Lines
+#       whose month, day and time are further apart than that aren't
+#       syslog headers.
+#
+#   If the anchored header matches RE_LINE would have matched at the start
+#   of the line too, with the same groups, so we take the fast path's word
+#   for it; if no host follows RE_LINE can't find one anywhere we didn't
+#   look, bar hosts starting in the middle of a word.
+#
+#   Both patterns are anchored, so a line that doesn't match costs at most
+#   a few passes over it. RE_LINE searched with unbounded fillers, a cubic
+#   number of steps or worse on a long line with times in it that doesn't
+#   match, e.g. "x" + "Jan 1 12:00 " * 200. That's only true if the host
+#   pattern can only start somewhere a host could, e.g. not after a letter,
+#   and can't split a run of characters into its parts more than one way;
+#   otherwise looking for it after the time is quadratic.
+#
+#   match_single_lines() does the same for a whole batch of lines at once.
+#   It runs one pattern with findall() over the lines joined together, so
+#   when every line matches the batch costs a few C calls rather than a
+#   Python call, a splitlines() and a match() per line. The pattern is the
+#   anchored header with "\s" narrowed to "[ \t]", then the first host
+#   after it, as match() finds it either way. It's only used once
+#   splitlines() of the joined lines gives back the lines, i.e. no line has
+#   a line break in it. So it only matches where match() would have matched
+#   the same way. If any line doesn't match they all go through match(),
+#   since working out which ones didn't costs more than it saves.
+# ----------------------------------------------------------------------------
+
+import re
+
+RE_MONTH = "(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)"
+RE_TIME = "((?:(?:[0-1][0-9])|(?:[2][0-3])|(?:[0-9])):(?:[0-5][0-9]):(?:[0-5][0-9]))(?!\\s?(?:am|pm))"
+
+# How far the fallback looks for the month, and between the fields.
+FALLBACK_MAX_PREFIX = 32
+FALLBACK_MAX_FILLER = 8
+
+class SyslogHeaderParser(object):
+    """ Split a syslog line into (month, day, time, host, contents), i.e.
+    the five groups of the parser's RE_LINE, or return None if it doesn't
+    start with a syslog header. See the top of this module for where that
+    differs from searching with RE_LINE.
+
+    -   month_pattern, day_pattern, time_pattern: RE_LINE's month, day
+        and time groups.
+    -   host_pattern: RE_LINE's host group, and anything between it and the
+        contents (e.g. a space). Contents is whatever follows it.
+    """
+
+    def __init__(self, month_pattern, day_pattern, time_pattern, host_pattern):
+        header_pattern = "^" + RE_MONTH + "\\s+" + day_pattern + "\\s+" + RE_TIME
+        self.re_line = re.compile(header_pattern + ".*?" + host_pattern + "(.*)", re.IGNORECASE | re.DOTALL)
+
+        prefix = ".{0,%s}?" % (FALLBACK_MAX_PREFIX, )
+        filler = ".{0,%s}?" % (FALLBACK_MAX_FILLER, )
+        self.re_fallback = re.compile("^" + prefix + month_pattern + filler + day_pattern + filler + time_pattern + \
+                                      filler + host_pattern + "(.*)", re.IGNORECASE | re.DOTALL)
+
+        batch_header_pattern = "^" + RE_MONTH + "[ \\t]+" + day_pattern + "[ \\t]+" + RE_TIME
+        self.re_batch_line = re.compile(batch_header_pattern + ".*?" + host_pattern + "(.*)$", re.IGNORECASE | re.MULTILINE)
+
+    def match(self, line):
+        m = self.re_line.match(line)
+        if m:
+            return m.groups()
+        m = self.re_fallback.match(line)
+        if not m:
+            return None
+        return m.groups()
+
+    def match_single_line(self, line):
+        """ match(), but None if the line isn't exactly one line, i.e. if
+        line.splitlines() doesn't have exactly one element."""
+        if len(line.splitlines()) != 1:
+            return None
+        return self.match(line)
+
+    def match_single_lines(self, lines):
+        """ Return a list with match_single_line() of each line."""
+        text = "\n".join(lines)
+        if text.splitlines() == list(lines):
+            return_value = self.re_batch_line.findall(text)
+            if len(return_value) == len(lines):
+                return return_value
+        # A line has a line break in it, so we can't tell the lines apart in
+        # text, or not every line matched.
+        return [self.match_single_line(line) for line in lines]
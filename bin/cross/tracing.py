@@ -0,0 +1,160 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Debug tracing that costs next to nothing while it's off, for hot paths
+#   like handling every ssh_tap message or every web request.
+#
+#   trace = tracing.get_tracer(APP_NAME)
+#   ...
+#   trace("publishing:\n%r", log_record)
+#   trace("streams:\n%s", tracing.Lazy(pprint.pformat, streams))
+#
+#   While a tracer is off a call is one attribute check; nothing is
+#   formatted. On the hottest paths check trace.enabled first to save the
+#   call too. Trace messages go to the component's logger at INFO, so
+#   they get through the handlers every service sets up.
+#
+#   Components are logger names. Turning one on turns on those below it,
+#   e.g. "parser_farm" turns on "parser_farm.jabbah". Turn them on:
+#
+#   -   at startup, with a comma-separated list in $RILL_TRACE.
+#   -   at runtime, by writing one per line to TRACE_FILEPATH and sending
+#       SIGUSR1 to a process that's called install_signal_handler(). An
+#       empty or missing file turns them all off. "*" is every component.
+#   -   in code, with enable() and disable(), e.g. for --verbose.
+#
+#   get_logger() caches loggers for functions that log, instead of calling
+#   logging.getLogger() on every call.
+# ----------------------------------------------------------------------------
+
+import os
+import errno
+import signal
+import tempfile
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+APP_NAME = "tracing"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+ALL_COMPONENTS = "*"
+TRACE_FILEPATH = os.environ.get("RILL_TRACE_FILE", os.path.join(tempfile.gettempdir(), "rill_trace"))
+
+_loggers = {}
+_tracers = {}
+_enabled_components = set(component.strip() for component in os.environ.get("RILL_TRACE", "").split(",")
+                          if len(component.strip()) > 0)
+
+def get_logger(*names):
+    """ Given the parts of a logger name, e.g. (APP_NAME, "main"), return
+    the logger "APP_NAME.main"."""
+    try:
+        return _loggers[names]
+    except KeyError:
+        logger = _loggers[names] = logging.getLogger(".".join(names))
+        return logger
+
+def is_component_enabled(component):
+    if ALL_COMPONENTS in _enabled_components:
+        return True
+    parts = component.split(".")
+    return any(".".join(parts[:i]) in _enabled_components for i in xrange(1, len(parts) + 1))
+
+class Lazy(object):
+    """ Calls function(*args) only when formatted, e.g.
+    Lazy(pprint.pformat, obj)."""
+
+    __slots__ = ["function", "args"]
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return "%s" % (self.function(*self.args), )
+
+    def __repr__(self):
+        return str(self)
+
+class Tracer(object):
+    """ Callable that logs a message, formatted with the arguments, only
+    while its component is enabled."""
+
+    def __init__(self, component):
+        self.component = component
+        self.logger = logging.getLogger(component)
+        self.enabled = is_component_enabled(component)
+
+    def __call__(self, message, *args):
+        if not self.enabled:
+            return
+        self.logger.info(message, *args)
+
+def get_tracer(component):
+    try:
+        return _tracers[component]
+    except KeyError:
+        tracer = _tracers[component] = Tracer(component)
+        return tracer
+
+def set_enabled_components(components):
+    global _enabled_components
+    _enabled_components = set(components)
+    for tracer in _tracers.itervalues():
+        tracer.enabled = is_component_enabled(tracer.component)
+
+def enable(component):
+    set_enabled_components(_enabled_components | set([component]))
+
+def disable(component):
+    set_enabled_components(_enabled_components - set([component]))
+
+def read_trace_file(filepath=TRACE_FILEPATH):
+    """ Enable exactly the components listed in filepath, one per line."""
+    logger = get_logger(APP_NAME, "read_trace_file")
+    components = []
+    if os.path.isfile(filepath):
+        try:
+            with open(filepath) as f:
+                components = [line.strip() for line in f if len(line.strip()) > 0]
+        except IOError:
+            logger.exception("failed to read trace file %s" % (filepath, ))
+            return
+    set_enabled_components(components)
+    logger.info("pid %s tracing components: %s" % (os.getpid(), sorted(components)))
+
+def sigusr1_handler(signum, frame):
+    read_trace_file()
+
+def install_signal_handler():
+    """ Re-read TRACE_FILEPATH on SIGUSR1. Call from the main thread of a
+    service; its blocking calls, e.g. zmq polls, must cope with being
+    interrupted. SIGUSR1 doesn't exist on Windows."""
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, sigusr1_handler)
+
+def poll(poller, timeout=None):
+    """ poller.poll(timeout) as a dict of socket to events, or {} if it was
+    interrupted by a signal, e.g. SIGUSR1."""
+    try:
+        return dict(poller.poll(timeout))
+    except zmq.ZMQError, e:
+        if e.errno != errno.EINTR:
+            raise
+        return {}
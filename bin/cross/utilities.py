@@ -12,6 +12,7 @@ import yaml
 import operator
 
 from constants import *
+import tracing
 
 APP_NAME = "utilities"
 logger = logging.getLogger()
@@ -69,7 +70,7 @@ class GlobalConfig(object):
         self.parse(global_config_tree)
 
     def validate_tree(self, global_config_tree):
-        logger = logging.getLogger("%s.GlobalConfig.validate_tree" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "GlobalConfig", "validate_tree")
         logger.debug("entry.")
 
         for root_key in ["port_ranges",
@@ -100,12 +101,22 @@ class GlobalConfig(object):
         self.robust_ssh_tap_verbose = global_config_tree["robust_ssh_tap_verbose"]
         self.reconcile_log_verbose = global_config_tree["reconcile_log_verbose"]
         self.production = global_config_tree["production"]
+        self.parser_farm = global_config_tree.get("parser_farm", False)
+        self.database_writer = global_config_tree.get("database_writer", False)
+        self.partitioned_collections = global_config_tree.get("partitioned_collections", False)
+        self.reconcile_log = global_config_tree.get("reconcile_log", False)
+        self.catch_up_scheduler = global_config_tree.get("catch_up_scheduler", False)
+        self.catch_up_max_transfers = global_config_tree.get("catch_up_max_transfers", 8)
+        self.catch_up_max_transfers_per_box = global_config_tree.get("catch_up_max_transfers_per_box", 1)
+        self.catch_up_target_insert_latency = global_config_tree.get("catch_up_target_insert_latency", 2)
         port_ranges = global_config_tree["port_ranges"]
         self.service_registry_port = port_ranges["service_registry_port"]
         self.masspinger_port = port_ranges["masspinger_port"]
         self.ssh_tap_port_start = port_ranges["ssh_tap_port_start"]
         self.parser_port_start = port_ranges["parser_port_start"]
         self.results_port_start = port_ranges["results_port_start"]
+        self.database_writer_metrics_port = port_ranges.get("database_writer_metrics_port", 10002)
+        self.catch_up_scheduler_port = port_ranges.get("catch_up_scheduler_port", 10003)
         self.valid = True
 
     def get_service_registry_port(self):
@@ -138,13 +149,43 @@ class GlobalConfig(object):
     def get_production(self):
         return self.production
 
+    def get_parser_farm(self):
+        return self.parser_farm
+
+    def get_database_writer(self):
+        return self.database_writer
+
+    def get_database_writer_metrics_port(self):
+        return self.database_writer_metrics_port
+
+    def get_partitioned_collections(self):
+        return self.partitioned_collections
+
+    def get_reconcile_log(self):
+        return self.reconcile_log
+
+    def get_catch_up_scheduler(self):
+        return self.catch_up_scheduler
+
+    def get_catch_up_scheduler_port(self):
+        return self.catch_up_scheduler_port
+
+    def get_catch_up_max_transfers(self):
+        return self.catch_up_max_transfers
+
+    def get_catch_up_max_transfers_per_box(self):
+        return self.catch_up_max_transfers_per_box
+
+    def get_catch_up_target_insert_latency(self):
+        return self.catch_up_target_insert_latency
+
 class BoxConfig(object):
     def __init__(self, box_config_tree):
         self.valid = False
         self.parse(box_config_tree)
 
     def validate_tree(self, box_config_tree):
-        logger = logging.getLogger("%s.BoxConfig.validate_tree" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "BoxConfig", "validate_tree")
         logger.debug("entry.")
 
         for root_key in ["friendly name",
@@ -277,7 +318,7 @@ class ParserConfig(object):
         self.parse(parser_config_tree)
 
     def validate_tree(self, parser_config_tree):
-        logger = logging.getLogger("%s.ParserConfig.validate_tree" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "ParserConfig", "validate_tree")
         logger.debug("entry. parser_config_tree: %s" % parser_config_tree)
 
         for root_key in ["box type",
@@ -330,7 +371,7 @@ class StoreConfig(object):
         self.parse(store_config_tree)
 
     def validate_tree(self, store_config_tree):
-        logger = logging.getLogger("%s.StoreConfig.validate_tree" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "StoreConfig", "validate_tree")
         logger.debug("entry.")
 
         for root_key in ["name",
@@ -10,13 +10,10 @@ import os
 import sys
 import zmq
 import pprint
-import datetime
 import re
 import json
 import platform
 import argparse
-import hashlib
-import base64
 
 from whoosh.analysis import FancyAnalyzer
 from whoosh.analysis import StemmingAnalyzer
@@ -35,6 +32,14 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
+from ngmg_base_log_datum import TimestampCache
+from keyword_tokenizer import KeywordTokenizer
+from contents_hash import ContentsHasher
+from log_record import LogRecord
+import wire_format
+import tracing
+trace = tracing.get_tracer(APP_NAME)
+
 # ----------------------------------------------------------------------------
 #   Signal handling
 # ----------------------------------------------------------------------------
@@ -57,6 +62,8 @@ class LogDatum(object):
     #   Format of the datetime at the start of the line.
     # ------------------------------------------------------------------------
     DATETIME_FORMAT = "%Y-%b-%d %H:%M:%S"
+    TIMESTAMP_CACHE = TimestampCache(DATETIME_FORMAT)
+    CONTENTS_HASHER = ContentsHasher()
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
@@ -72,24 +79,17 @@ class LogDatum(object):
     RE_LINE = re.compile(re1+re2+re3+re4+re5+re6+re7, re.IGNORECASE | re.DOTALL)
     # ------------------------------------------------------------------------
 
-    def get_dict_representation(self):
-        """ Given a block of a full log event return a dict with the following
-        required keys:
-        -   year: integer
-        -   month: integer
-        -   day: integer
-        -   hour: integer
-        -   minute: integer
-        -   second: integer
+    def get_log_record(self):
+        """ Given a block of a full log event return a LogRecord with:
+        -   the datetime of the event.
         -   contents: full block from the log.
+        -   contents_hash: unique identifier of the contents.
+        -   keywords: which we prepare for MongoDB consumers so that we get
+            to decide how they tokenize the string in preparation for
+            full-text searching.
 
-        and the following optional keys:
-        -   microsecond: integer
-
-        Add whatever other keys you like for subscribers to this parser. The
-        most relevent is "_keywords", which we prepare for MongoDB consumers
-        so that we get to decide how they tokenize the string in preparation
-        for full-text searching.
+        Add whatever other fields you like for subscribers to this parser to
+        the record's extras.
 
         Example lines:
 
@@ -115,22 +115,16 @@ class LogDatum(object):
 
         full_datetime = " ".join([yyyymmmdd1, time1])
         try:
-            datetime_obj = datetime.datetime.strptime(full_datetime, self.DATETIME_FORMAT)
+            datetime_obj = self.TIMESTAMP_CACHE.strptime(full_datetime)
         except ValueError:
             return None
-        return_value = {}
-        return_value["year"] = str(datetime_obj.year)
-        return_value["month"] = str(datetime_obj.month)
-        return_value["day"] = str(datetime_obj.day)
-        return_value["hour"] = str(datetime_obj.hour)
-        return_value["minute"] = str(datetime_obj.minute)
-        return_value["second"] = str(datetime_obj.second)
-        return_value["contents"] = self.string_input
-        return_value["contents_hash"] = base64.b64encode(hashlib.md5(return_value["contents"]).digest())
-        return_value["_keywords"] = self.tokenize(return_value["contents"])
-        return return_value
+        return LogRecord.from_datetime(datetime_obj,
+                                       self.string_input,
+                                       self.CONTENTS_HASHER(self.string_input, datetime_obj),
+                                       self.KEYWORD_TOKENIZER.tokenize(contents))
 
     analyzer = StandardAnalyzer()
+    KEYWORD_TOKENIZER = KeywordTokenizer(analyzer, logger=logger)
     def tokenize(self, input):
         """Given a blob of input prepare a list of strings that is suitable
         for full-text indexing by MongoDB.
@@ -141,20 +135,13 @@ class LogDatum(object):
         if not m:
             return []
         contents = m.group(4)
-        tokens = []
-        for elem in self.analyzer(contents):
-            if hasattr(elem, "pos"):
-                tokens.append((elem.text, elem.pos))
-            else:
-                tokens.append((elem.text, None))
-        unique_tokens = list(set([text for (text, pos) in tokens]))
-        return sorted(unique_tokens)
+        return self.KEYWORD_TOKENIZER.tokenize(contents)
 
     def __repr__(self):
-        return "LogDatum: %s" % (self.get_dict_representation(), )
+        return "LogDatum: %s" % (self.get_log_record(), )
 
     def __str__(self):
-        return "%s" % (self.get_dict_representation(), )
+        return "%s" % (self.get_log_record(), )
 
 def validate_command(command):
     if "contents" not in command:
@@ -197,7 +184,6 @@ def split_contents_and_return_excess(contents):
 
     """
 
-    logger = logging.getLogger("%s.split_contents_and_return_excess" % (APP_NAME, ))
     elems = re_line_breaks.split(contents)
     last_index = len(elems) - 1
     non_line_break_elems = [(i, elem) for (i, elem) in enumerate(elems)
@@ -207,7 +193,8 @@ def split_contents_and_return_excess(contents):
     trailing_excess = elems[-1]
 
     return_value = (full_lines, trailing_excess)
-    logger.debug("returning : %s" % (return_value, ))
+    if trace.enabled:
+        trace("returning : %s", return_value)
     return return_value
 
 def get_log_data_and_excess_lines(full_lines):
@@ -219,7 +206,6 @@ def get_log_data_and_excess_lines(full_lines):
 
     We will silently drop input that doesn't meet the spec of a log block."""
 
-    logger = logging.getLogger("%s.get_log_data_and_excess_lines" % (APP_NAME, ))
     return_value = []
     for line in full_lines:
         log_datum = LogDatum(line)
@@ -246,9 +232,11 @@ if __name__ == "__main__":
                         default=False,
                         help="Enable verbose debug mode.")
     args = parser.parse_args()
+    tracing.install_signal_handler()
     if args.verbose:
         logger.setLevel(logging.DEBUG)
         ch.setLevel(logging.DEBUG)
+        tracing.enable(APP_NAME)
         logger.debug("Verbose logging enabled.")
     context = zmq.Context(1)
 
@@ -262,7 +250,7 @@ if __name__ == "__main__":
     # ------------------------------------------------------------------------
 
     # ------------------------------------------------------------------------
-    #   Publishing JSON for parsed log data.
+    #   Publishing parsed log data.
     # ------------------------------------------------------------------------
     logger.debug("Publishing parsed results at: %s" % (args.results_zeromq_binding, ))
     publish_socket = context.socket(zmq.PUB)
@@ -277,11 +265,12 @@ if __name__ == "__main__":
     full_lines = []
     try:
         while 1:
-            socks = dict(poller.poll(poll_interval))
+            socks = tracing.poll(poller, poll_interval)
             if socks.get(subscription_socket, None) != zmq.POLLIN:
                 continue
             incoming_string = subscription_socket.recv()
-            logger.debug("Update: '%s'" % (incoming_string, ))
+            if trace.enabled:
+                trace("Update: '%s'", incoming_string)
             try:
                 incoming_object = json.loads(incoming_string)
             except:
@@ -293,8 +282,9 @@ if __name__ == "__main__":
             trailing_excess = ''.join([trailing_excess, incoming_object["contents"]])
             (new_full_lines, trailing_excess) = split_contents_and_return_excess(trailing_excess)
             full_lines.extend(new_full_lines)
-            logger.debug("full_lines:\n%s" % (pprint.pformat(full_lines), ))
-            logger.debug("trailing_excess:\n%s" % (trailing_excess, ))
+            if trace.enabled:
+                trace("full_lines:\n%s", tracing.Lazy(pprint.pformat, full_lines))
+                trace("trailing_excess:\n%s", trailing_excess)
 
             # ----------------------------------------------------------------
             # We now have lots of full lines and some trailing excess. Since a
@@ -305,11 +295,14 @@ if __name__ == "__main__":
             # ----------------------------------------------------------------
             (log_data, full_lines) = get_log_data_and_excess_lines(full_lines)
             for log_datum in log_data:
-                logger.debug("publishing:\n%r" % (log_datum, ))
-                if log_datum.get_dict_representation() is None:
+                if trace.enabled:
+                    trace("publishing:\n%r", log_datum)
+                log_record = log_datum.get_log_record()
+                if log_record is None:
                     logger.warning("log datum is none, skip it.")
                     continue
-                publish_socket.send(str(log_datum))
+                log_record.log_type = APP_NAME
+                publish_socket.send(wire_format.encode(log_record))
             # ----------------------------------------------------------------
     except KeyboardInterrupt:
         logger.debug("CTRL-C")
@@ -3,6 +3,7 @@ import sys
 cross_root = os.path.abspath(os.path.join(__file__, os.pardir))
 sys.path.append(cross_root)
 from utilities import retry
+import partitions
 
 import datetime
 import pymongo
@@ -45,15 +46,34 @@ class Database(object):
         self.connection = pymongo.ReplicaSetConnection(",".join(servers), replicaSet='rill')
         self.connection.read_preference = pymongo.ReadPreference.SECONDARY
         self.database = self.connection[database_name]
+        self.all_collection_names = []
+        self.last_collection_names_time = None
+
+    def get_all_collection_names(self):
+        """ Every collection in the database, as of at most
+        partitions.COLLECTION_NAMES_REFRESH_SECONDS ago."""
+        time_now = time.time()
+        if self.last_collection_names_time is None or \
+           (time_now - self.last_collection_names_time) >= partitions.COLLECTION_NAMES_REFRESH_SECONDS:
+            self.all_collection_names = self.database.collection_names()
+            self.last_collection_names_time = time_now
+        return self.all_collection_names
 
     @retry()
     def get_collection(self, collection_name):
+        """ A stream's collection. If it's day-partitioned a
+        partitions.PartitionedCollection, which queries only the partitions
+        in a query's datetime range."""
+        if partitions.is_partitioned(self.get_all_collection_names(), collection_name):
+            return partitions.PartitionedCollection(self.database, collection_name)
         rv = self.database[collection_name]
         return rv
 
     @retry()
     def get_collection_names(self, name_filter=None):
-        all_collection_names = self.database.collection_names()
+        """ Names of the streams, with a day-partitioned stream's partitions
+        as its one name."""
+        all_collection_names = partitions.get_stream_names(self.get_all_collection_names())
         if name_filter:
             collection_names = [elem for elem in all_collection_names if re.search(name_filter, elem)]
         else:
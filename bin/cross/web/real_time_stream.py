@@ -12,6 +12,8 @@ import bottle
 import jinja2
 import pymongo
 import database
+import wire_format
+import tracing
 import pprint
 
 from whoosh.analysis import StandardAnalyzer
@@ -79,7 +81,7 @@ def get_list_of_services():
 
 class Application(object):
     def __init__(self):
-        logger = logging.getLogger("%s.Application.__init__" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "Application", "__init__")
         logger.debug("entry.")
 
     def setup_zeromq_bindings(self):
@@ -98,7 +100,8 @@ class Application(object):
         return (names, bindings, sockets)
 
     def __call__(self, environ, start_response):
-        logger = logging.getLogger("%s.Application" % (APP_NAME, ))
+        logger = tracing.get_logger(APP_NAME, "Application")
+        trace = tracing.get_tracer(logger.name)
         logger.debug("environ: %s, start_response: %s" % (environ, start_response))
 
         path = environ['PATH_INFO'].strip('/')
@@ -124,21 +127,21 @@ class Application(object):
         while True:
             if conn.session.connected == False:
                 break
-            logger.debug("session: %s" % (conn.session, ))
+            trace("session: %s", conn.session)
             poll_sockets = dict(poller.poll(timeout=1000))
             if len(poll_sockets) == 0:
                 continue
             gevent.sleep(0.01)  # !!AI haha, why do I need this?
             for (name, binding, socket) in names_bindings_sockets:
                 if socket in poll_sockets and poll_sockets[socket] == zmq.POLLIN:
-                    msg = socket.recv()
-                    msg_obj = json.loads(msg)
-                    #logger.debug("name: %s, contents: %s" % (name, msg_obj["contents"]))
-                    conn.send(msg_obj["contents"])
-            logger.debug("receiving msg...")
+                    for msg in socket.recv_multipart():
+                        msg_obj = wire_format.decode(msg)
+                        #logger.debug("name: %s, contents: %s" % (name, msg_obj["contents"]))
+                        conn.send(msg_obj["contents"])
+            trace("receiving msg...")
             msg = conn.receive()
             if msg:
-                logger.debug("got a message: %s" % (msg, ))
+                trace("got a message: %s", msg)
         logger.debug("connection lost.")
         for socket in sockets:
             socket.setsockopt(zmq.LINGER, 0)
@@ -146,7 +149,7 @@ class Application(object):
 
 @bottle.route("/real_time_stream")
 def real_time_stream():
-    logger = logging.getLogger("%s.real_time_stream" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "real_time_stream")
     logger.debug("entry.")
     global socket_io_server
     if not socket_io_server:
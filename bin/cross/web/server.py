@@ -8,6 +8,7 @@ import sys
 cross_path = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
 sys.path.append(cross_path)
 from utilities import retry
+import tracing
 
 import time
 import os
@@ -63,6 +64,12 @@ ch3 = logging.handlers.RotatingFileHandler(ACCESS_LOG_FILENAME, maxBytes=10*1024
 ch3.setFormatter(formatter)
 ch3.setLevel(logging.DEBUG)
 access_logger.addHandler(ch3)
+
+# Every request's items, pretty printed, go to the access log only while the
+# access component is traced, e.g. RILL_TRACE=rill_web_server_access.
+access_trace = tracing.get_tracer(access_logger.name)
+def get_request_items():
+    return pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0)))
 # ----------------------------------------------------------------------------
 
 # ----------------------------------------------------------------------------
@@ -89,9 +96,9 @@ db = database.Database()
 
 @bottle.route('/')
 def index():
-    logger = logging.getLogger("%s.index" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "index")
     logger.debug("entry.")
-    access_logger.debug("index:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("index:\n%s", tracing.Lazy(get_request_items))
     data = {}
     template = jinja2_env.get_template('index.html')
     stream = template.stream()
@@ -100,9 +107,9 @@ def index():
 
 @bottle.route('/shm_split_brain')
 def shm_split_brain():
-    logger = logging.getLogger("%s.shm_split_brain" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "shm_split_brain")
     logger.debug("entry.")
-    access_logger.debug("shm_split_brain:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("shm_split_brain:\n%s", tracing.Lazy(get_request_items))
 
     collections = sorted(db.get_ngmg_shm_messages_collections())
     collection_objects = [db.get_collection(collection) for collection in collections]
@@ -116,9 +123,9 @@ def shm_split_brain():
 
 @bottle.route('/shm_memory_charts')
 def shm_memory_charts():
-    logger = logging.getLogger("%s.shm_memory_charts" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "shm_memory_charts")
     logger.debug("entry.")
-    access_logger.debug("shm_memory_charts:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("shm_memory_charts:\n%s", tracing.Lazy(get_request_items))
 
     collections = sorted(db.get_ngmg_shm_messages_collections())
     friendly_collection_names = [elem.partition(db.ngmg_shm_messages_collection_filter)[0].strip("_").replace(".", "_")
@@ -146,9 +153,9 @@ def shm_memory_charts():
 
 @bottle.route('/shm_error_count')
 def shm_error_count():
-    logger = logging.getLogger("%s.shm_error_count" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "shm_error_count")
     logger.debug("entry.")
-    access_logger.debug("shm_error_count:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("shm_error_count:\n%s", tracing.Lazy(get_request_items))
 
     template = jinja2_env.get_template('shm_error_count.html')
     stream = template.stream()
@@ -157,9 +164,9 @@ def shm_error_count():
 
 @bottle.route('/shm_error_count', method='POST')
 def shm_error_count():
-    logger = logging.getLogger("%s.shm_error_count_post" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "shm_error_count_post")
     logger.debug("entry.")
-    access_logger.debug("shm_error_count_post:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("shm_error_count_post:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -233,9 +240,9 @@ def shm_error_count():
 
 @bottle.route('/intel_error_count')
 def intel_error_count():
-    logger = logging.getLogger("%s.intel_error_count" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "intel_error_count")
     logger.debug("entry.")
-    access_logger.debug("intel_error_count:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("intel_error_count:\n%s", tracing.Lazy(get_request_items))
 
     template = jinja2_env.get_template('intel_error_count.html')
     stream = template.stream()
@@ -244,9 +251,9 @@ def intel_error_count():
 
 @bottle.route('/intel_error_count', method='POST')
 def intel_error_count():
-    logger = logging.getLogger("%s.intel_error_count_post" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "intel_error_count_post")
     logger.debug("entry.")
-    access_logger.debug("intel_error_count_post:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("intel_error_count_post:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -388,9 +395,9 @@ def intel_error_count():
 
 @bottle.route('/ep_error_instances')
 def ep_error_instances():
-    logger = logging.getLogger("%s.ep_error_instances" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "ep_error_instances")
     logger.debug("entry.")
-    access_logger.debug("ep_error_instances:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("ep_error_instances:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -413,9 +420,9 @@ def ep_error_instances():
 
 @bottle.route('/ep_error_count')
 def ep_error_count():
-    logger = logging.getLogger("%s.ep_error_count" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "ep_error_count")
     logger.debug("entry.")
-    access_logger.debug("ep_error_count:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("ep_error_count:\n%s", tracing.Lazy(get_request_items))
 
     template = jinja2_env.get_template('ep_error_count.html')
     stream = template.stream()
@@ -424,9 +431,9 @@ def ep_error_count():
 
 @bottle.route('/ep_error_count', method='POST')
 def ep_error_count():
-    logger = logging.getLogger("%s.ep_error_count_post" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "ep_error_count_post")
     logger.debug("entry.")
-    access_logger.debug("ep_error_count_post:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("ep_error_count_post:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -532,9 +539,9 @@ def ep_error_count():
 
 @bottle.route('/full_text_search')
 def full_text_search():
-    logger = logging.getLogger("%s.full_text_search" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "full_text_search")
     logger.debug("entry.")
-    access_logger.debug("full_text_search:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("full_text_search:\n%s", tracing.Lazy(get_request_items))
     template = jinja2_env.get_template('full_text_search.html')
     stream = template.stream()
     for chunk in stream:
@@ -542,9 +549,9 @@ def full_text_search():
 
 @bottle.route('/full_text_search_results')
 def full_text_search_results():
-    logger = logging.getLogger("%s.full_text_search_results_get" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "full_text_search_results_get")
     logger.debug("entry.")
-    access_logger.debug("full_text_search_results:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("full_text_search_results:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
@@ -649,9 +656,9 @@ def full_text_search_results():
 
 @bottle.route('/full_text_search_results', method='POST')
 def full_text_search_results():
-    logger = logging.getLogger("%s.full_text_search_results_post" % (APP_NAME, ))
+    logger = tracing.get_logger(APP_NAME, "full_text_search_results_post")
     logger.debug("entry.")
-    access_logger.debug("full_text_search_results:\n%s" % (pprint.pformat(sorted(bottle.request.items(), key=operator.itemgetter(0))), ))
+    access_trace("full_text_search_results:\n%s", tracing.Lazy(get_request_items))
 
     # ------------------------------------------------------------------------
     #   Validate inputs.
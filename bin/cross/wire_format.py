@@ -0,0 +1,142 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Encoding of the log data parsers publish.
+#
+#   There are two formats, and every frame says which one it is in, so
+#   subscribers don't need to be told what a parser is publishing and old
+#   JSON parsers and new binary parsers can be mixed freely.
+#
+#   -   "json": a JSON object, as parsers have always published, with the
+#       year, month, day, hour, minute, second and optional millisecond as
+#       strings. Starts with "{".
+#   -   "msgpack": a header of MAGIC, a version byte and a schema tag byte,
+#       followed by a msgpack array. For SCHEMA_LOG_RECORD version 1 this is:
+#
+#           [epoch_ms, has_millisecond, box_name, log_type,
+#            contents, contents_hash, keywords, extras]
+#
+#       i.e. LogRecord.to_wire(), where epoch_ms is the timestamp in
+#       milliseconds since the epoch, treating the parser's naive datetime
+#       as UTC, and extras is nil or a map of any other fields (log_id,
+#       error_level, failure_id, ...).
+#
+#   msgpack is optional. Without it parsers publish JSON, and subscribers
+#   can't decode binary frames.
+#
+#   decode() turns either into the document we store in MongoDB, i.e. with
+#   a "datetime" in place of the stringified fields.
+# ----------------------------------------------------------------------------
+
+import json
+
+APP_NAME = "wire_format"
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from ngmg_base_log_datum import TimestampCache
+from log_record import LogRecord
+import tracing
+
+JSON = "json"
+MSGPACK = "msgpack"
+WIRE_FORMATS = [JSON, MSGPACK]
+
+MAGIC = "\x00RL"
+VERSION = 1
+SCHEMA_LOG_RECORD = 1
+LOG_RECORD_HEADER = MAGIC + chr(VERSION) + chr(SCHEMA_LOG_RECORD)
+HEADER_LENGTH = len(LOG_RECORD_HEADER)
+
+DATETIME_FIELDS = ["year", "month", "day", "hour", "minute", "second", "millisecond"]
+
+timestamp_cache = TimestampCache()
+
+# ----------------------------------------------------------------------------
+#   msgpack's API for telling strings from bytes has changed over time.
+# ----------------------------------------------------------------------------
+def _packb(obj):
+    try:
+        return msgpack.packb(obj, use_bin_type=True)
+    except TypeError:
+        return msgpack.packb(obj, encoding="utf-8")
+
+def _unpackb(data):
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except TypeError:
+        return msgpack.unpackb(data, encoding="utf-8")
+# ----------------------------------------------------------------------------
+
+def get_wire_format(requested_wire_format, logger=None):
+    """ The wire format a publisher should use given what it asked for,
+    falling back to JSON if msgpack isn't available."""
+    if logger is None:
+        logger = tracing.get_logger(APP_NAME, "get_wire_format")
+    assert(requested_wire_format in WIRE_FORMATS), "%s is not a wire format" % (requested_wire_format, )
+    if requested_wire_format == MSGPACK and msgpack is None:
+        logger.error("msgpack isn't installed, so publishing JSON.")
+        return JSON
+    return requested_wire_format
+
+def get_datetime(log_datum):
+    """ Build the datetime out of a log datum's stringified fields."""
+    datetime_obj = timestamp_cache.from_fields(log_datum["year"],
+                                               log_datum["month"],
+                                               log_datum["day"],
+                                               log_datum["hour"],
+                                               log_datum["minute"],
+                                               log_datum["second"])
+    if "millisecond" in log_datum:
+        datetime_obj = datetime_obj.replace(microsecond = int(log_datum["millisecond"]) * 1000)
+    return datetime_obj
+
+def encode(log_record, wire_format=JSON):
+    """ Encode a LogRecord."""
+    if wire_format == JSON:
+        return json.dumps(log_record.to_json_dict())
+    return LOG_RECORD_HEADER + _packb(log_record.to_wire())
+
+def decode(frame):
+    """ Decode a frame in either wire format into the document we store,
+    with a "datetime" rather than the stringified fields. Raises
+    ValueError if the frame can't be decoded or is missing fields."""
+    if frame.startswith(MAGIC):
+        return decode_binary(frame)
+    try:
+        log_datum = json.loads(frame)
+    except Exception, e:
+        raise ValueError("can't decode JSON frame: %s" % (e, ))
+    if not isinstance(log_datum, dict):
+        raise ValueError("JSON frame isn't an object")
+    for field in ["contents", "year", "month", "day", "hour", "minute", "second"]:
+        if field not in log_datum:
+            raise ValueError("JSON frame is missing '%s'" % (field, ))
+    document = dict((key, value) for (key, value) in log_datum.iteritems()
+                    if key not in DATETIME_FIELDS)
+    document["datetime"] = get_datetime(log_datum)
+    return document
+
+def decode_binary(frame):
+    if msgpack is None:
+        raise ValueError("msgpack isn't installed, can't decode binary frame")
+    if len(frame) < HEADER_LENGTH:
+        raise ValueError("binary frame is too short")
+    version = ord(frame[len(MAGIC)])
+    schema = ord(frame[len(MAGIC) + 1])
+    if version != VERSION or schema != SCHEMA_LOG_RECORD:
+        raise ValueError("unsupported binary frame, version %s, schema %s" % (version, schema))
+    try:
+        log_record = LogRecord.from_wire(_unpackb(frame[HEADER_LENGTH:]))
+    except Exception, e:
+        raise ValueError("can't decode binary frame: %s" % (e, ))
+    return log_record.to_document()
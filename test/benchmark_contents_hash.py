@@ -0,0 +1,135 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Cost of each contents_hash format:
+#
+#   -   hashes/s for each format and policy.
+#   -   bytes per key, i.e. what each index entry holds.
+#
+#   Given --mongo, also insert --records logs into a scratch collection for
+#   each format, with the same unique index as parser_tap_to_database, and
+#   report inserts/s and the size of the contents_hash index. The scratch
+#   collections are dropped afterwards.
+#
+#   Formats that can't be used here, i.e. xxh64 when xxhash isn't
+#   installed, are skipped.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import random
+import datetime
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import contents_hash
+
+APP_NAME = "benchmark_contents_hash"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+START_DATETIME = datetime.datetime(2012, 2, 28, 23, 30, 51)
+TEMPLATE = u"Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (%s)"
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark contents_hash formats.")
+    parser.add_argument("--records",
+                        dest="records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=200000,
+                        help="Number of logs to hash, and to insert if given --mongo.")
+    parser.add_argument("--mongo",
+                        dest="mongo",
+                        metavar="HOST:PORT",
+                        default=None,
+                        help="MongoDB server to insert into. Default is not to insert.")
+    parser.add_argument("--database",
+                        dest="database",
+                        metavar="NAME",
+                        default="benchmark_contents_hash",
+                        help="Scratch database to insert into.")
+    return parser.parse_args()
+
+def get_available_formats():
+    if contents_hash.xxhash is None:
+        logger.info("xxhash isn't installed, so only benchmarking md5.")
+        return [contents_hash.MD5]
+    return contents_hash.CONTENTS_HASH_FORMATS
+
+def get_logs(number_of_records):
+    random.seed(0)
+    return [(TEMPLATE % (random.randint(0, 1 << 30), ), START_DATETIME + datetime.timedelta(seconds=i / 100))
+            for i in xrange(number_of_records)]
+
+def run_hash(contents_hasher, logs):
+    start = time.time()
+    for (contents, datetime_obj) in logs:
+        contents_hasher(contents, datetime_obj)
+    return time.time() - start
+
+def get_key_size(contents_hash_value):
+    """ Bytes of the BSON value."""
+    if isinstance(contents_hash_value, basestring):
+        return 4 + len(contents_hash_value) + 1
+    return 8
+
+def run_insert(collection, contents_hasher, logs):
+    collection.ensure_index("contents_hash", unique=True, drop_dups=True)
+    collection.ensure_index([("datetime", -1)])
+    chunk_size = 10000
+    start = time.time()
+    for i in xrange(0, len(logs), chunk_size):
+        data = [{"datetime": datetime_obj,
+                 "contents": contents,
+                 "contents_hash": contents_hasher(contents, datetime_obj)}
+                for (contents, datetime_obj) in logs[i:i + chunk_size]]
+        collection.insert(data, continue_on_error=True, safe=True)
+    duration = time.time() - start
+    index_size = collection.database.command("collstats", collection.name)["indexSizes"]["contents_hash_1"]
+    return (duration, index_size)
+
+def main():
+    args = get_args()
+    logs = get_logs(args.records)
+    contents_hash_formats = get_available_formats()
+    for contents_hash_format in contents_hash_formats:
+        for policy in contents_hash.CONTENTS_HASH_POLICIES:
+            contents_hasher = contents_hash.ContentsHasher(contents_hash_format, policy)
+            duration = run_hash(contents_hasher, logs)
+            key_size = get_key_size(contents_hasher(*logs[0]))
+            logger.info("%s, %s: %s bytes/key, %.0f hashes/s" % \
+                        (contents_hash_format, policy, key_size, args.records / duration))
+
+    if args.mongo is None:
+        return
+    import pymongo
+    connection = pymongo.Connection(args.mongo)
+    database = connection[args.database]
+    try:
+        for contents_hash_format in contents_hash_formats:
+            contents_hasher = contents_hash.ContentsHasher(contents_hash_format, contents_hash.CONTENTS)
+            collection = database["logs_%s" % (contents_hash_format, )]
+            collection.drop()
+            (duration, index_size) = run_insert(collection, contents_hasher, logs)
+            logger.info("%s: %.0f inserts/s, contents_hash index %s bytes, %.1f bytes/log" % \
+                        (contents_hash_format, args.records / duration, index_size, float(index_size) / args.records))
+    finally:
+        connection.drop_database(args.database)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Synthetic corpora in the format of each log we parse, for benchmarks.
+#
+#   Each get_*_corpus(number_of_lines) returns about that many lines of
+#   text, always the same for a given number of lines, built from lines
+#   like the real ones:
+#
+#   -   messages: syslog lines from assorted programs.
+#   -   ms_messages: MS syslog lines, some of them handled assertions and
+#       exceptions.
+#   -   shm_messages: SHM syslog lines, some of them assertions.
+#   -   ep: ep.log, blocks of lines that share a log ID, some of them
+#       errors and warnings.
+#   -   hpilist: hpilist blocks with their source, event type, component
+#       path and sensor.
+#   -   stdout: stdout blocks under a datetime, with separator lines.
+#   -   vm_messages: the test VMs' "datetime server words" log.
+#
+#   Run directly to write them to files, e.g. to benchmark against the
+#   same corpora on another box.
+# ----------------------------------------------------------------------------
+
+import os
+import random
+import datetime
+import argparse
+
+APP_NAME = "benchmark_corpora"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+START_DATETIME = datetime.datetime(2012, 3, 1, 11, 37, 20)
+WORDS = ["socket", "connection", "made", "timeout", "retry", "channel", "pstack", "complete",
+         "sending", "process", "signal", "queue", "full", "dropped", "restart", "link", "up", "down"]
+
+def get_datetimes(random_generator):
+    """ Datetimes a few lines a second apart, like a busy log."""
+    datetime_obj = START_DATETIME
+    while 1:
+        yield datetime_obj
+        if random_generator.random() < 0.3:
+            datetime_obj += datetime.timedelta(seconds=1)
+
+def get_words(random_generator, minimum=3, maximum=12):
+    return " ".join(random_generator.choice(WORDS) for i in xrange(random_generator.randint(minimum, maximum)))
+
+def get_syslog_header(datetime_obj, host):
+    return "%s %2d %s %s" % (datetime_obj.strftime("%b"), datetime_obj.day, datetime_obj.strftime("%H:%M:%S"), host)
+
+def get_messages_corpus(number_of_lines):
+    # Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (24289)
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    programs = ["getpstack_cont.sh", "sshd[2231]", "kernel", "crond[1187]", "ntpd[990]"]
+    lines = []
+    for i in xrange(number_of_lines):
+        lines.append("%s %s: %s (%s)" % (get_syslog_header(datetimes.next(), "jabbah"),
+                                         random_generator.choice(programs),
+                                         get_words(random_generator),
+                                         random_generator.randint(0, 1 << 30)))
+    return "\n".join(lines) + "\n"
+
+def get_ms_messages_corpus(number_of_lines):
+    # Mar  7 19:38:33 alpheratz1 19:38:33.114 MS SI[20765]: [ID 452160 local1.info] Assertion (handled) failed: 'x', file a.c, line 3529.  Total handled asserts: 128
+    # Mar  6 15:50:17 subra2 MS craft: 06-Mar-2012, 15:50:17 UTC.  Craft user stopping the Integrated Softswitch
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    lines = []
+    for i in xrange(number_of_lines):
+        datetime_obj = datetimes.next()
+        header = "%s %s.%03d MS SI[20765]: [ID 452160 local1.info]" % \
+                 (get_syslog_header(datetime_obj, "alpheratz1"), datetime_obj.strftime("%H:%M:%S"), random_generator.randint(0, 999))
+        choice = random_generator.random()
+        if choice < 0.1:
+            lines.append("%s Assertion (handled) failed: '%s', file ../../../msw/code/tpc/tpcpgc.c, line %s.  Total handled asserts: %s" % \
+                         (header, get_words(random_generator, 2, 4), random_generator.randint(1, 5000), random_generator.randint(1, 200)))
+        elif choice < 0.15:
+            lines.append("%s Handled exception. %s" % (header, get_words(random_generator)))
+        else:
+            lines.append("%s %s" % (header, get_words(random_generator)))
+    return "\n".join(lines) + "\n"
+
+def get_shm_messages_corpus(number_of_lines):
+    # Feb 26 23:41:29 emer_mf106-wrlinux daemon.notice SYSSTAT(MSMonitor30)[3488]: report status: success: STATUS_OK @MSMonitor30, code=253, severity=0
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    lines = []
+    for i in xrange(number_of_lines):
+        header = "%s daemon.notice" % (get_syslog_header(datetimes.next(), "emer_mf106-wrlinux"), )
+        if random_generator.random() < 0.1:
+            lines.append("%s %s Assertion failed at %s.c:%s" % \
+                         (header, get_words(random_generator, 1, 3), random_generator.choice(WORDS), random_generator.randint(1, 5000)))
+        else:
+            lines.append("%s SYSSTAT(MSMonitor30)[3488]: report status: %s, code=%s, severity=0" % \
+                         (header, get_words(random_generator), random_generator.randint(0, 255)))
+    return "\n".join(lines) + "\n"
+
+def get_ep_corpus(number_of_lines):
+    # Mar  1 11:37:20 jabbah2 EP 11:37:20.272 0322 0   tDCCli DC_P2P DCClient::main() socket connection made
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    components = ["DC_P2P", "DC_SIP", "CM_MGR", "RT_ENG"]
+    lines = []
+    log_id = 100
+    while len(lines) < number_of_lines:
+        datetime_obj = datetimes.next()
+        log_id = (log_id + 1) % 10000
+        choice = random_generator.random()
+        if choice < 0.05:
+            stars = "**"
+        elif choice < 0.1:
+            stars = "*"
+        else:
+            stars = ""
+        prefix = "%s EP %s.%03d %04d 0   %stDCCli %s" % \
+                 (get_syslog_header(datetime_obj, "jabbah2"), datetime_obj.strftime("%H:%M:%S"),
+                  random_generator.randint(0, 999), log_id, stars, random_generator.choice(components))
+        if stars:
+            lines.append("%s %s [%s.cpp:%s]" % (prefix, get_words(random_generator), random_generator.choice(WORDS), random_generator.randint(1, 5000)))
+        else:
+            lines.append("%s DCClient::main() %s" % (prefix, get_words(random_generator)))
+        for i in xrange(random_generator.randint(0, 4)):
+            lines.append("%s   %s" % (prefix, get_words(random_generator)))
+    return "\n".join(lines[:number_of_lines]) + "\n"
+
+def get_hpilist_corpus(number_of_lines):
+    # 10:32:37.037 Source : 12
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    lines = []
+    while len(lines) < number_of_lines:
+        datetime_obj = datetimes.next()
+        lines.append("%s.%03d Source : %s" % (datetime_obj.strftime("%H:%M:%S"), random_generator.randint(0, 999), random_generator.randint(1, 64)))
+        lines.append("  EventType : %s" % (random_generator.choice(["SENSOR", "HOTSWAP", "WATCHDOG", "RESOURCE"]), ))
+        lines.append("  {SYSTEM_CHASSIS,1}{PROCESSOR,%s}" % (random_generator.randint(1, 8), ))
+        lines.append("  SensorNum : %s" % (random_generator.randint(1, 32), ))
+        lines.append("  SensorType : %s" % (random_generator.choice(["TEMPERATURE", "VOLTAGE", "FAN", "CURRENT"]), ))
+        for i in xrange(random_generator.randint(0, 3)):
+            lines.append("  %s" % (get_words(random_generator), ))
+    return "\n".join(lines[:number_of_lines]) + "\n"
+
+def get_stdout_corpus(number_of_lines):
+    # 17-Apr-2012, 10:32:37 UTC
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    lines = []
+    while len(lines) < number_of_lines:
+        if random_generator.random() < 0.02:
+            lines.append("=" * 60)
+        lines.append("%s UTC %s" % (datetimes.next().strftime("%d-%b-%Y, %H:%M:%S"), get_words(random_generator)))
+        for i in xrange(random_generator.randint(0, 5)):
+            lines.append("    %s" % (get_words(random_generator), ))
+    return "\n".join(lines[:number_of_lines]) + "\n"
+
+def get_vm_messages_corpus(number_of_lines):
+    # 2012-Feb-25 19:36:44 testvm.2 green a a a a a a a a a a a a a
+    random_generator = random.Random(0)
+    datetimes = get_datetimes(random_generator)
+    lines = []
+    for i in xrange(number_of_lines):
+        lines.append("%s testvm.%s %s" % (datetimes.next().strftime("%Y-%b-%d %H:%M:%S"), random_generator.randint(1, 2), get_words(random_generator)))
+    return "\n".join(lines) + "\n"
+
+CORPORA = {"messages": get_messages_corpus,
+           "ms_messages": get_ms_messages_corpus,
+           "shm_messages": get_shm_messages_corpus,
+           "ep": get_ep_corpus,
+           "hpilist": get_hpilist_corpus,
+           "stdout": get_stdout_corpus,
+           "vm_messages": get_vm_messages_corpus}
+
+def get_args():
+    parser = argparse.ArgumentParser("Write synthetic corpora of each log format to files.")
+    parser.add_argument("--output_directory",
+                        dest="output_directory",
+                        metavar="DIRECTORY",
+                        required=True,
+                        help="Directory to write <corpus>.log files into.")
+    parser.add_argument("--lines",
+                        dest="lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100000,
+                        help="Number of lines in each corpus.")
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+    if not os.path.isdir(args.output_directory):
+        os.makedirs(args.output_directory)
+    for (name, get_corpus) in sorted(CORPORA.items()):
+        filepath = os.path.join(args.output_directory, "%s.log" % (name, ))
+        with open(filepath, "w") as f:
+            f.write(get_corpus(args.lines))
+        logger.info("wrote %s" % (filepath, ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Throughput of parser_tap_to_database's writer against a local mongod,
+#   and how long it stops reading the parser for.
+#
+#   -   synchronous: how the writer used to insert. Push onto a heap, and
+#       every batch_records insert them on the receiving thread, then
+#       gc.collect().
+#   -   background: parser_tap_to_database.CollectionWriter, journaling
+#       every log datum and inserting in a background thread while the
+#       next batch fills.
+#   -   dedup: the same, with a dedup.ContentsHashFilter to skip log data
+#       it has stored already.
+#
+#   Each adds the same JSON frames, as a parser publishes them, into an
+#   empty collection with the writer's unique contents_hash index. Reports
+#   records/s until everything is stored, and the latency of each add(),
+#   i.e. how long a frame waits to be taken off the subscription socket.
+#   The longest of those is what fills the socket to its HWM.
+#
+#   With --resend every frame is added again once the first pass is stored,
+#   by a new writer, as after a tail -f restarts or reconcile_log cats a
+#   whole log file. The dedup writer's filter is saved and loaded in
+#   between, as it would be.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import gc
+import json
+import time
+import heapq
+import shutil
+import hashlib
+import datetime
+import argparse
+import tempfile
+
+import pymongo
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import journal
+import dedup
+import wire_format
+import parser_tap_to_database
+from metrics import LatencyHistogram
+import benchmark_corpora
+
+APP_NAME = "benchmark_database_writer"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+WRITERS = ["synchronous", "background", "dedup"]
+DEDUP_FILEPATH = os.path.join(tempfile.gettempdir(), "%s%s" % (APP_NAME, dedup.FILTER_EXTENSION))
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark inserting log data into a local mongod.")
+    parser.add_argument("--host",
+                        dest="host",
+                        metavar="HOST",
+                        default="localhost",
+                        help="mongod host.")
+    parser.add_argument("--port",
+                        dest="port",
+                        metavar="PORT",
+                        type=int,
+                        default=27017,
+                        help="mongod port.")
+    parser.add_argument("--database",
+                        dest="database",
+                        metavar="NAME",
+                        default="rill_benchmark",
+                        help="Database to benchmark in. Its collections are dropped.")
+    parser.add_argument("--writer",
+                        dest="writer_names",
+                        choices=WRITERS,
+                        nargs="+",
+                        default=WRITERS,
+                        help="Writers to benchmark. Default is all of them.")
+    parser.add_argument("--records",
+                        dest="records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=200000,
+                        help="Number of log data to insert.")
+    parser.add_argument("--batch_records",
+                        dest="batch_records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=parser_tap_to_database.DEFAULT_BATCH_RECORDS,
+                        help="Log data per batch.")
+    parser.add_argument("--batch_bytes",
+                        dest="batch_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=parser_tap_to_database.DEFAULT_BATCH_BYTES,
+                        help="Bytes per batch, for the background writer.")
+    parser.add_argument("--resend",
+                        dest="resend",
+                        action="store_true",
+                        default=False,
+                        help="Add every frame a second time, by a new writer, once the first time's are stored.")
+    return parser.parse_args()
+
+def get_frames(number_of_records):
+    """ JSON frames like a parser publishes, from the messages corpus."""
+    frames = []
+    lines = benchmark_corpora.get_messages_corpus(number_of_records).splitlines()
+    datetime_obj = benchmark_corpora.START_DATETIME
+    for (i, line) in enumerate(lines):
+        datetime_obj += datetime.timedelta(milliseconds=(i * 7919) % 1000)
+        frames.append(json.dumps({"contents": line,
+                                  "contents_hash": hashlib.md5("%s%s" % (i, line)).hexdigest(),
+                                  "year": str(datetime_obj.year),
+                                  "month": str(datetime_obj.month),
+                                  "day": str(datetime_obj.day),
+                                  "hour": str(datetime_obj.hour),
+                                  "minute": str(datetime_obj.minute),
+                                  "second": str(datetime_obj.second),
+                                  "log_type": "ngmg_messages_parser",
+                                  "box_name": "benchmark"}))
+    return frames
+
+def get_collection(args, writer_name):
+    connection = pymongo.Connection(args.host, args.port)
+    collection = connection[args.database]["benchmark_%s" % (writer_name, )]
+    collection.drop()
+    collection.ensure_index("contents_hash", unique=True, drop_dups=True)
+    collection.ensure_index([("datetime", -1)])
+    return collection
+
+def run_synchronous(args, collection, frames, add_latency):
+    accumulator = []
+    for frame in frames:
+        start_time = time.time()
+        data_to_store = wire_format.decode(frame)
+        heapq.heappush(accumulator, (datetime.datetime.utcnow(), data_to_store))
+        if len(accumulator) > args.batch_records:
+            data_to_insert = [heapq.heappop(accumulator)[1] for i in xrange(args.batch_records)]
+            collection.insert(data_to_insert, continue_on_error=True)
+            gc.collect()
+        add_latency.add(time.time() - start_time)
+    data_to_insert = [heapq.heappop(accumulator)[1] for i in xrange(len(accumulator))]
+    try:
+        collection.insert(data_to_insert, continue_on_error=True, safe=True)
+    except pymongo.errors.DuplicateKeyError:
+        pass
+
+def run_background(args, collection, frames, add_latency, contents_hash_filter=None):
+    journal_directory = tempfile.mkdtemp()
+    try:
+        collection_journal = journal.SegmentJournal(journal_directory, logger=logger)
+        writer = parser_tap_to_database.CollectionWriter(collection,
+                                                         collection_journal,
+                                                         logger,
+                                                         batch_records=args.batch_records,
+                                                         batch_bytes=args.batch_bytes,
+                                                         contents_hash_filter=contents_hash_filter)
+        for frame in frames:
+            start_time = time.time()
+            writer.add(frame)
+            add_latency.add(time.time() - start_time)
+        writer.flush()
+        writer.close()
+        collection_journal.close()
+    finally:
+        shutil.rmtree(journal_directory)
+
+def run_dedup(args, collection, frames, add_latency):
+    capacity = max(dedup.DEFAULT_CAPACITY, len(frames))
+    contents_hash_filter = dedup.ContentsHashFilter.load(DEDUP_FILEPATH, capacity, logger=logger)
+    if contents_hash_filter is None:
+        contents_hash_filter = dedup.ContentsHashFilter(DEDUP_FILEPATH, capacity)
+    run_background(args, collection, frames, add_latency, contents_hash_filter)
+
+RUN_FUNCTIONS = {"synchronous": run_synchronous,
+                 "background": run_background,
+                 "dedup": run_dedup}
+
+def main():
+    args = get_args()
+    frames = get_frames(args.records)
+    pass_names = ["first pass", "resend"] if args.resend else ["first pass"]
+    for writer_name in args.writer_names:
+        collection = get_collection(args, writer_name)
+        if os.path.isfile(DEDUP_FILEPATH):
+            os.remove(DEDUP_FILEPATH)
+        for pass_name in pass_names:
+            add_latency = LatencyHistogram()
+            start_time = time.time()
+            RUN_FUNCTIONS[writer_name](args, collection, frames, add_latency)
+            seconds = time.time() - start_time
+            logger.info("%s, %s: %s records in %.2fs, %.0f records/s, %s stored. add() latency (s): %s" % \
+                        (writer_name, pass_name, len(frames), seconds, len(frames) / seconds, collection.count(), add_latency))
+    if os.path.isfile(DEDUP_FILEPATH):
+        os.remove(DEDUP_FILEPATH)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Whole-batch feed_lines() against line-by-line feed() for the
+#   single-line parsers:
+#
+#   -   conformance: both give identical records for every line of the
+#       corpus, and for lines picked to take every path through
+#       syslog_header.SyslogHeaderParser: long month names, am/pm, leading
+#       junk, tabs and other whitespace, line breaks inside a line, empty
+#       lines. Exits with 1 if they don't.
+#   -   lines/s for each, feeding --batch_lines lines at a time, and for
+#       just matching the syslog header, which is the part that differs.
+#       The rest, hashing and tokenizing, is the same either way.
+#
+#   Without --corpus a corpus is made up from the example lines below.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import random
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+from ngmg_messages_parser import NgmgMessagesParserLogDatum
+from ngmg_ms_messages_parser import NgmgMsMessagesParserLogDatum
+from ngmg_shm_messages_parser import NgmgShmMessagesParserLogDatum
+
+APP_NAME = "benchmark_feed_lines"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+LOG_DATUM_CLASSES = [NgmgMessagesParserLogDatum,
+                     NgmgMsMessagesParserLogDatum,
+                     NgmgShmMessagesParserLogDatum]
+
+EXAMPLE_LINES = [u"Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (%s)",
+                 u"Mar  7 19:38:33 alpheratz1 19:38:33.114 MS SI[20765]: [ID 452160 local1.info] Assertion (handled) failed: 'x', file a.c, line %s.  Total handled asserts: 128",
+                 u"Mar  6 15:50:17 subra2 MS craft: 06-Mar-2012, 15:50:17 UTC.  Craft user stopping the Integrated Softswitch %s",
+                 u"Feb 26 23:41:29 emer_mf106-wrlinux daemon.notice SYSSTAT(MSMonitor30)[3488]: report status: success: STATUS_OK @MSMonitor30, code=%s, severity=0",
+                 u"Feb 26 23:41:29 emer.mf106-wrlinux daemon.notice Assertion failed at bar.c:%s"]
+
+# Lines that take the slow paths, or that the batch pattern must not match.
+EDGE_CASE_LINES = [u"June  1 11:37:20 jabbah2 long month name",
+                   u"Sept 10 01:02:03 jabbah2 long month name",
+                   u"Feb 28 11:30 pm jabbah am/pm and no seconds",
+                   u"Feb 28 11:30:51 pm jabbah am/pm",
+                   u"junk Feb 28 23:30:51 jabbah leading junk",
+                   u"Feb\t28\t23:30:51\tjabbah tabs",
+                   u"Feb 28 23:30:51\x0cjabbah form feed",
+                   u"Feb 28 23:30:51 jabbah carriage\rreturn",
+                   u"Feb 28 23:30:51 jabbah vertical\x0btab",
+                   u"Feb 28 23:30:51 jabbah unicode\u2028line separator",
+                   u"Feb 28 23:30:51 jabbah next\x85line",
+                   u"Feb 28 23:30:51 1234 no host",
+                   u"Feb 28 23:30:51 host.example.com fqdn",
+                   u"Feb 28 23:30:51  emer.mf106-wrlinux two spaces",
+                   u"Feb 30 23:30:51 jabbah no such day",
+                   u"",
+                   u"    ",
+                   u"no time at all"]
+
+def get_args():
+    parser = argparse.ArgumentParser("Check and benchmark whole-batch parsing of single-line logs.")
+    parser.add_argument("--corpus",
+                        dest="corpus",
+                        metavar="FILEPATH",
+                        default=None,
+                        help="Recorded log to parse. Default is to make one up.")
+    parser.add_argument("--lines",
+                        dest="lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100000,
+                        help="Number of lines to make up if not given --corpus.")
+    parser.add_argument("--batch_lines",
+                        dest="batch_lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1000,
+                        help="Number of lines to feed at a time.")
+    return parser.parse_args()
+
+def get_lines(args, log_datum_class):
+    """ The corpus, or made-up lines from the examples that the parser can
+    parse, as a real log would be."""
+    if args.corpus is not None:
+        with open(args.corpus) as f:
+            return f.read().decode("utf-8", "replace").split(u"\n")
+    random.seed(0)
+    example_lines = [example_line for example_line in EXAMPLE_LINES
+                     if log_datum_class.SYSLOG_HEADER.match_single_line(example_line)]
+    return [random.choice(example_lines) % (random.randint(0, 1 << 30), )
+            for i in xrange(args.lines)]
+
+def feed(log_datum_class, batches):
+    log_datum = log_datum_class()
+    log_records = []
+    for batch in batches:
+        for line in batch:
+            log_records.extend(log_datum.feed(line))
+    return log_records
+
+def feed_lines(log_datum_class, batches):
+    log_datum = log_datum_class()
+    log_records = []
+    for batch in batches:
+        log_records.extend(log_datum.feed_lines(batch))
+    return log_records
+
+def is_conformant(log_datum_class, lines, batch_lines):
+    """ Check feed_lines() against feed() on the edge cases, alone and mixed
+    into the lines, on all the example lines, on a batch with a line break
+    inside a line, and on all the lines."""
+    mixed_lines = lines[:batch_lines] + EDGE_CASE_LINES + lines[batch_lines:2 * batch_lines]
+    other_lines = [example_line % (i, ) for (i, example_line) in enumerate(EXAMPLE_LINES)]
+    for batches in [[EDGE_CASE_LINES],
+                    [other_lines],
+                    [mixed_lines],
+                    [[lines[0] + u"\n" + lines[1]] + lines[2:batch_lines]],
+                    [lines[i:i + batch_lines] for i in xrange(0, len(lines), batch_lines)]]:
+        expected = [log_record.to_wire() for log_record in feed(log_datum_class, batches)]
+        actual = [log_record.to_wire() for log_record in feed_lines(log_datum_class, batches)]
+        if actual != expected:
+            logger.error("%s: feed_lines() gave %s records, feed() %s, and they differ" % \
+                         (log_datum_class.__name__, len(actual), len(expected)))
+            return False
+    return True
+
+def main():
+    args = get_args()
+    is_all_conformant = True
+    for log_datum_class in LOG_DATUM_CLASSES:
+        lines = get_lines(args, log_datum_class)
+        batches = [lines[i:i + args.batch_lines] for i in xrange(0, len(lines), args.batch_lines)]
+        if not is_conformant(log_datum_class, lines, args.batch_lines):
+            is_all_conformant = False
+            continue
+        for (name, function) in [("feed", feed), ("feed_lines", feed_lines)]:
+            log_records = None
+            start = time.time()
+            log_records = function(log_datum_class, batches)
+            duration = time.time() - start
+            logger.info("%s %s: %s records, %.0f lines/s" % \
+                        (log_datum_class.__name__, name, len(log_records), len(lines) / duration))
+        syslog_header = log_datum_class.SYSLOG_HEADER
+        for (name, function) in [("match_single_line", lambda batch: [syslog_header.match_single_line(line) for line in batch]),
+                                 ("match_single_lines", syslog_header.match_single_lines)]:
+            start = time.time()
+            for batch in batches:
+                function(batch)
+            duration = time.time() - start
+            logger.info("%s %s: %.0f lines/s" % \
+                        (log_datum_class.__name__, name, len(lines) / duration))
+    if not is_all_conformant:
+        sys.exit(1)
+    logger.info("feed_lines() gives identical records to feed().")
+
+if __name__ == "__main__":
+    main()
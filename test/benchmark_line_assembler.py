@@ -0,0 +1,129 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Micro-benchmark of base_parser.split_contents_and_return_excess against
+#   line_assembler.LineAssembler on chunked input, like what ssh_tap sends
+#   us.
+#
+#   -   "lines": many ordinary ep.log lines, cut into small chunks.
+#   -   "stalled": one very long line trickling in, which is the case that
+#       used to be quadratic.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import random
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+from base_parser import split_contents_and_return_excess
+from line_assembler import LineAssembler
+
+APP_NAME = "benchmark_line_assembler"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+EP_LINE = "Mar  1 11:37:%02d jabbah2 EP 11:37:20.272 0322 0   tDCCli DC_P2P DCClient::main() socket connection made %s"
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark line splitting of chunked input.")
+    parser.add_argument("--lines",
+                        dest="lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=20000,
+                        help="Number of lines in the 'lines' corpus.")
+    parser.add_argument("--stalled_bytes",
+                        dest="stalled_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=256 * 1024,
+                        help="Length of the line in the 'stalled' corpus.")
+    parser.add_argument("--chunk_size",
+                        dest="chunk_size",
+                        metavar="INTEGER",
+                        type=int,
+                        default=64,
+                        help="Maximum size of each chunk.")
+    parser.add_argument("--repeat",
+                        dest="repeat",
+                        metavar="INTEGER",
+                        type=int,
+                        default=3,
+                        help="Take the best of this many runs.")
+    return parser.parse_args()
+
+def chunk_contents(contents, chunk_size):
+    random.seed(0)
+    chunks = []
+    i = 0
+    while i < len(contents):
+        size = random.randint(1, chunk_size)
+        chunks.append(contents[i:i + size])
+        i += size
+    return chunks
+
+def get_lines_corpus(number_of_lines, chunk_size):
+    lines = [EP_LINE % (i % 60, "x" * (i % 80)) for i in xrange(number_of_lines)]
+    return chunk_contents(u"\r\n".join(lines) + u"\r\n", chunk_size)
+
+def get_stalled_corpus(stalled_bytes, chunk_size):
+    contents = u"a" * stalled_bytes + u"\n"
+    return chunk_contents(contents, chunk_size)
+
+def run_split_contents_and_return_excess(chunks):
+    trailing_excess = ""
+    full_lines = []
+    for chunk in chunks:
+        trailing_excess = ''.join([trailing_excess, chunk])
+        (new_full_lines, trailing_excess) = split_contents_and_return_excess(trailing_excess)
+        full_lines.extend(new_full_lines)
+    return full_lines
+
+def run_line_assembler(chunks):
+    line_assembler = LineAssembler()
+    full_lines = []
+    for chunk in chunks:
+        full_lines.extend(line_assembler.feed(chunk))
+    return full_lines
+
+def time_function(function, chunks, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        rv = function(chunks)
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return (best, rv)
+
+def main():
+    args = get_args()
+    corpora = [("lines", get_lines_corpus(args.lines, args.chunk_size)),
+               ("stalled", get_stalled_corpus(args.stalled_bytes, args.chunk_size))]
+    for (corpus_name, chunks) in corpora:
+        total_bytes = sum(len(chunk) for chunk in chunks)
+        (old_duration, old_lines) = time_function(run_split_contents_and_return_excess, chunks, args.repeat)
+        (new_duration, new_lines) = time_function(run_line_assembler, chunks, args.repeat)
+        assert(old_lines == new_lines), "LineAssembler disagrees with split_contents_and_return_excess on corpus '%s'" % (corpus_name, )
+        logger.info("corpus: %s, chunks: %s, bytes: %s, lines: %s" % (corpus_name, len(chunks), total_bytes, len(new_lines)))
+        logger.info("    split_contents_and_return_excess: %.3fs (%.1f MB/s)" % (old_duration, total_bytes / old_duration / 1e6))
+        logger.info("    LineAssembler:                    %.3fs (%.1f MB/s)" % (new_duration, total_bytes / new_duration / 1e6))
+        logger.info("    speedup: %.1fx" % (old_duration / new_duration, ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Allocations of the per-line dicts parsers used to emit against
+#   log_record.LogRecord:
+#
+#   -   bytes/record: sys.getsizeof() of the record and the objects made
+#       just for it, i.e. not the contents, hash or keywords, which are the
+#       same either way.
+#   -   peak RSS: growth in ru_maxrss while holding --records records, each
+#       measured in its own process.
+#   -   records/s: making a record, adding box_name and turning it into the
+#       document we store, which for the dicts was copying it and popping
+#       the stringified timestamp.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import datetime
+import resource
+import argparse
+import multiprocessing
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+from log_record import LogRecord
+
+APP_NAME = "benchmark_log_record"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+CONTENTS = u"Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (24289)"
+CONTENTS_HASH = "0sG1bDlIcBm0A5Dj0c7uLA=="
+KEYWORDS = [u"24289", u"complete", u"getpstack_cont", u"jabbah", u"process", u"pstack", u"sending", u"sh", u"sigcont"]
+BOX_NAME = "jabbah_ngmg_messages_parser"
+START_DATETIME = datetime.datetime(2012, 2, 28, 23, 30, 51)
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark the allocations of per-line dicts against LogRecord.")
+    parser.add_argument("--records",
+                        dest="records",
+                        metavar="INTEGER",
+                        type=int,
+                        default=500000,
+                        help="Number of records to make.")
+    return parser.parse_args()
+
+def get_datetimes(number_of_records):
+    """ A new timestamp every 100 records, like a busy log."""
+    return [START_DATETIME + datetime.timedelta(seconds=i / 100) for i in xrange(number_of_records)]
+
+def make_dict(datetime_obj):
+    return_value = {}
+    return_value["year"] = str(datetime_obj.year)
+    return_value["month"] = str(datetime_obj.month)
+    return_value["day"] = str(datetime_obj.day)
+    return_value["hour"] = str(datetime_obj.hour)
+    return_value["minute"] = str(datetime_obj.minute)
+    return_value["second"] = str(datetime_obj.second)
+    return_value["contents"] = CONTENTS
+    return_value["contents_hash"] = CONTENTS_HASH
+    return_value["keywords"] = KEYWORDS
+    return_value["box_name"] = BOX_NAME
+    return return_value
+
+def make_log_record(datetime_obj):
+    log_record = LogRecord.from_datetime(datetime_obj, CONTENTS, CONTENTS_HASH, KEYWORDS)
+    log_record.box_name = BOX_NAME
+    return log_record
+
+def get_dict_size(return_value):
+    return sys.getsizeof(return_value) + \
+           sum(sys.getsizeof(return_value[key]) for key in ["year", "month", "day", "hour", "minute", "second"])
+
+def get_log_record_size(log_record):
+    return sys.getsizeof(log_record) + sys.getsizeof(log_record.epoch_ms)
+
+def dict_to_document(return_value):
+    document = return_value.copy()
+    for key in ["year", "month", "day", "hour", "minute", "second", "millisecond"]:
+        if key in document:
+            document.pop(key)
+    document["datetime"] = datetime.datetime(int(return_value["year"]),
+                                             int(return_value["month"]),
+                                             int(return_value["day"]),
+                                             int(return_value["hour"]),
+                                             int(return_value["minute"]),
+                                             int(return_value["second"]))
+    return document
+
+def log_record_to_document(log_record):
+    return log_record.to_document()
+
+def measure_peak_rss(make, number_of_records, queue):
+    datetimes = get_datetimes(number_of_records)
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    records = [make(datetime_obj) for datetime_obj in datetimes]
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss)
+
+def get_peak_rss(make, number_of_records):
+    """ ru_maxrss never goes down, so measure in a new process."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target = measure_peak_rss,
+                                      args = (make, number_of_records, queue))
+    process.start()
+    peak_rss = queue.get()
+    process.join()
+    return peak_rss
+
+def run(make, to_document, datetimes):
+    start = time.time()
+    for datetime_obj in datetimes:
+        to_document(make(datetime_obj))
+    return time.time() - start
+
+def main():
+    args = get_args()
+    datetimes = get_datetimes(args.records)
+    approaches = [("dict", make_dict, get_dict_size, dict_to_document),
+                  ("LogRecord", make_log_record, get_log_record_size, log_record_to_document)]
+    for (name, make, get_size, to_document) in approaches:
+        size = get_size(make(START_DATETIME))
+        peak_rss = get_peak_rss(make, args.records)
+        duration = run(make, to_document, datetimes)
+        logger.info("%s: %s bytes/record, peak RSS +%s KB for %s records, %.0f records/s" % \
+                    (name, size, peak_rss, args.records, args.records / duration))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Speedup of parsing one stream in a pool of processes, i.e.
+#   base_parser.ParallelParserStream, over base_parser.ParserStream.
+#
+#   A recorded log is cut into ssh_tap messages and handled by each stream
+#   as batches, the way base_parser receives them. Reports records/s for
+#   the single-process path and for each number of processes, and checks
+#   that every run publishes the same log data in the same order.
+#
+#   e.g.
+#
+#   benchmark_parallel_parser.py --parser ngmg_ep_parser --corpus ep.log --processes 1 2 4
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import base_parser
+import wire_format
+from constants import parser_farm_classes
+
+APP_NAME = "benchmark_parallel_parser"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark parsing one stream in a pool of processes.")
+    parser.add_argument("--parser",
+                        dest="parser_name",
+                        choices=sorted(parser_farm_classes.keys()),
+                        required=True,
+                        help="Parser to benchmark.")
+    parser.add_argument("--corpus",
+                        dest="corpus",
+                        metavar="FILEPATH",
+                        required=True,
+                        help="Recorded log to parse.")
+    parser.add_argument("--processes",
+                        dest="processes",
+                        metavar="INTEGER",
+                        type=int,
+                        nargs="+",
+                        default=[multiprocessing.cpu_count()],
+                        help="Numbers of processes to parse in. Default is the number of cores.")
+    parser.add_argument("--parse_chunk_lines",
+                        dest="parse_chunk_lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=base_parser.DEFAULT_PARSE_CHUNK_LINES,
+                        help="Most lines to send to a process at a time.")
+    parser.add_argument("--message_bytes",
+                        dest="message_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=4096,
+                        help="Size of each ssh_tap message the corpus is cut into.")
+    parser.add_argument("--batch_max_messages",
+                        dest="batch_max_messages",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100,
+                        help="Number of ssh_tap messages in each batch.")
+    return parser.parse_args()
+
+class CollectingSocket(object):
+    """ Stands in for the PUB socket and keeps what's published."""
+
+    def __init__(self):
+        self.parts = []
+
+    def send_multipart(self, parts):
+        self.parts.extend(parts)
+
+def get_batches(corpus, message_bytes, batch_max_messages):
+    with open(corpus) as f:
+        contents = f.read().decode("utf-8", "replace")
+    messages = [json.dumps({"contents": contents[i:i + message_bytes]})
+                for i in xrange(0, len(contents), message_bytes)]
+    return [messages[i:i + batch_max_messages]
+            for i in xrange(0, len(messages), batch_max_messages)]
+
+def run(parser_stream, batches):
+    start = time.time()
+    for batch in batches:
+        parser_stream.handle_batch(batch)
+    parser_stream.flush_if_idle(0)
+    if isinstance(parser_stream, base_parser.ParallelParserStream):
+        while len(parser_stream.chunks_in_flight) > 0:
+            parser_stream.publish_ready(block=True)
+    return time.time() - start
+
+def main():
+    args = get_args()
+    module = __import__(args.parser_name)
+    log_datum_class = getattr(module, parser_farm_classes[args.parser_name])
+    batches = get_batches(args.corpus, args.message_bytes, args.batch_max_messages)
+
+    publish_socket = CollectingSocket()
+    parser_stream = base_parser.ParserStream("benchmark", log_datum_class, publish_socket, logger)
+    serial_duration = run(parser_stream, batches)
+    expected_documents = [wire_format.decode(part) for part in publish_socket.parts]
+    number_of_records = len(expected_documents)
+    logger.info("%s: %s records, single process %.0f records/s" % \
+                (args.parser_name, number_of_records, number_of_records / serial_duration))
+
+    for processes in args.processes:
+        pool = base_parser.get_parse_pool(processes, log_datum_class)
+        try:
+            publish_socket = CollectingSocket()
+            parser_stream = base_parser.ParallelParserStream("benchmark",
+                                                             log_datum_class,
+                                                             publish_socket,
+                                                             logger,
+                                                             pool,
+                                                             processes,
+                                                             chunk_lines=args.parse_chunk_lines)
+            duration = run(parser_stream, batches)
+        finally:
+            pool.terminate()
+        documents = [wire_format.decode(part) for part in publish_socket.parts]
+        if documents != expected_documents:
+            logger.error("%s processes: published log data differs from the single process path." % (processes, ))
+        logger.info("%s processes: %.0f records/s, speedup %.2fx" % \
+                    (processes, len(documents) / duration, serial_duration / duration))
+
+if __name__ == "__main__":
+    main()
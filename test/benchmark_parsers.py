@@ -0,0 +1,266 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Throughput of each parser's LogDatum class, stage by stage, on a corpus
+#   of its log format. The corpus is cut into ssh_tap messages and goes
+#   through:
+#
+#   -   split: base_parser.split_contents_and_return_excess, on each
+#       message with the excess of the last.
+#   -   line_assembler: line_assembler.LineAssembler, which is what
+#       base_parser splits with.
+#   -   parse: the LogDatum class, feed_lines() then flush(). The
+#       vm_messages parser is one LogDatum per line.
+#   -   publish: wire_format.encode of every LogRecord as JSON.
+#
+#   For each parser reports lines/s and bytes/s of each stage and of
+#   line_assembler, parse and publish together, the number of records and
+#   the peak RSS. Each parser runs in its own process so peaks don't
+#   carry over.
+#
+#   Corpora are made up by benchmark_corpora.py unless --corpus_directory
+#   has recorded ones, named <corpus>.log. Save the results with --output
+#   and compare two runs with --compare, e.g.
+#
+#   benchmark_parsers.py --output before.json
+#   benchmark_parsers.py --output after.json
+#   benchmark_parsers.py --compare before.json after.json
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import datetime
+import multiprocessing
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import base_parser
+import wire_format
+from line_assembler import LineAssembler
+import benchmark_corpora
+
+APP_NAME = "benchmark_parsers"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+# parser module: (LogDatum class name, corpus name)
+PARSERS = {"ngmg_ep_parser": ("NgmgEpParserLogDatum", "ep"),
+           "ngmg_messages_parser": ("NgmgMessagesParserLogDatum", "messages"),
+           "ngmg_ms_messages_parser": ("NgmgMsMessagesParserLogDatum", "ms_messages"),
+           "ngmg_shm_hpilist_parser": ("NgmgShmHpilistParserLogDatum", "hpilist"),
+           "ngmg_shm_messages_parser": ("NgmgShmMessagesParserLogDatum", "shm_messages"),
+           "ngmg_stdout_parser": ("NgmgStdoutParserLogDatum", "stdout"),
+           "vm_messages_parser": ("LogDatum", "vm_messages")}
+STAGES = ["split", "line_assembler", "parse", "publish"]
+PIPELINE_STAGES = ["line_assembler", "parse", "publish"]
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark each parser stage by stage.")
+    parser.add_argument("--parser",
+                        dest="parser_names",
+                        choices=sorted(PARSERS.keys()),
+                        nargs="+",
+                        default=sorted(PARSERS.keys()),
+                        help="Parsers to benchmark. Default is all of them.")
+    parser.add_argument("--corpus_directory",
+                        dest="corpus_directory",
+                        metavar="DIRECTORY",
+                        default=None,
+                        help="Directory of recorded corpora, <corpus>.log. Default is to make them up.")
+    parser.add_argument("--lines",
+                        dest="lines",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100000,
+                        help="Number of lines to make up for each corpus not in --corpus_directory.")
+    parser.add_argument("--message_bytes",
+                        dest="message_bytes",
+                        metavar="INTEGER",
+                        type=int,
+                        default=4096,
+                        help="Size of each ssh_tap message the corpus is cut into.")
+    parser.add_argument("--output",
+                        dest="output",
+                        metavar="FILEPATH",
+                        default=None,
+                        help="Save the results as JSON to this file.")
+    parser.add_argument("--compare",
+                        dest="compare",
+                        metavar="FILEPATH",
+                        nargs=2,
+                        default=None,
+                        help="Instead of benchmarking compare two saved results, old then new.")
+    return parser.parse_args()
+
+def get_peak_rss_kb():
+    """ Peak resident set size of this process. Linux gives KB, OS X bytes."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == "Darwin":
+        peak_rss /= 1024
+    return peak_rss
+
+def get_corpus(args, corpus_name):
+    if args.corpus_directory is not None:
+        filepath = os.path.join(args.corpus_directory, "%s.log" % (corpus_name, ))
+        if os.path.isfile(filepath):
+            with open(filepath) as f:
+                return f.read().decode("utf-8", "replace")
+    return benchmark_corpora.CORPORA[corpus_name](args.lines).decode("utf-8")
+
+def split(messages):
+    lines = []
+    excess = u""
+    for message in messages:
+        (full_lines, excess) = base_parser.split_contents_and_return_excess(excess + message)
+        lines.extend(full_lines)
+    return lines
+
+def assemble(messages):
+    line_assembler = LineAssembler()
+    lines = []
+    for message in messages:
+        lines.extend(line_assembler.feed(message))
+    return lines
+
+def get_parse_function(parser_name, log_datum_class):
+    if parser_name == "vm_messages_parser":
+        def parse(lines):
+            log_records = [log_datum_class(line).get_log_record() for line in lines]
+            return [log_record for log_record in log_records if log_record is not None]
+        return parse
+    def parse(lines):
+        log_datum = log_datum_class()
+        log_records = log_datum.feed_lines(lines)
+        log_records.extend(log_datum.flush())
+        return log_records
+    return parse
+
+def publish(log_records, log_type):
+    parts = []
+    for log_record in log_records:
+        log_record.box_name = "benchmark"
+        log_record.log_type = log_type
+        parts.append(wire_format.encode(log_record, wire_format.JSON))
+    return parts
+
+def benchmark_parser(args, parser_name, result_queue):
+    """ In its own process benchmark one parser and put its results on
+    result_queue."""
+    (log_datum_class_name, corpus_name) = PARSERS[parser_name]
+    module = __import__(parser_name)
+    log_datum_class = getattr(module, log_datum_class_name)
+    corpus = get_corpus(args, corpus_name)
+    number_of_bytes = len(corpus.encode("utf-8"))
+    messages = [corpus[i:i + args.message_bytes] for i in xrange(0, len(corpus), args.message_bytes)]
+    del corpus
+    start_rss_kb = get_peak_rss_kb()
+
+    seconds = {}
+    start = time.time()
+    lines = split(messages)
+    seconds["split"] = time.time() - start
+
+    lines = None
+    start = time.time()
+    lines = assemble(messages)
+    seconds["line_assembler"] = time.time() - start
+
+    parse = get_parse_function(parser_name, log_datum_class)
+    start = time.time()
+    log_records = parse(lines)
+    seconds["parse"] = time.time() - start
+
+    start = time.time()
+    parts = publish(log_records, parser_name)
+    seconds["publish"] = time.time() - start
+
+    pipeline_seconds = sum(seconds[stage] for stage in PIPELINE_STAGES)
+    result = {"corpus": corpus_name,
+              "lines": len(lines),
+              "bytes": number_of_bytes,
+              "records": len(log_records),
+              "published_bytes": sum(len(part) for part in parts),
+              "start_rss_kb": start_rss_kb,
+              "peak_rss_kb": get_peak_rss_kb(),
+              "seconds": pipeline_seconds,
+              "lines_per_second": len(lines) / pipeline_seconds,
+              "bytes_per_second": number_of_bytes / pipeline_seconds,
+              "stages": {}}
+    for stage in STAGES:
+        result["stages"][stage] = {"seconds": seconds[stage],
+                                   "lines_per_second": len(lines) / seconds[stage],
+                                   "bytes_per_second": number_of_bytes / seconds[stage]}
+    result_queue.put(result)
+
+def log_result(parser_name, result):
+    logger.info("%s: %s lines, %s bytes, %s records, %.0f lines/s, %.0f bytes/s, peak RSS %s KB" % \
+                (parser_name, result["lines"], result["bytes"], result["records"],
+                 result["lines_per_second"], result["bytes_per_second"], result["peak_rss_kb"]))
+    for stage in STAGES:
+        stage_result = result["stages"][stage]
+        logger.info("    %-14s %8.3fs %10.0f lines/s %12.0f bytes/s" % \
+                    (stage, stage_result["seconds"], stage_result["lines_per_second"], stage_result["bytes_per_second"]))
+
+def compare(old_filepath, new_filepath):
+    with open(old_filepath) as f:
+        old_results = json.load(f)["results"]
+    with open(new_filepath) as f:
+        new_results = json.load(f)["results"]
+    for parser_name in sorted(set(old_results) & set(new_results)):
+        (old_result, new_result) = (old_results[parser_name], new_results[parser_name])
+        logger.info("%s: %.0f -> %.0f lines/s (%.2fx), peak RSS %s -> %s KB" % \
+                    (parser_name, old_result["lines_per_second"], new_result["lines_per_second"],
+                     new_result["lines_per_second"] / old_result["lines_per_second"],
+                     old_result["peak_rss_kb"], new_result["peak_rss_kb"]))
+        for stage in STAGES:
+            if stage not in old_result["stages"] or stage not in new_result["stages"]:
+                continue
+            (old_seconds, new_seconds) = (old_result["stages"][stage]["seconds"], new_result["stages"][stage]["seconds"])
+            logger.info("    %-14s %8.3fs -> %8.3fs (%.2fx)" % (stage, old_seconds, new_seconds, old_seconds / new_seconds))
+
+def main():
+    args = get_args()
+    if args.compare is not None:
+        compare(*args.compare)
+        return
+    results = {}
+    for parser_name in args.parser_names:
+        result_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=benchmark_parser, args=(args, parser_name, result_queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            logger.error("%s: benchmark failed with exit code %s" % (parser_name, process.exitcode))
+            continue
+        result = result_queue.get()
+        log_result(parser_name, result)
+        results[parser_name] = result
+    if args.output is not None:
+        output = {"datetime": datetime.datetime.utcnow().isoformat(),
+                  "python_version": platform.python_version(),
+                  "platform": platform.platform(),
+                  "args": vars(args),
+                  "results": results}
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=4, sort_keys=True)
+        logger.info("saved results to %s" % (args.output, ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Lines/sec of each NGMG messages parser's RE_LINE.search() against its
+#   anchored SYSLOG_HEADER.match(), on:
+#
+#   -   realistic: lines like the ones in the parsers' comments.
+#   -   adversarial: long lines that don't match, or only after a long
+#       search. RE_LINE takes a cubic number of steps or worse on some of
+#       them, so the default length is short; at 2000 characters RE_LINE
+#       takes minutes a line. SYSLOG_HEADER is linear in the length.
+#
+#   Also checks the two agree on every line.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+from ngmg_messages_parser import NgmgMessagesParserLogDatum
+from ngmg_ms_messages_parser import NgmgMsMessagesParserLogDatum
+from ngmg_shm_messages_parser import NgmgShmMessagesParserLogDatum
+
+APP_NAME = "benchmark_syslog_header"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+PARSERS = [("ngmg_messages_parser", NgmgMessagesParserLogDatum),
+           ("ngmg_ms_messages_parser", NgmgMsMessagesParserLogDatum),
+           ("ngmg_shm_messages_parser", NgmgShmMessagesParserLogDatum)]
+
+REALISTIC_LINES = [u"Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (24289)",
+                   u"Mar  7 19:38:33 alpheratz1 19:38:33.114 MS SI[20765]: [ID 452160 local1.info] Assertion (handled) failed: 'term_cb->pg.old_dsp_channel != TPC_TC_DSP_CHANNEL_UNASSIGNED', file ../../../msw/code/tpc/tpcpgc.c, line 3529.  Total handled asserts: 128",
+                   u"Mar  6 15:50:17 subra2 MS craft: 06-Mar-2012, 15:50:17 UTC.  Craft user stopping the Integrated Softswitch",
+                   u"Feb 26 23:41:29 emer_mf106-wrlinux daemon.notice SYSSTAT(MSMonitor30)[3488]: report status: success: STATUS_OK @MSMonitor30, code=253, severity=0",
+                   u"Feb 26 23:41:29 mf106.2nd.example.com daemon.notice SYSSTAT(MSMonitor30)[3488]: report status: success: STATUS_OK @MSMonitor30, code=253, severity=0"]
+
+def get_adversarial_lines(length):
+    return [u"Feb " * (length / 4),
+            u"Feb 28 " + u"1:" * (length / 2),
+            u"Feb 28 23:30:51 " + u"a" * length,
+            u"Feb 28 23:30:51 " + u"a." * (length / 2),
+            u"x" + u"Jan 1 12:00 " * (length / 12)]
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark RE_LINE against SYSLOG_HEADER for the NGMG messages parsers.")
+    parser.add_argument("--repeat",
+                        dest="repeat",
+                        metavar="INTEGER",
+                        type=int,
+                        default=10000,
+                        help="Number of passes over the realistic lines.")
+    parser.add_argument("--adversarial_length",
+                        dest="adversarial_length",
+                        metavar="INTEGER",
+                        type=int,
+                        default=200,
+                        help="Length of the adversarial lines. Default is 200.")
+    parser.add_argument("--adversarial_repeat",
+                        dest="adversarial_repeat",
+                        metavar="INTEGER",
+                        type=int,
+                        default=5,
+                        help="Number of passes over the adversarial lines.")
+    return parser.parse_args()
+
+def run_re_line(log_datum_class, lines, repeat):
+    search = log_datum_class.RE_LINE.search
+    start = time.time()
+    for i in xrange(repeat):
+        for line in lines:
+            search(line)
+    return time.time() - start
+
+def run_syslog_header(log_datum_class, lines, repeat):
+    match = log_datum_class.SYSLOG_HEADER.match
+    start = time.time()
+    for i in xrange(repeat):
+        for line in lines:
+            match(line)
+    return time.time() - start
+
+def check_agreement(parser_name, log_datum_class, lines):
+    for line in lines:
+        m = log_datum_class.RE_LINE.search(line)
+        expected = m.group(1, 2, 3, 4, 5) if m else None
+        actual = log_datum_class.SYSLOG_HEADER.match(line)
+        assert(expected == actual), "%s disagrees on line %r: %s != %s" % (parser_name, line[:80], expected, actual)
+
+def main():
+    args = get_args()
+    corpora = [("realistic", REALISTIC_LINES, args.repeat),
+               ("adversarial", get_adversarial_lines(args.adversarial_length), args.adversarial_repeat)]
+    for (parser_name, log_datum_class) in PARSERS:
+        for (corpus_name, lines, repeat) in corpora:
+            check_agreement(parser_name, log_datum_class, lines)
+            number_of_lines = len(lines) * repeat
+            old_duration = run_re_line(log_datum_class, lines, repeat)
+            new_duration = run_syslog_header(log_datum_class, lines, repeat)
+            logger.info("%s, %s: RE_LINE %.0f lines/s, SYSLOG_HEADER %.0f lines/s, speedup %.1fx" % \
+                        (parser_name, corpus_name,
+                         number_of_lines / old_duration,
+                         number_of_lines / new_duration,
+                         old_duration / new_duration))
+
+if __name__ == "__main__":
+    main()
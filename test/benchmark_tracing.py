@@ -0,0 +1,85 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Cost per call of debug output that's switched off, the way we used to
+#   write it and with tracing, and of getting a function's logger.
+#
+#   -   eager: logger.debug("..." % (...)) with the logger at INFO. The
+#       string, and any pprint.pformat, is built and thrown away.
+#   -   logging args: logger.debug("...", ...). Nothing's formatted, but
+#       logging still checks the level.
+#   -   trace: a disabled tracing.Tracer.
+#   -   trace, guarded: "if trace.enabled: trace(...)".
+#
+#   Times are nanoseconds per call over an empty loop.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import timeit
+import logging
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+
+APP_NAME = "benchmark_tracing"
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+SETUP = """
+import logging
+import pprint
+import tracing
+logger = logging.getLogger("benchmark_tracing.quiet")
+logger.setLevel(logging.INFO)
+tracing.disable("benchmark_tracing.quiet")
+trace = tracing.get_tracer("benchmark_tracing.quiet")
+line = u"Mar  1 11:37:20 jabbah2 EP 11:37:20.272 0322 0   tDCCli DC_P2P DCClient::main() socket connection made"
+block = [line] * 5
+APP_NAME = "benchmark_tracing"
+"""
+
+STATEMENTS = [("empty loop", "pass"),
+              ("eager", "logger.debug(\"Update: '%s'\" % (line, ))"),
+              ("eager pformat", "logger.debug(\"block:\\n%s\" % (pprint.pformat(block), ))"),
+              ("logging args", "logger.debug(\"Update: '%s'\", line)"),
+              ("trace", "trace(\"Update: '%s'\", line)"),
+              ("trace pformat", "trace(\"block:\\n%s\", tracing.Lazy(pprint.pformat, block))"),
+              ("trace, guarded", "if trace.enabled: trace(\"Update: '%s'\", line)"),
+              ("getLogger", "logging.getLogger(\"%s.main\" % (APP_NAME, ))"),
+              ("tracing.get_logger", "tracing.get_logger(APP_NAME, \"main\")")]
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark disabled debug output and getting loggers.")
+    parser.add_argument("--number",
+                        dest="number",
+                        metavar="INTEGER",
+                        type=int,
+                        default=1000000,
+                        help="Number of calls to time each statement over.")
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+    nanoseconds = {}
+    for (name, statement) in STATEMENTS:
+        # Best of three, to be less at the mercy of whatever else is running.
+        timings = timeit.repeat(statement, SETUP, repeat=3, number=args.number)
+        nanoseconds[name] = min(timings) / args.number * 1e9
+    for (name, statement) in STATEMENTS[1:]:
+        logger.info("%-20s %8.1f ns/call" % (name, nanoseconds[name] - nanoseconds["empty loop"]))
+
+if __name__ == "__main__":
+    main()
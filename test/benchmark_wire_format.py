@@ -0,0 +1,114 @@
+#!/usr/bin/env python2.7
+
+# ---------------------------------------------------------------------------
+# Copyright (c) 2011 Asim Ihsan (asim dot ihsan at gmail dot com)
+# Distributed under the MIT/X11 software license, see the accompanying
+# file license.txt or http://www.opensource.org/licenses/mit-license.php.
+# ---------------------------------------------------------------------------
+
+# ----------------------------------------------------------------------------
+#   Records/sec to encode and decode log data in each wire format, and the
+#   bytes on the wire per record, on:
+#
+#   -   messages: short single-line syslog records.
+#   -   hpilist: multi-line records with a millisecond and extra fields.
+#
+#   Also checks that every format decodes to the same document. Formats
+#   that can't be used here, i.e. msgpack when it isn't installed, are
+#   skipped.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import datetime
+import argparse
+
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import wire_format
+from log_record import LogRecord
+
+APP_NAME = "benchmark_wire_format"
+import logging
+logger = logging.getLogger(APP_NAME)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(message)s")
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+MESSAGES_RECORD = LogRecord.from_datetime(datetime.datetime(2012, 2, 28, 23, 30, 51),
+                                          u"Feb 28 23:30:51 jabbah getpstack_cont.sh: pstack complete, sending SIGCONT to process  (24289)",
+                                          "0sG1bDlIcBm0A5Dj0c7uLA==",
+                                          [u"24289", u"complete", u"getpstack_cont", u"jabbah", u"process", u"pstack", u"sending", u"sh", u"sigcont"])
+MESSAGES_RECORD.box_name = "jabbah_ngmg_messages_parser"
+MESSAGES_RECORD.log_type = "ngmg_messages_parser"
+
+HPILIST_RECORD = LogRecord.from_datetime(datetime.datetime(2012, 4, 17, 10, 32, 37, 37000),
+                                         u"\n".join([u"10:32:37.037 Source : 12",
+                                                     u"  EventType : SENSOR",
+                                                     u"  {SYSTEM_CHASSIS,1}{PROCESSOR,2}",
+                                                     u"  SensorNum : 7",
+                                                     u"  SensorType : TEMPERATURE"]),
+                                         "a3cVXv0C3c7SgkWfWk5Iyg==",
+                                         [u"037", u"10", u"12", u"2", u"32", u"37", u"7", u"chassis", u"event", u"processor"],
+                                         has_millisecond = True,
+                                         extras = {"source": u"12",
+                                                   "event_type": u"SENSOR",
+                                                   "component_path": u"{SYSTEM_CHASSIS,1}{PROCESSOR,2}",
+                                                   "sensor_num": u"7",
+                                                   "sensor_type": u"TEMPERATURE"})
+HPILIST_RECORD.box_name = "shm1_ngmg_shm_hpilist_parser"
+HPILIST_RECORD.log_type = "ngmg_shm_hpilist_parser"
+
+def get_args():
+    parser = argparse.ArgumentParser("Benchmark encoding and decoding log data in each wire format.")
+    parser.add_argument("--repeat",
+                        dest="repeat",
+                        metavar="INTEGER",
+                        type=int,
+                        default=100000,
+                        help="Number of records to encode and decode.")
+    return parser.parse_args()
+
+def get_available_wire_formats():
+    if wire_format.msgpack is None:
+        logger.info("msgpack isn't installed, so only benchmarking JSON.")
+        return [wire_format.JSON]
+    return wire_format.WIRE_FORMATS
+
+def run_encode(record, name, repeat):
+    encode = wire_format.encode
+    start = time.time()
+    for i in xrange(repeat):
+        encode(record, name)
+    return time.time() - start
+
+def run_decode(frame, repeat):
+    decode = wire_format.decode
+    start = time.time()
+    for i in xrange(repeat):
+        decode(frame)
+    return time.time() - start
+
+def main():
+    args = get_args()
+    corpora = [("messages", MESSAGES_RECORD),
+               ("hpilist", HPILIST_RECORD)]
+    for (corpus_name, record) in corpora:
+        expected = record.to_document()
+        for name in get_available_wire_formats():
+            frame = wire_format.encode(record, name)
+            actual = wire_format.decode(frame)
+            assert(expected == actual), "%s, %s: decodes to %s, not %s" % (corpus_name, name, actual, expected)
+            encode_duration = run_encode(record, name, args.repeat)
+            decode_duration = run_decode(frame, args.repeat)
+            logger.info("%s, %s: %s bytes/record, encode %.0f records/s, decode %.0f records/s" % \
+                        (corpus_name, name, len(frame),
+                         args.repeat / encode_duration,
+                         args.repeat / decode_duration))
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,10 @@ import json
 import yaml
 import re
 
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import wire_format
+
 import pdb
 from pprint import pprint
 
@@ -104,13 +108,16 @@ def main():
         log_type_regex = re.compile(event_details["log_type"])
         message_title = event_details["message_title"]
         def callback(self, msg, contents_regex, message_title):
-            decoded = json.loads(msg[0])
-            contents = decoded["contents"]
-            if contents_regex.search(contents):
-                print "%s - %s" % (self, msg[0])
-                snp.notify(app_sig="rill",
-                           title="%s - %s" % (self.hostname, message_title),
-                           text=contents)
+            # Parsers publish a batch of log data as one multipart
+            # message, one encoded log datum per part.
+            for part in msg:
+                decoded = wire_format.decode(part)
+                contents = decoded["contents"]
+                if contents_regex.search(contents):
+                    print "%s - %s" % (self, decoded)
+                    snp.notify(app_sig="rill",
+                               title="%s - %s" % (self.hostname, message_title),
+                               text=contents)
         for service in services:
             if service.hostname is not None and \
                hostname_regex.match(service.hostname) and \
@@ -19,6 +19,10 @@ import operator
 import subprocess
 import multiprocessing
 
+cross_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "bin", "cross"))
+sys.path.append(cross_root)
+import wire_format
+
 # ---------------------------------------------------------------------------
 #   Constants.
 # ---------------------------------------------------------------------------
@@ -146,8 +150,8 @@ def main():
     while 1:
         incoming = socket.recv()
         try:
-            incoming_decoded = json.loads(incoming)
-        except:
+            incoming_decoded = wire_format.decode(incoming)
+        except ValueError:
             continue
         if not log_re.search(str(incoming_decoded["contents"])):
             continue